@@ -1,9 +1,39 @@
 from .analyzer import Analyzer
-from .analyzer import HtcHeader
+from .analyzer import HexLine
+from .analyzer import AnalyzerStats
+from .message import HtcHeader
+from .message import Message
+from .message import hexdump_lines
 from .wmi_ctrl_analyzer import WmiCtrlAnalyzer
 from .htc_ctrl_analyzer import HtcCtrlAnalyzer
 from .htt_analyzer import HttAnalyzer
 from .all_analyzer import AllAnalyzer
+from .scanner import HexDumpScanner
+from .logfile import open_log
+from .logfile import get_compression
+from .follow import LogFollower
+from .output import OutputSink
+from .output import write_message
+from .columns import ColumnWriter
+from .columns import load_columns
+from .store import MessageStore
+from .cache import DecodeCache
+from .frameindex import FrameIndex
+from .frameindex import FrameIndexEntry
+from .frameindex import build_frame_index
+from .frameindex import open_frame_index
+from .timerange import find_ts_offset
+from .timerange import find_time_range
+from .timerange import select_time_range
+from .checkpoint import AnalyzerCheckpoint
+from .checkpoint import get_last_line_end
+from .idfilter import MsgIdFilter
+from .idfilter import compile_msg_id_filter
+from .idfilter import msg_id_spec
+from .idfilter import compile_wmi_group_filter
+from .idfilter import wmi_group_spec
+from .where import compile_where
+from .where import where_spec
 from .wmi_unified import WmiUnified
 from .wmi_unified import WmiUnifiedCmd
 from .wmi_unified import WmiUnifiedEvt
@@ -22,3 +52,12 @@ from .htc_ctrl import HtcCtrl
 from .htt import Htt
 from .htt import HttH2tMsgType
 from .htt import HttT2hMsgType
+from .stream import iter_messages
+from .stream import create_analyzer
+from .stream import create_hexfilter
+from .stream import create_scanner
+from .stream import iter_hexfilter_lines
+from .stream import iter_log_hexlines
+from .stream import iter_analyzer_messages
+from .stream import merge_messages
+from .parallel import ParallelAnalysis
@@ -1,12 +1,22 @@
 from collections import namedtuple
 
 import argparse
+import itertools
 import pdb
 import traceback
 import sys
 import os
-from qca_hex_analyzer import WmiCtrlAnalyzer, HtcCtrlAnalyzer, HttAnalyzer, AllAnalyzer
-import hexfilter
+from qca_hex_analyzer import create_analyzer, create_scanner, \
+                             iter_log_hexlines, iter_analyzer_messages, \
+                             merge_messages, get_compression, \
+                             ParallelAnalysis, LogFollower, OutputSink, \
+                             AnalyzerStats, create_hexfilter, \
+                             iter_hexfilter_lines, write_message, \
+                             ColumnWriter, MessageStore, DecodeCache, \
+                             open_frame_index, find_time_range, \
+                             select_time_range, AnalyzerCheckpoint, \
+                             get_last_line_end, compile_msg_id_filter, \
+                             msg_id_spec, wmi_group_spec, where_spec
 
 description = \
     "Tool used to analyze hexdumps produced by a qca wireless kernel " \
@@ -81,20 +91,60 @@ all_description = \
     "The message payload will also be printed together with " \
     "message ID's if the --print-data option is used."
 
+index_help = \
+    "Subcommand for storing all messages in an SQLite database. " \
+    "The stored messages can be queried with the query subcommand. "
+
+index_description = \
+    "Decodes all supported message types (in the same way as the all " \
+    "subcommand) from an input (--input-file) and stores them in an " \
+    "SQLite database (--db). " \
+    "The messages are added to the database if it already exists, so " \
+    "e.g. the RX and TX dumps of a log can be stored in the same database " \
+    "by running index twice (with different --desc-str and " \
+    "--data-direction options). " \
+    "The timestamps are always stored (unless --no-timestamps is used). " \
+    "The database is queried with the query subcommand."
+
+query_help = \
+    "Subcommand for querying messages stored by the index subcommand. "
+
+query_description = \
+    "Reads messages from an SQLite database created by the index " \
+    "subcommand (--db) instead of decoding a log. " \
+    "The messages can be filtered by protocol, endpoint, direction " \
+    "(--data-direction) and message id and are written to the output " \
+    "in the same way as by the other subcommands, ordered by timestamp. " \
+    "The input options (--input-file, --desc-str etc.) have no effect."
+
 
 def auto_int(x):
 
     return int(x, 0)
 
 
+def get_wmi_groups(group_args):
+
+    # Each --group | --skip-group argument is a list of group names
+    if group_args is None:
+        return None
+    return [group for groups in group_args for group in groups]
+
+
 def load_options():
 
     global parsed_args
     base_parser = argparse.ArgumentParser(add_help=False)
 
-    base_parser.add_argument('-i', '--input-file',
-                             help="Input (log) file. If omitted, "
-                                  "stdin will be read.")
+    base_parser.add_argument('-i', '--input-file', nargs='+',
+                             help="Input (log) file(s). If omitted, "
+                                  "stdin will be read. gzip, bz2 and xz "
+                                  "compressed files are decompressed "
+                                  "while they are read. "
+                                  "If several files are given, each file "
+                                  "is analyzed separately and the messages "
+                                  "of all files are merged by timestamp "
+                                  "(the files must contain timestamps).")
     base_parser.add_argument('-o', '--output-file',
                              help="Output file. If omitted, "
                                   "the output will be written to stdout.")
@@ -138,6 +188,206 @@ def load_options():
                                   "hexdump in the output. "
                                   "This option will only have effect if the "
                                   "log file contains timestamps.")
+    base_parser.add_argument('--native-scanner', action="store_true",
+                             help="Use the built-in hexdump scanner instead "
+                                  "of hexfilter. The input file is memory "
+                                  "mapped and scanned for hexdump lines in "
+                                  "bulk, which is considerably faster for "
+                                  "large logs. stdin is read in large "
+                                  "chunks.")
+    base_parser.add_argument('-j', '--jobs', metavar='N', nargs=1,
+                             type=int, default=[1],
+                             help="Number of worker processes. With N > 1, "
+                                  "the input file is split into chunks that "
+                                  "are analyzed in parallel (the output is "
+                                  "the same as for a single process). "
+                                  "The built-in hexdump scanner is always "
+                                  "used in this mode. stdin and compressed "
+                                  "input files are always analyzed in a "
+                                  "single process, as are analyses that "
+                                  "depend on the order of the input (e.g. "
+                                  "--follow, --where or --checkpoint). "
+                                  "A warning is printed to stderr if N is "
+                                  "ignored.")
+    base_parser.add_argument('-f', '--follow', action="store_true",
+                             help="Follow mode. The input is analyzed while "
+                                  "it is written: the input file is polled "
+                                  "for more data at EOF (and reopened if it "
+                                  "is rotated) and stdin is read until it is "
+                                  "closed. Each message is flushed to the "
+                                  "output as soon as it has been decoded "
+                                  "(see --flush-batch and --flush-interval). "
+                                  "Stop with Ctrl-C.")
+    base_parser.add_argument('--flush-batch', metavar='N', nargs=1,
+                             type=int,
+                             help="Flush the output when N messages have "
+                                  "been written. In follow mode, the default "
+                                  "value is 1 (flush each message) unless "
+                                  "--flush-interval is given. Otherwise the output is written in large "
+                                  "chunks (see --output-buffer-size).")
+    base_parser.add_argument('--flush-interval', metavar='SEC', nargs=1,
+                             type=float,
+                             help="Flush the output when the oldest "
+                                  "unflushed message is SEC seconds old. "
+                                  "In follow mode, the output is otherwise "
+                                  "flushed as soon as all available input "
+                                  "has been analyzed.")
+    base_parser.add_argument('--output-buffer-size', metavar='SIZE', nargs=1,
+                             type=int, default=[65536],
+                             help="Size (in characters) of the output "
+                                  "buffer. The output is gathered in the "
+                                  "buffer and written in bulk. "
+                                  "If this option is omitted a default value "
+                                  "of 65536 will be used.")
+    base_parser.add_argument('--format', choices=['text', 'jsonl'],
+                             default='text',
+                             help="Output format. text (default) is the "
+                                  "human readable output. jsonl writes one "
+                                  "JSON object per message (timestamp, "
+                                  "direction, HTC header fields, protocol, "
+                                  "message id and enum name, payload, "
+                                  "trailer and, with --tlv, the decoded TLV "
+                                  "fields). The payload and trailer are "
+                                  "always included in the JSON objects.")
+    base_parser.add_argument('--payload-encoding', choices=['hex', 'base64'],
+                             default='hex',
+                             help="Encoding of the payload and trailer in "
+                                  "the jsonl output format. "
+                                  "If this option is omitted, hex will be "
+                                  "used.")
+    base_parser.add_argument('--export-columns', metavar='PATH', nargs=1,
+                             help="Export the decoded messages in columnar "
+                                  "form (one fixed width array per message "
+                                  "field and a single blob with all "
+                                  "payloads) instead of writing them to "
+                                  "the output. If PATH ends with .npz, a "
+                                  "NumPy .npz file is written (requires "
+                                  "numpy), otherwise PATH is a directory "
+                                  "with one raw file per column and a JSON "
+                                  "schema (schema.json). The timestamps "
+                                  "are exported even without -t. The "
+                                  "messages are always analyzed in a "
+                                  "single process.")
+    base_parser.add_argument('--frame', metavar='N', nargs=1, type=int,
+                             help="Start the analysis at frame N (counted "
+                                  "from 0) of the input file, i.e. the N-th "
+                                  "frame start (address 0 line) of a "
+                                  "message decoded with the given "
+                                  "subcommand, description strings, "
+                                  "endpoints and message id filters. Frame "
+                                  "N is the frame of message N, unless "
+                                  "frames are truncated. The frame starts "
+                                  "are looked up in a frame "
+                                  "index (a sidecar file named "
+                                  "<input>.frames) that is created if it "
+                                  "doesn't exist or if the input or the "
+                                  "options have changed. Use together "
+                                  "with --max-messages to decode only a "
+                                  "few messages late in a large log. "
+                                  "Compressed files are not supported.")
+    base_parser.add_argument('--start-offset', metavar='OFFSET', nargs=1,
+                             type=auto_int,
+                             help="Start the analysis at the first line "
+                                  "starting at or after byte OFFSET of the "
+                                  "input file. Compressed files are not "
+                                  "supported.")
+    base_parser.add_argument('--since', metavar='TS', nargs=1, type=float,
+                             help="Only include messages with a timestamp "
+                                  "at or after TS (seconds, as in the log "
+                                  "timestamps). For an uncompressed input "
+                                  "file, the start of the time range is "
+                                  "found by a binary search, so the lines "
+                                  "before it are never read (the log "
+                                  "timestamps are assumed to be "
+                                  "increasing). The input must contain "
+                                  "timestamps.")
+    base_parser.add_argument('--until', metavar='TS', nargs=1, type=float,
+                             help="Only include messages with a timestamp "
+                                  "at or before TS. The reading of the "
+                                  "input stops at the end of the time "
+                                  "range. The input must contain "
+                                  "timestamps.")
+    base_parser.add_argument('--where', metavar='EXPR', nargs=1,
+                             type=where_spec,
+                             help="Only include messages matching the filter "
+                                  "expression EXPR, e.g. "
+                                  "\"WMI_VDEV_SET_PARAM_CMDID and vdev_id == 1 "
+                                  "and param_id == BEACON_INTERVAL\" or "
+                                  "\"MGMT_TX_COMPL_IND and length > 64\". "
+                                  "Comparisons (==, !=, <, <=, >, >=) of "
+                                  "message fields (ts, direction, eid, flags, "
+                                  "length, ctrl0, ctrl1, data_len, proto, "
+                                  "msg_id, if_idx, enum, group) and WMI TLV "
+                                  "fields (e.g. vdev_id or wmi_chan.mhz) with "
+                                  "numbers, 'strings' and enum names can be "
+                                  "combined with and, or, not and "
+                                  "parentheses. An enum name alone matches "
+                                  "the messages with that enum. Enum names "
+                                  "can be given without their prefix if "
+                                  "that doesn't make them ambiguous. The TLV "
+                                  "fields are only decoded for messages "
+                                  "matching the rest of the expression.")
+    base_parser.add_argument('--max-messages', metavar='N', nargs=1,
+                             type=int,
+                             help="Stop when N messages have been written.")
+    base_parser.add_argument('--checkpoint', metavar='FILE', nargs=1,
+                             help="Incremental analysis of a growing log. "
+                                  "The analysis resumes from the checkpoint "
+                                  "saved in FILE by the previous run (if it "
+                                  "matches the input file and options) and "
+                                  "only the messages decoded from the new "
+                                  "part of the input are written. When all "
+                                  "complete lines of the input have been "
+                                  "analyzed, the input offset and the "
+                                  "reassembly state (messages in flight) are "
+                                  "saved in FILE. If the input has been "
+                                  "replaced or truncated, the analysis "
+                                  "starts from the beginning. Requires a "
+                                  "single uncompressed input file. The "
+                                  "statistics (--stats) cover all runs "
+                                  "since the analysis started from the "
+                                  "beginning.")
+    base_parser.add_argument('--cache', metavar='DIR', nargs='?',
+                             const=os.path.join(os.path.expanduser('~'),
+                                                '.cache', 'qca_hex_analyzer'),
+                             help="Cache the decoded messages of the input "
+                                  "file in DIR (~/.cache/qca_hex_analyzer "
+                                  "if DIR is omitted). When the same file "
+                                  "(same size, mtime and content) is "
+                                  "analyzed again with the same decoding "
+                                  "options and the same version of the "
+                                  "tool, the cached messages are used "
+                                  "instead of parsing the log. Only used "
+                                  "for a single input file (not stdin or "
+                                  "follow mode). The analysis is always "
+                                  "done in a single process when the cache "
+                                  "is used.")
+    base_parser.add_argument('--cache-size', metavar='MB', nargs=1,
+                             type=int, default=[1024],
+                             help="Maximum size (in MiB) of the cache. The "
+                                  "least recently used entries are removed "
+                                  "when the cache exceeds this size. "
+                                  "If this option is omitted a default value "
+                                  "of 1024 will be used.")
+    base_parser.add_argument('--max-stale-lines', metavar='N', nargs=1,
+                             type=int, default=[128],
+                             help="Maximum number of consecutive lines not "
+                                  "belonging to a partially received message. "
+                                  "When exceeded, the partial message is "
+                                  "dropped. Messages from different endpoints "
+                                  "can be interleaved in the log, so a message "
+                                  "is not dropped as soon as a line from "
+                                  "another message is found. "
+                                  "If this option is omitted a default value "
+                                  "of 128 will be used.")
+    base_parser.add_argument('--stats', action="store_true",
+                             help="Print reassembly statistics to stderr "
+                                  "when all input has been processed. "
+                                  "The statistics contain the number of "
+                                  "dropped lines (lines lost or out of "
+                                  "sequence), truncated frames (messages "
+                                  "that never got all of their data) and "
+                                  "bad headers.")
 
     parser = argparse.ArgumentParser(prog="qca_hex_analyzer",
                                      description=description,
@@ -175,17 +425,35 @@ def load_options():
                                       "If the encountered message is not supported by "
                                       "the parser, the hex data will be printed instead.")
     parser_wmi_ctrl.add_argument('--id', '--msg-id', metavar='ID',
-                                 nargs='+', type=auto_int,
+                                 nargs='+', type=msg_id_spec,
                                  help="WMI message id filter. "
                                       "Only WMI messages with an id matching any of the "
                                       "provided id's will be included in the output. "
                                       "If no --id | --msg-id option is given, no "
-                                      "filtering will be performed. ")
+                                      "filtering will be performed. "
+                                      "An ID is a message id, an inclusive range of "
+                                      "id's (e.g. 0x5000-0x5fff) or a message name "
+                                      "(e.g. WMI_INIT_CMDID). ")
     parser_wmi_ctrl.add_argument('--skip-id', '--skip-msg-id', metavar='ID',
-                                 nargs='+', type=auto_int,
+                                 nargs='+', type=msg_id_spec,
                                  help="WMI message id exclude filter. "
                                       "Similar to --id | --msg-id, but all matching "
                                       "id's will be excluded from the output. ")
+    parser_wmi_ctrl.add_argument('--group', metavar='GROUP',
+                                 nargs='+', type=wmi_group_spec,
+                                 help="WMI group filter. "
+                                      "Only WMI commands and events in any of the "
+                                      "provided groups will be included in the "
+                                      "output. A GROUP is a comma separated list of "
+                                      "WMI group names (with or without the WMI_GRP_ "
+                                      "prefix, e.g. VDEV,PEER,STA_PS) or group id's. "
+                                      "Not supported with --wmi-old.")
+    parser_wmi_ctrl.add_argument('--skip-group', metavar='GROUP',
+                                 nargs='+', type=wmi_group_spec,
+                                 help="WMI group exclude filter. "
+                                      "Similar to --group, but the WMI messages of "
+                                      "all matching groups will be excluded from the "
+                                      "output. ")
     parser_htc_ctrl = subparsers.add_parser('htc-ctrl',
                                             help=htc_ctrl_help,
                                             description=htc_ctrl_description,
@@ -193,6 +461,20 @@ def load_options():
     parser_htc_ctrl.add_argument('-p', '--print-data', action="store_true",
                                  help="Print HTC ctrl data message payload (and not just "
                                       "message ID) for all encountered messages. ")
+    parser_htc_ctrl.add_argument('--id', '--msg-id', metavar='ID',
+                                 nargs='+', type=msg_id_spec,
+                                 help="HTC ctrl message id filter. "
+                                      "Only HTC ctrl messages with an id matching any "
+                                      "of the provided id's will be included in the "
+                                      "output. "
+                                      "An ID is a message id, an inclusive range of "
+                                      "id's or a message name (e.g. "
+                                      "HTC_MSG_READY_ID). ")
+    parser_htc_ctrl.add_argument('--skip-id', '--skip-msg-id', metavar='ID',
+                                 nargs='+', type=msg_id_spec,
+                                 help="HTC ctrl message id exclude filter. "
+                                      "Similar to --id | --msg-id, but all matching "
+                                      "id's will be excluded from the output. ")
     parser_htt = subparsers.add_parser('htt',
                                        help=htt_help,
                                        description=htt_description,
@@ -211,6 +493,19 @@ def load_options():
                                  "target in the HTC service connect response). "
                                  "If this option is omitted a default value of 1 "
                                  "will be used.")
+    parser_htt.add_argument('--id', '--msg-id', metavar='ID',
+                            nargs='+', type=msg_id_spec,
+                            help="HTT message id filter. "
+                                 "Only HTT messages with an id matching any of the "
+                                 "provided id's will be included in the output. "
+                                 "An ID is a message id, an inclusive range of "
+                                 "id's or a message name (e.g. "
+                                 "HTT_T2H_MSG_TYPE_STATS_CONF). ")
+    parser_htt.add_argument('--skip-id', '--skip-msg-id', metavar='ID',
+                            nargs='+', type=msg_id_spec,
+                            help="HTT message id exclude filter. "
+                                 "Similar to --id | --msg-id, but all matching "
+                                 "id's will be excluded from the output. ")
     parser_all = subparsers.add_parser('all',
                                        help=all_help,
                                        description=all_description,
@@ -245,6 +540,77 @@ def load_options():
                                  "target in the HTC service connect response). "
                                  "If this option is omitted a default value of 2 "
                                  "will be used.")
+    parser_all.add_argument('--group', metavar='GROUP',
+                            nargs='+', type=wmi_group_spec,
+                            help="WMI group filter. "
+                                 "Only WMI commands and events in any of the "
+                                 "provided groups will be included in the "
+                                 "output (the other message types are not "
+                                 "affected). A GROUP is a comma separated list "
+                                 "of WMI group names (with or without the "
+                                 "WMI_GRP_ prefix, e.g. VDEV,PEER,STA_PS) or "
+                                 "group id's. Not supported with --wmi-old.")
+    parser_all.add_argument('--skip-group', metavar='GROUP',
+                            nargs='+', type=wmi_group_spec,
+                            help="WMI group exclude filter. "
+                                 "Similar to --group, but the WMI messages of "
+                                 "all matching groups will be excluded from the "
+                                 "output. ")
+    parser_index = subparsers.add_parser('index',
+                                         help=index_help,
+                                         description=index_description,
+                                         parents=[base_parser])
+    parser_index.add_argument('--db', metavar='PATH', nargs=1, required=True,
+                              help="SQLite database file.")
+    parser_index.add_argument('--wmi-old', action="store_true",
+                              help="Specifies whether or not the WMI messages "
+                                   "are according to the \"old\" WMI protocol. "
+                                   "If not set, the messages will be interpreted "
+                                   "according to the unified WMI format")
+    parser_index.add_argument('--htt-ep-id', metavar='ID', nargs=1,
+                              type=int, default=[1],
+                              help="HTT service endpoint ID. "
+                                   "If this option is omitted a default value of 1 "
+                                   "will be used.")
+    parser_index.add_argument('--wmi-ctrl-ep-id', metavar='ID', nargs=1,
+                              type=int, default=[2],
+                              help="WMI control service endpoint ID. "
+                                   "If this option is omitted a default value of 2 "
+                                   "will be used.")
+    parser_index.set_defaults(print_data=False)
+    parser_query = subparsers.add_parser('query',
+                                         help=query_help,
+                                         description=query_description,
+                                         parents=[base_parser])
+    parser_query.add_argument('--db', metavar='PATH', nargs=1, required=True,
+                              help="SQLite database file created by the "
+                                   "index subcommand.")
+    parser_query.add_argument('-p', '--print-data', action="store_true",
+                              help="Print message payload (and not just "
+                                   "message ID) for all matching messages. ")
+    parser_query.add_argument('--proto', choices=['wmi-ctrl', 'htc-ctrl', 'htt'],
+                              help="Protocol filter. Only messages of the "
+                                   "given protocol will be included in the "
+                                   "output.")
+    parser_query.add_argument('-e', '--ep-id', metavar='ID', nargs=1,
+                              type=int,
+                              help="Endpoint filter. Only messages from the "
+                                   "given HTC endpoint will be included in "
+                                   "the output.")
+    parser_query.add_argument('--id', '--msg-id', metavar='ID',
+                              nargs='+', type=msg_id_spec,
+                              help="Message id filter. "
+                                   "Only messages with an id matching any of the "
+                                   "provided id's will be included in the output. "
+                                   "An ID is a message id, an inclusive range of "
+                                   "id's or a message name (the names of all "
+                                   "protocols are looked up unless --proto is "
+                                   "given). ")
+    parser_query.add_argument('--skip-id', '--skip-msg-id', metavar='ID',
+                              nargs='+', type=msg_id_spec,
+                              help="Message id exclude filter. "
+                                   "Similar to --id | --msg-id, but all matching "
+                                   "id's will be excluded from the output. ")
     parsed_args = parser.parse_args()
 
 
@@ -253,10 +619,6 @@ def main():
     load_options()
 
     try:
-        if parsed_args.input_file:
-            infp = open(parsed_args.input_file, "r")
-        else:
-            infp = sys.stdin
         if parsed_args.output_file:
             outfp = open(parsed_args.output_file, "w")
         else:
@@ -274,52 +636,375 @@ def main():
             # Interpret the data as host -> target is the default behaviour
             t2h = False
 
-        hf = hexfilter.HexFilterLinux(skip_timestamps=(not parsed_args.keep_timestamps),
-                                      abs_timestamps=True,
-                                      dump_desc=parsed_args.desc_str,
-                                      dump_desc_invert=parsed_args.desc_str_invert,
-                                      log_has_timestamps=(not parsed_args.no_timestamps),
-                                      include_dump_desc_in_output=False,
-                                      remove_ascii_part=True)
+        mode = parsed_args.subparser_name
+        since = None
+        until = None
+        if parsed_args.since:
+            since = parsed_args.since[0]
+        if parsed_args.until:
+            until = parsed_args.until[0]
+        time_range = since is not None or until is not None
+        if time_range and parsed_args.no_timestamps:
+            raise IOError('--since and --until require timestamps')
+        # The timestamps are always decoded when a time range is selected
+        # and when they are exported (the ts column)
+        export_ts = parsed_args.export_columns is not None and \
+            not parsed_args.no_timestamps
+        decode_timestamps = parsed_args.keep_timestamps or time_range or \
+            export_ts
 
+        analyzer_options = {'short_htc_hdr': parsed_args.short_htc_header,
+                            'timestamps': decode_timestamps,
+                            't2h': t2h,
+                            'max_stale_lines': parsed_args.max_stale_lines[0]}
         if parsed_args.subparser_name == 'wmi-ctrl':
-            analyzer = WmiCtrlAnalyzer(eid=parsed_args.ep_id[0],
-                                       wmi_unified=(not parsed_args.wmi_old),
-                                       short_htc_hdr=parsed_args.short_htc_header,
-                                       timestamps=parsed_args.keep_timestamps,
-                                       t2h=t2h,
-                                       tlv_analysis=parsed_args.tlv,
-                                       msg_id_filter=parsed_args.id,
-                                       msg_id_exclude_filter=parsed_args.skip_id)
+            analyzer_options.update(wmi_ctrl_eid=parsed_args.ep_id[0],
+                                    wmi_unified=(not parsed_args.wmi_old),
+                                    tlv_analysis=parsed_args.tlv,
+                                    msg_id_filter=parsed_args.id,
+                                    msg_id_exclude_filter=parsed_args.skip_id,
+                                    wmi_group_filter=get_wmi_groups(parsed_args.group),
+                                    wmi_group_exclude_filter=get_wmi_groups(parsed_args.skip_group))
             if parsed_args.tlv:
                 parsed_args.print_data = True
         elif parsed_args.subparser_name == 'htc-ctrl':
-            analyzer = HtcCtrlAnalyzer(short_htc_hdr=parsed_args.short_htc_header,
-                                       timestamps=parsed_args.keep_timestamps,
-                                       t2h=t2h)
+            analyzer_options.update(msg_id_filter=parsed_args.id,
+                                    msg_id_exclude_filter=parsed_args.skip_id)
         elif parsed_args.subparser_name == 'htt':
-            analyzer = HttAnalyzer(eid=parsed_args.ep_id[0],
-                                   short_htc_hdr=parsed_args.short_htc_header,
-                                   timestamps=parsed_args.keep_timestamps,
-                                   t2h=t2h)
+            analyzer_options.update(htt_eid=parsed_args.ep_id[0],
+                                    msg_id_filter=parsed_args.id,
+                                    msg_id_exclude_filter=parsed_args.skip_id)
         elif parsed_args.subparser_name == 'all':
-            analyzer = AllAnalyzer(wmi_ctrl_eid=parsed_args.wmi_ctrl_ep_id[0],
-                                   htt_eid=parsed_args.htt_ep_id[0],
-                                   wmi_unified=(not parsed_args.wmi_old),
-                                   short_htc_hdr=parsed_args.short_htc_header,
-                                   timestamps=parsed_args.keep_timestamps,
-                                   t2h=t2h)
+            analyzer_options.update(wmi_ctrl_eid=parsed_args.wmi_ctrl_ep_id[0],
+                                    htt_eid=parsed_args.htt_ep_id[0],
+                                    wmi_unified=(not parsed_args.wmi_old),
+                                    wmi_group_filter=get_wmi_groups(parsed_args.group),
+                                    wmi_group_exclude_filter=get_wmi_groups(parsed_args.skip_group))
+        elif parsed_args.subparser_name == 'index':
+            # All message types are stored, always with their timestamps
+            parsed_args.keep_timestamps = not parsed_args.no_timestamps
+            decode_timestamps = parsed_args.keep_timestamps
+            analyzer_options.update(wmi_ctrl_eid=parsed_args.wmi_ctrl_ep_id[0],
+                                    htt_eid=parsed_args.htt_ep_id[0],
+                                    wmi_unified=(not parsed_args.wmi_old),
+                                    timestamps=decode_timestamps)
+            mode = 'all'
+        elif parsed_args.subparser_name == 'query':
+            if not os.path.isfile(parsed_args.db[0]):
+                raise IOError('No such database: {}'.format(parsed_args.db[0]))
+            mode = None
         else:
             sys.stderr.write('Unsupported subcommand: {}\n'.format(parsed_args.subparser_name))
+            exit(1)
+        if mode:
+            try:
+                analyzer = create_analyzer(mode, **analyzer_options)
+            except ValueError as err:
+                # Unknown message name in an id filter
+                raise IOError('{}'.format(err))
+
+        scanner_options = {'desc_str': parsed_args.desc_str,
+                           'desc_str_invert': parsed_args.desc_str_invert,
+                           'timestamps': decode_timestamps,
+                           'log_has_timestamps': (not parsed_args.no_timestamps)}
+
+        output_options = {'timestamps': parsed_args.keep_timestamps,
+                          'print_data': parsed_args.print_data,
+                          'output_format': parsed_args.format,
+                          'payload_encoding': parsed_args.payload_encoding}
+
+        if parsed_args.flush_batch:
+            flush_batch = parsed_args.flush_batch[0]
+        elif parsed_args.follow and not parsed_args.flush_interval:
+            flush_batch = 1
+        else:
+            flush_batch = None
+        if parsed_args.flush_interval:
+            flush_interval = parsed_args.flush_interval[0]
+        else:
+            flush_interval = None
+        sink = OutputSink(outfp,
+                          buffer_size=parsed_args.output_buffer_size[0],
+                          batch_size=flush_batch,
+                          interval=flush_interval)
+
+        columns = None
+        store = None
+        if parsed_args.subparser_name == 'index':
+            store = MessageStore(parsed_args.db[0])
+            handle_message = store.add
+        elif parsed_args.export_columns:
+            columns = ColumnWriter(parsed_args.export_columns[0])
+
+            def handle_message(msg):
+
+                columns.add(msg)
+        else:
+            def handle_message(msg):
+
+                write_message(sink, msg, **output_options)
+                sink.message_done()
+
+        input_files = parsed_args.input_file or []
+        if len(input_files) > 1:
+            if parsed_args.follow:
+                sys.stderr.write('Follow mode supports only one input file\n')
+                exit(1)
+            if parsed_args.no_timestamps:
+                sys.stderr.write('Multiple input files can only be merged '
+                                 'if they contain timestamps\n')
+                exit(1)
+            input_file = None
+        elif input_files:
+            input_file = input_files[0]
+        else:
+            input_file = None
+
+        start_offset = 0
+        if parsed_args.frame or parsed_args.start_offset:
+            if not input_file or parsed_args.follow:
+                raise IOError('--frame and --start-offset require a single '
+                              'input file (not follow mode)')
+            if parsed_args.frame:
+                if mode is None:
+                    raise IOError('--frame requires an analyzer subcommand')
+                frame_index = open_frame_index(input_file, mode=mode,
+                                               analyzer_options=analyzer_options,
+                                               scanner_options=scanner_options,
+                                               native_scanner=parsed_args.native_scanner)
+                try:
+                    start_offset = frame_index.get_entry(parsed_args.frame[0]).offset
+                except IndexError as err:
+                    raise IOError('{}'.format(err))
+                finally:
+                    frame_index.close()
+            else:
+                start_offset = parsed_args.start_offset[0]
+
+        end_offset = None
+        if time_range and input_file and not parsed_args.follow and \
+           not get_compression(input_file):
+            (range_start, end_offset) = \
+                find_time_range(input_file, since=since, until=until,
+                                desc_str=parsed_args.desc_str,
+                                desc_str_invert=parsed_args.desc_str_invert)
+            start_offset = max(start_offset, range_start)
+
+        checkpoint = None
+        if parsed_args.checkpoint:
+            if not input_file or parsed_args.follow or \
+               get_compression(input_file) or mode is None:
+                raise IOError('--checkpoint requires a single uncompressed '
+                              'input file (not follow mode)')
+            if start_offset or time_range or parsed_args.max_messages:
+                raise IOError('--checkpoint can\'t be combined with --frame, '
+                              '--start-offset, --since, --until or '
+                              '--max-messages')
+            checkpoint = AnalyzerCheckpoint(parsed_args.checkpoint[0],
+                                            {'mode': mode,
+                                             'analyzer': analyzer_options,
+                                             'scanner': scanner_options})
+            resumed = checkpoint.load(input_file)
+            if resumed:
+                (start_offset, analyzer) = resumed
+            # Lines written after this point are analyzed by the next run
+            end_offset = get_last_line_end(input_file, start_offset)
+
+        def limit(items):
+
+            if parsed_args.max_messages:
+                return itertools.islice(items, parsed_args.max_messages[0])
+            return items
+
+        def select_messages(messages):
+
+            if time_range:
+                messages = select_time_range(messages, since=since,
+                                             until=until)
+            if parsed_args.where:
+                where = parsed_args.where[0]
+                messages = (msg for msg in messages if where(msg))
+            return limit(messages)
+
+        cache = None
+        cached = None
+        cache_writer = None
+        # Only complete analyses are cached
+        if parsed_args.cache and input_file and mode and \
+           not parsed_args.follow and not start_offset and \
+           not parsed_args.max_messages and not time_range and \
+           not checkpoint:
+            cache = DecodeCache(parsed_args.cache,
+                                max_size=parsed_args.cache_size[0] << 20)
+            cache_key = cache.get_key(input_file, mode, analyzer_options,
+                                      scanner_options,
+                                      native_scanner=parsed_args.native_scanner)
+            cached = cache.read(cache_key,
+                                tlv_analysis=analyzer_options.get('tlv_analysis',
+                                                                  False))
+
+        # Reason why the input is analyzed in a single process although
+        # -j was given (None if it can be analyzed in parallel)
+        serial_reason = None
+        if parsed_args.jobs[0] > 1:
+            if parsed_args.subparser_name == 'query':
+                serial_reason = 'queries are answered from the database'
+            elif len(input_files) > 1:
+                serial_reason = 'multiple input files are merged'
+            elif not input_file:
+                serial_reason = 'stdin is analyzed in a single process'
+            elif parsed_args.follow:
+                serial_reason = 'not supported in follow mode'
+            elif get_compression(input_file):
+                serial_reason = 'compressed input files are analyzed in a ' \
+                                'single process'
+            elif cache:
+                serial_reason = 'not supported with --cache'
+            elif store:
+                serial_reason = 'not supported by the index subcommand'
+            elif columns:
+                serial_reason = 'not supported with --export-columns'
+            elif checkpoint:
+                serial_reason = 'not supported with --checkpoint'
+            elif time_range:
+                serial_reason = 'not supported with --since/--until'
+            elif start_offset:
+                serial_reason = 'not supported with a start offset ' \
+                                '(--frame/--start-offset)'
+            elif parsed_args.where:
+                serial_reason = 'not supported with --where'
+            if serial_reason:
+                sys.stderr.write('Ignoring --jobs: {}\n'.format(serial_reason))
+
+        if parsed_args.subparser_name == 'query':
+            store = MessageStore(parsed_args.db[0])
+            if parsed_args.data_direction:
+                query_t2h = t2h
+            else:
+                query_t2h = None
+            if parsed_args.ep_id:
+                query_eid = parsed_args.ep_id[0]
+            else:
+                query_eid = None
+            try:
+                query_id = compile_msg_id_filter(parsed_args.id,
+                                                 parsed_args.proto, query_t2h)
+                query_skip_id = compile_msg_id_filter(parsed_args.skip_id,
+                                                      parsed_args.proto,
+                                                      query_t2h)
+            except ValueError as err:
+                raise IOError('{}'.format(err))
+            stats = AnalyzerStats()
+            for msg in select_messages(store.query(proto=parsed_args.proto,
+                                                   t2h=query_t2h,
+                                                   eid=query_eid,
+                                                   msg_id_filter=query_id,
+                                                   msg_id_exclude_filter=query_skip_id,
+                                                   since=since,
+                                                   until=until)):
+                handle_message(msg)
+                stats.messages += 1
+        elif len(input_files) > 1:
+            # Each input file has its own analyzer, so frames from different
+            # files are never mixed. The timestamps are always decoded since
+            # they are needed for the merge.
+            analyzers = []
+            sources = []
+            for path in input_files:
+                source_analyzer = create_analyzer(mode,
+                                                  **dict(analyzer_options,
+                                                         timestamps=True))
+                hexlines = iter_log_hexlines(path, source_analyzer,
+                                             native_scanner=parsed_args.native_scanner,
+                                             **dict(scanner_options,
+                                                    timestamps=True))
+                analyzers.append(source_analyzer)
+                sources.append(iter_analyzer_messages(source_analyzer,
+                                                      hexlines))
+
+            for msg in select_messages(merge_messages(sources)):
+                handle_message(msg)
+
+            stats = AnalyzerStats()
+            for source_analyzer in analyzers:
+                stats.add(source_analyzer.get_stats())
+        elif cached:
+            for msg in select_messages(cached.iter_messages()):
+                handle_message(msg)
+            stats = cached.stats
+        elif parsed_args.jobs[0] > 1 and not serial_reason:
+            parallel = ParallelAnalysis(input_file,
+                                        parsed_args.jobs[0],
+                                        mode=mode,
+                                        scanner_options=scanner_options,
+                                        analyzer_options=analyzer_options,
+                                        output_options=output_options)
+            for str in limit(parallel.iter_output()):
+                sink.write(str)
+                sink.message_done()
+            stats = parallel.get_stats()
+        else:
+            if parsed_args.follow:
+                if input_file:
+                    follower = LogFollower(path=input_file,
+                                           on_idle=sink.idle)
+                else:
+                    follower = LogFollower(fd=sys.stdin.fileno(),
+                                           on_idle=sink.idle)
+                if parsed_args.native_scanner:
+                    scanner = create_scanner(**scanner_options)
+                    hexlines = scanner.scan_chunks(follower.iter_chunks())
+                else:
+                    hf = create_hexfilter(**scanner_options)
+                    hexlines = iter_hexfilter_lines(follower.iter_lines(), hf,
+                                                    analyzer)
+            else:
+                hexlines = iter_log_hexlines(input_file, analyzer,
+                                             native_scanner=parsed_args.native_scanner,
+                                             offset=start_offset,
+                                             end=end_offset,
+                                             **scanner_options)
+
+            if cache:
+                cache_writer = cache.write(cache_key)
+
+            def add_to_cache(messages):
+
+                # The messages are cached before they are selected (--where),
+                # so the cache entry always holds the complete analysis
+                for msg in messages:
+                    cache_writer.add(msg)
+                    yield msg
+
+            try:
+                messages = iter_analyzer_messages(analyzer, hexlines)
+                if cache_writer:
+                    messages = add_to_cache(messages)
+                for msg in select_messages(messages):
+                    handle_message(msg)
+                if cache_writer:
+                    cache_writer.close(analyzer.get_stats())
+                    cache_writer = None
+            except KeyboardInterrupt:
+                # Ctrl-C is the normal way to stop follow mode
+                if not parsed_args.follow:
+                    raise
+            finally:
+                # Incomplete analyses are not cached
+                if cache_writer:
+                    cache_writer.abort()
+            stats = analyzer.get_stats()
+            if checkpoint:
+                checkpoint.save(input_file, end_offset, analyzer)
+
+        sink.flush()
+        if columns:
+            columns.close()
+        if store:
+            store.close()
 
-        for line in infp:
-            if hf.parse_line(line):
-                hexdata = hf.get_hex()
-                if analyzer.parse_hexdata(hexdata):
-                    str = analyzer.get_id_str()
-                    outfp.write(str)
-                    if parsed_args.print_data:
-                        analyzer.print_data(outfp)
+        if parsed_args.stats:
+            sys.stderr.write(stats.get_str())
 
     except IOError as err:
         sys.stderr.write('{}\n'.format(err))
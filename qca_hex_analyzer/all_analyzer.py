@@ -1,5 +1,5 @@
-from collections import namedtuple
-from .analyzer import Analyzer, HtcHeader
+from .analyzer import Analyzer, AnalyzerStats, STATE_IDLE, STATE_DUMP, \
+                      STATE_FRAME
 from .wmi_ctrl_analyzer import WmiCtrlAnalyzer
 from .htc_ctrl_analyzer import HtcCtrlAnalyzer
 from .htt_analyzer import HttAnalyzer
@@ -8,27 +8,37 @@ from .htt_analyzer import HttAnalyzer
 class AllAnalyzer(Analyzer):
 
     def __init__(self, wmi_ctrl_eid=1, htt_eid=2, short_htc_hdr=False,
-                 wmi_unified=True, timestamps=False, t2h=False):
+                 wmi_unified=True, timestamps=False, t2h=False,
+                 max_stale_lines=128, wmi_group_filter=None,
+                 wmi_group_exclude_filter=None):
 
         Analyzer.__init__(self,
                           short_htc_hdr=short_htc_hdr,
                           timestamps=timestamps,
-                          t2h=t2h)
+                          t2h=t2h,
+                          max_stale_lines=max_stale_lines)
 
-        self.wmi_ctrl_analyzer = WmiCtrlAnalyzer(eid=wmi_ctrl_eid,
-                                                 short_htc_hdr=short_htc_hdr,
-                                                 wmi_unified=wmi_unified,
-                                                 timestamps=timestamps,
-                                                 t2h=t2h)
+        self.wmi_ctrl_analyzer = \
+            WmiCtrlAnalyzer(eid=wmi_ctrl_eid,
+                            short_htc_hdr=short_htc_hdr,
+                            wmi_unified=wmi_unified,
+                            timestamps=timestamps,
+                            t2h=t2h,
+                            group_filter=wmi_group_filter,
+                            group_exclude_filter=wmi_group_exclude_filter,
+                            max_stale_lines=max_stale_lines)
 
-        self.htc_ctrl_analyzer = HtcCtrlAnalyzer(short_htc_hdr=short_htc_hdr,
-                                                 timestamps=timestamps,
-                                                 t2h=t2h)
+        self.htc_ctrl_analyzer = \
+            HtcCtrlAnalyzer(short_htc_hdr=short_htc_hdr,
+                            timestamps=timestamps,
+                            t2h=t2h,
+                            max_stale_lines=max_stale_lines)
 
         self.htt_analyzer = HttAnalyzer(eid=htt_eid,
                                         short_htc_hdr=short_htc_hdr,
                                         timestamps=timestamps,
-                                        t2h=t2h)
+                                        t2h=t2h,
+                                        max_stale_lines=max_stale_lines)
 
         self.cur_analyzer = None
 
@@ -36,36 +46,185 @@ class AllAnalyzer(Analyzer):
         self.htt_eid = htt_eid
         self.htc_ctrl_eid = 0
 
-    def __set_cur_analyzer(self, hexdata):
+        # Reassembly contexts keyed by endpoint. Each analyzer keeps its
+        # own message in flight, so frames from different endpoints can be
+        # interleaved in the log. All contexts decode the same direction
+        # (t2h), so frames of both directions must not be mixed in one
+        # analysis (select one direction with --desc-str).
+        # If the endpoint ids overlap, WMI takes precedence over HTT and
+        # HTT over HTC control.
+        self.eid_analyzers = {}
+        self.eid_analyzers[self.htc_ctrl_eid] = self.htc_ctrl_analyzer
+        self.eid_analyzers[self.htt_eid] = self.htt_analyzer
+        self.eid_analyzers[self.wmi_ctrl_eid] = self.wmi_ctrl_analyzer
 
-        hexdata_a = hexdata.split(' ', 15)
-        eid = int(hexdata_a[0], 16)
-        if eid == self.wmi_ctrl_eid:
-            self.cur_analyzer = self.wmi_ctrl_analyzer
-        elif eid == self.htt_eid:
-            self.cur_analyzer = self.htt_analyzer
-        elif eid == self.htc_ctrl_eid:
-            self.cur_analyzer = self.htc_ctrl_analyzer
-        else:
-            self.cur_analyzer = None
+        # Analyzers waiting for the next line of a frame (or of the
+        # padding after a complete message), keyed by the address of
+        # that line (next_addr). An analyzer is pending while its state is
+        # STATE_FRAME or STATE_DUMP.
+        self.pending = {}
+        # Line number of the start of the latest frame of each analyzer
+        self.frame_start = {}
+
+    def __get_frame_analyzer(self, data):
+
+        if len(data) == 0:
+            return None
+
+        return self.eid_analyzers.get(data[0])
+
+    def __frame_key(self, analyzer):
+
+        # Messages in flight take precedence over padding after complete
+        # messages, then the most recently started frame wins
+        return (analyzer.state == STATE_FRAME, self.frame_start[analyzer])
+
+    def __add_pending(self, analyzer):
+
+        if analyzer.state == STATE_FRAME or analyzer.state == STATE_DUMP:
+            analyzers = self.pending.get(analyzer.next_addr)
+            if analyzers is None:
+                self.pending[analyzer.next_addr] = [analyzer]
+            else:
+                analyzers.append(analyzer)
+
+    def __remove_pending(self, analyzer):
+
+        if analyzer.state == STATE_FRAME or analyzer.state == STATE_DUMP:
+            analyzers = self.pending[analyzer.next_addr]
+            if len(analyzers) == 1:
+                del self.pending[analyzer.next_addr]
+            else:
+                analyzers.remove(analyzer)
 
-    def parse_hexdata(self, hexdata):
+    def __get_continuation_analyzer(self, addr):
 
-        (ts, hexdata_no_ts) = self.parse_timestamp(hexdata)
+        # Continuation lines do not carry an endpoint id. The line is
+        # given to the most recently started frame that expects a line
+        # at this address.
+        analyzers = self.pending.get(addr)
+        while analyzers:
+            if len(analyzers) == 1:
+                analyzer = analyzers[0]
+            else:
+                analyzer = max(analyzers, key=self.__frame_key)
+            if not analyzer.is_stale(self.stats.lines):
+                return analyzer
+            self.__remove_pending(analyzer)
+            analyzer.abort_frame()
+            analyzers = self.pending.get(addr)
 
-        hexdata_split1 = hexdata_no_ts.split(': ', 1)
-        addr = int(hexdata_split1[0], 16)
-        if addr == 0:
+        return None
+
+    def __expire_stale_frames(self):
+
+        for analyzers in list(self.pending.values()):
+            for analyzer in list(analyzers):
+                if analyzer.is_stale(self.stats.lines):
+                    self.__remove_pending(analyzer)
+                    analyzer.abort_frame()
+
+    def __skip_line(self, hexline):
+
+        if self.skips_line(hexline.addr, self.stats.lines):
+            # Continuation of a dump from an endpoint without analyzer
+            self.skip_addr += len(hexline.data)
+            self.skip_line = self.stats.lines
+        elif self.state != STATE_IDLE:
+            self.stats.dropped_lines += 1
+
+    def begin_new_frame(self, hexline):
+
+        # Frames are reassembled by the sub-analyzers
+        return False
+
+    def parse_hexline(self, hexline):
+
+        self.stats.lines += 1
+
+        if hexline.addr == 0:
             # Address = 0 means a new msg and thus, a new HTC
             # header. We use the eid from the HTC header to
             # decide which of our analyzers we should use
-            self.__set_cur_analyzer(hexdata_split1[1])
-
-        if self.cur_analyzer:
-            return self.cur_analyzer.parse_hexdata(hexdata)
+            self.state = STATE_DUMP
+            analyzer = self.__get_frame_analyzer(hexline.data)
+            if not analyzer:
+                self.skip_addr = len(hexline.data)
+                self.skip_line = self.stats.lines
+                self.__expire_stale_frames()
+                return False
+            self.frame_start[analyzer] = self.stats.lines
         else:
+            analyzer = self.__get_continuation_analyzer(hexline.addr)
+            if not analyzer:
+                # Stale frames are only looked for when a line is not
+                # claimed by any frame
+                self.__expire_stale_frames()
+                self.__skip_line(hexline)
+                return False
+
+        # The line is decoded only once and shared with the
+        # selected analyzer. The sub-analyzers only see the lines of their
+        # own frames, so their last_line is a line number of this analyzer
+        # (see Analyzer.is_stale).
+        self.__remove_pending(analyzer)
+        full_msg = analyzer.parse_hexline(hexline)
+        analyzer.last_line = self.stats.lines
+        self.__add_pending(analyzer)
+        if not full_msg:
             return False
 
+        self.cur_analyzer = analyzer
+        return True
+
+    def get_analyzers(self):
+
+        return [self.htc_ctrl_analyzer, self.htt_analyzer,
+                self.wmi_ctrl_analyzer]
+
+    def get_frame_analyzers(self):
+
+        return [analyzer for analyzer in self.frame_start
+                if analyzer.state == STATE_FRAME]
+
+    def get_sync_state(self, line=None):
+
+        if line is None:
+            line = self.stats.lines
+        if self.skips_line(self.skip_addr, line):
+            skip = (self.skip_addr, line - self.skip_line)
+        else:
+            skip = None
+
+        # Only the sub-analyzers waiting for a line get continuation lines.
+        # The line numbers of the sub-analyzers are line numbers of this
+        # analyzer.
+        sub_states = []
+        for analyzer in self.get_analyzers():
+            if analyzer.state == STATE_FRAME or analyzer.state == STATE_DUMP:
+                sub_states.append((analyzer.get_sync_state(line),
+                                   line - self.frame_start[analyzer]))
+            else:
+                sub_states.append(None)
+
+        return (self.state, skip, tuple(sub_states))
+
+    def get_stats(self):
+
+        stats = AnalyzerStats()
+        for analyzer in self.frame_start:
+            stats.add(analyzer.get_stats())
+        stats.lines = self.stats.lines
+        stats.dropped_lines += self.stats.dropped_lines
+        return stats
+
+    def get_message(self):
+
+        if not self.cur_analyzer:
+            return None
+
+        return self.cur_analyzer.get_message()
+
     def get_id_str(self):
 
         if not self.cur_analyzer:
@@ -93,3 +252,10 @@ class AllAnalyzer(Analyzer):
             return None
 
         return self.cur_analyzer.get_trailer_str()
+
+    def print_data(self, fp):
+
+        if not self.cur_analyzer:
+            return
+
+        self.cur_analyzer.print_data(fp)
@@ -1,10 +1,57 @@
 from collections import namedtuple
 from abc import ABCMeta, abstractmethod
+import struct
+from .idfilter import compile_msg_id_filter
+from .message import Message, HtcHeader, hexdump_lines, HTC_HDR_STRUCT, \
+                     HTC_HDR_SHORT_STRUCT
 
 
-HtcHeader = namedtuple('HtcHeader',
-                       ['eid', 'flags', 'length', 'ctrl0', 'ctrl1'],
-                       verbose=False)
+HexLine = namedtuple('HexLine',
+                     ['ts', 'addr', 'data'],
+                     verbose=False)
+
+# Reassembly states
+# No dump has been seen yet (start of input)
+STATE_IDLE = 0
+# Inside a dump that is not being reassembled (another endpoint,
+# invalid header or padding after a complete message)
+STATE_DUMP = 1
+# Inside a dump with a message in flight
+STATE_FRAME = 2
+# Lines have been lost. All lines are dropped until the next frame begins
+STATE_RESYNC = 3
+
+
+class AnalyzerStats(object):
+
+    __slots__ = ('lines', 'messages', 'dropped_lines', 'truncated_frames',
+                 'bad_headers')
+
+    def __init__(self):
+
+        self.lines = 0
+        self.messages = 0
+        self.dropped_lines = 0
+        self.truncated_frames = 0
+        self.bad_headers = 0
+
+    def add(self, stats):
+
+        for name in AnalyzerStats.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(stats, name))
+
+    def subtract(self, stats):
+
+        for name in AnalyzerStats.__slots__:
+            setattr(self, name, getattr(self, name) - getattr(stats, name))
+
+    def get_str(self):
+
+        str = ''
+        for name in AnalyzerStats.__slots__:
+            str = '{}{}: {}\n'.format(str, name.replace('_', ' '),
+                                      getattr(self, name))
+        return str
 
 
 ##
@@ -13,145 +60,215 @@ HtcHeader = namedtuple('HtcHeader',
 class Analyzer:
     __metaclass__ = ABCMeta
 
-    def __init__(self, short_htc_hdr=False, timestamps=False, t2h=False):
+    # Protocol of the analyzed messages (the message enums used to resolve
+    # the names in the message id filters). None for all protocols.
+    proto = None
+    # Endpoint id of the analyzed frames (set by the sub-analyzers)
+    eid = None
+
+    def __init__(self, short_htc_hdr=False, timestamps=False, t2h=False,
+                 msg_id_filter=None, msg_id_exclude_filter=None,
+                 max_stale_lines=128):
 
         self.timestamps = timestamps
 
         if short_htc_hdr:
-            self.htc_hdr_len = 6
+            self.htc_hdr_struct = HTC_HDR_SHORT_STRUCT
         else:
-            self.htc_hdr_len = 8
+            self.htc_hdr_struct = HTC_HDR_STRUCT
+        self.htc_hdr_len = self.htc_hdr_struct.size
 
         self.valid_msg = False
         self.full_msg = False
-        self.htc_hdr = None
-        self.htc_hdr_data = []
-        self.cur_data = []
-        self.cur_trailer = []
-        self.full_data = False
-        self.ts = None
+        # The message being reassembled (or the last complete message).
+        # All decoded state is kept in the message.
+        self.msg = None
+        self.msg_len = 0
         self.t2h = t2h
 
+        self.state = STATE_IDLE
+        # Address of the next line of the current dump
+        self.next_addr = 0
+        self.stats = AnalyzerStats()
+
+        # Frames from other endpoints can be interleaved with the message in
+        # flight. The message is given up if none of the last
+        # max_stale_lines lines belonged to it (see is_stale).
+        self.max_stale_lines = max_stale_lines
+        # Line number of the last line of the message in flight
+        self.last_line = 0
+        # Address of the next line of the latest dump from another endpoint
+        # interleaved with the message in flight. Like a message in flight,
+        # the dump is over when none of the last max_stale_lines lines
+        # belonged to it.
+        self.skip_addr = None
+        # Line number of the last line of that dump
+        self.skip_line = 0
+
+        # Message id filters (see keep_msg_id and compile_msg_id_filter)
+        self.msg_id_filter = compile_msg_id_filter(msg_id_filter,
+                                                   self.proto, t2h)
+        self.msg_id_exclude_filter = compile_msg_id_filter(
+            msg_id_exclude_filter, self.proto, t2h)
+
+    def __getstate__(self):
+
+        # struct.Struct objects can't be pickled. They are recreated from
+        # their formats when the analyzer is unpickled.
+        state = dict(self.__dict__)
+        structs = {}
+        for (name, value) in self.__dict__.items():
+            if isinstance(value, struct.Struct):
+                structs[name] = value.format
+                del state[name]
+        state['_structs'] = structs
+        return state
+
+    def __setstate__(self, state):
+
+        structs = state.pop('_structs')
+        self.__dict__.update(state)
+        for (name, format) in structs.items():
+            setattr(self, name, struct.Struct(format))
+
     def clear(self):
 
-        self.cur_data = []
-        self.cur_trailer = []
+        self.msg = None
+        self.msg_len = 0
         self.valid_msg = False
         self.full_msg = False
 
-    def __validate_htc_hdr(self):
+    def __validate_htc_hdr(self, length, ctrl0):
 
         # Below are a few criterias that must hold for all HTC headers.
         # This function will return False if the criterias are not met.
-        if self.htc_hdr.length == 0:
+        if length == 0:
             return False
 
-        if self.t2h and self.htc_hdr.ctrl0 > self.htc_hdr.length:
+        if self.t2h and ctrl0 > length:
             return False
 
         return True
 
-    def create_htc_hdr(self, hexdata):
+    def create_htc_hdr(self, data, eid, ts=None):
 
-        if len(hexdata) < self.htc_hdr_len:
+        # Frames from other endpoints are rejected before anything
+        # else in the header is decoded
+        if len(data) == 0 or data[0] != eid:
             return False
 
-        eid = int(hexdata[0], 16)
-        flags = int(hexdata[1], 16)
-        len1 = int(hexdata[2], 16)
-        len2 = int(hexdata[3], 16)
-        ctrl0 = int(hexdata[4], 16)
-        ctrl1 = int(hexdata[5], 16)
-        # HTC header lengths is 2 bytes LE
-        hdr_len = ((len2 << 8) & 0xFF00) | len1
-        self.htc_hdr = HtcHeader(eid=eid, flags=flags, length=hdr_len,
-                                 ctrl0=ctrl0, ctrl1=ctrl1)
-        if not self.__validate_htc_hdr():
+        if len(data) < self.htc_hdr_len:
+            self.stats.bad_headers += 1
             return False
 
-        self.htc_hdr_data = hexdata[0:self.htc_hdr_len]
+        (eid, flags, length, ctrl0, ctrl1) = \
+            self.htc_hdr_struct.unpack_from(data)
+        if not self.__validate_htc_hdr(length, ctrl0):
+            self.stats.bad_headers += 1
+            return False
+
+        # The message buffer holds the HTC header followed by the payload
+        # (data and trailer). It is preallocated from the HTC header length.
+        buf = bytearray(self.htc_hdr_len + length)
+        buf[0:self.htc_hdr_len] = data[0:self.htc_hdr_len]
+        self.msg = Message(buf, self.htc_hdr_len, t2h=self.t2h, ts=ts)
+        self.msg_len = self.htc_hdr_len
+        return True
+
+    def keep_msg_id(self, msg_id):
+
+        # Returns True if messages with id msg_id pass the message id
+        # filters. Only messages with an id in msg_id_filter are kept (if
+        # set), otherwise all messages with an id not in
+        # msg_id_exclude_filter.
+        # The filters are applied by begin_new_frame as soon as the message
+        # id has been decoded. A rejected frame is never reassembled: the
+        # analyzer stays in STATE_DUMP, where only the addresses of the rest
+        # of the lines of the dump are tracked.
+        if self.msg_id_filter is not None:
+            return msg_id in self.msg_id_filter
+        if self.msg_id_exclude_filter is not None:
+            return msg_id not in self.msg_id_exclude_filter
         return True
 
     def get_data_len(self):
 
-        if self.t2h:
-            # t2h data length is defined as: total length - trailer length
-            return self.htc_hdr.length - self.htc_hdr.ctrl0
-        else:
-            # h2t data length is just: total length
-            return self.htc_hdr.length
-
-    def __append_msg_data_t2h(self, hexdata_a):
-
-        cur_data_len = self.get_data_len()
-        cur_trailer_len = self.htc_hdr.ctrl0
-        cur_tot_len = self.htc_hdr.length
-
-        bytes_left_full_data = cur_data_len - len(self.cur_data)
-        exceeding_data_bytes = len(hexdata_a) - bytes_left_full_data
-
-        if not self.full_data and exceeding_data_bytes >= 0:
-            self.full_data = True
-            self.cur_data += hexdata_a[0:bytes_left_full_data]
-            if cur_trailer_len == 0:
-                # We don't expect any trailer for this message so we
-                # consider it full
-                self.full_msg = True
-                self.full_data = False
-                return True
-            elif cur_trailer_len > exceeding_data_bytes:
-                self.cur_trailer += hexdata_a[bytes_left_full_data:]
-            else:
-                # Trailer is now full
-                end = bytes_left_full_data + \
-                      exceeding_data_bytes - cur_trailer_len
-                self.cur_trailer += hexdata_a[bytes_left_full_data:end]
-                self.full_msg = True
-                self.full_data = False
-                return True
-
-        bytes_left_full_trailer = cur_trailer_len - len(self.cur_trailer)
-        exceeding_trailer_bytes = len(hexdata_a) - bytes_left_full_trailer
-
-        if self.full_data and exceeding_trailer_bytes >= 0:
-            self.cur_trailer += hexdata_a[0:bytes_left_full_trailer]
-            self.full_msg = True
-            self.full_data = False
-            return True
-
-        if self.full_data:
-            self.cur_trailer += hexdata_a
-        else:
-            self.cur_data += hexdata_a
+        return self.msg.data_len
 
-        # Not a full message, more data needed...
-        return False
+    def expects_line(self, addr):
 
-    def __append_msg_data_h2t(self, hexdata_a):
-
-        if len(self.cur_data) + len(hexdata_a) >= self.htc_hdr.length:
-            # The data must not exceed the HTC hdr length.
-            # The HTC header length is the length of the payload.
-            # Since there will be padding of the SDIO messages it
-            # is not unlikely that there will be exceeding bytes.
-            exceeding_bytes = \
-                len(self.cur_data) + len(hexdata_a) - self.htc_hdr.length
-            remaining_bytes = len(hexdata_a) - exceeding_bytes
-            self.cur_data += hexdata_a[0:remaining_bytes]
-            # We now have a full message
-            self.full_msg = True
-            return True
-
-        self.cur_data += hexdata_a
-        # Not a full message, more data needed...
-        return False
+        # True if addr continues the current dump.
+        # A message in flight has consumed all bytes of its previous
+        # lines, so next_addr is the number of bytes received so far
+        # (HTC header included).
+        return (self.state == STATE_FRAME or self.state == STATE_DUMP) and \
+            addr == self.next_addr
+
+    def is_stale(self, line):
+
+        # True if a message is in flight and none of the lines after
+        # last_line, up to line (the number of the current line), belonged
+        # to it
+        return self.state == STATE_FRAME and \
+            line - self.last_line > self.max_stale_lines
 
-    def append_msg_data(self, hexdata_a):
+    def skips_line(self, addr, line):
 
-        if self.t2h:
-            return self.__append_msg_data_t2h(hexdata_a)
+        # True if addr continues the latest dump from another endpoint
+        # (see skip_addr) and line (the number of the current line) is
+        # within max_stale_lines of its last line
+        return addr == self.skip_addr and \
+            line - self.skip_line <= self.max_stale_lines
+
+    def get_sync_state(self, line=None):
+
+        # Returns the reassembly state, i.e. all state but the statistics
+        # that the analysis of the following lines depends on. Analyzers
+        # with equal reassembly states analyze the following lines in the
+        # same way (see ParallelAnalysis). Line numbers are relative to line
+        # (the number of the current line, by default the number of
+        # analyzed lines).
+        if line is None:
+            line = self.stats.lines
+        if self.state == STATE_IDLE:
+            return (self.state,)
+
+        if self.skips_line(self.skip_addr, line):
+            skip = (self.skip_addr, line - self.skip_line)
         else:
-            return self.__append_msg_data_h2t(hexdata_a)
+            skip = None
+        if self.state == STATE_FRAME:
+            return (self.state, skip, self.next_addr, line - self.last_line,
+                    self.msg.ts, len(self.msg.buf),
+                    bytes(self.msg.buf[0:self.msg_len]))
+        elif self.state == STATE_DUMP:
+            return (self.state, skip, self.next_addr)
+        return (self.state, skip)
+
+    def abort_frame(self):
+
+        # Gives up the message in flight (if any) and waits for the
+        # next frame to begin
+        if self.state == STATE_FRAME:
+            self.stats.truncated_frames += 1
+        self.clear()
+        self.state = STATE_RESYNC
+
+    def append_msg_data(self, data):
+
+        # Since there will be padding of the SDIO messages it is not
+        # unlikely that there will be exceeding bytes. These are dropped.
+        buf = self.msg.buf
+        n = min(len(data), len(buf) - self.msg_len)
+        buf[self.msg_len:self.msg_len + n] = data[0:n]
+        self.msg_len += n
+        if self.msg_len < len(buf):
+            # Not a full message, more data needed...
+            return False
+
+        # We now have a full message
+        self.full_msg = True
+        return True
 
     def parse_timestamp(self, hexdata):
 
@@ -161,20 +278,140 @@ class Analyzer:
         else:
             return (None, hexdata)
 
-    @abstractmethod
+    def decode_hexdata(self, hexdata):
+
+        (ts, hexdata) = self.parse_timestamp(hexdata)
+
+        # A linux hexdump line is the dump address followed by
+        # (at most) 16 hex values. All values are decoded in one go.
+        hexdata_split1 = hexdata.split(': ', 1)
+        return HexLine(ts=ts,
+                       addr=int(hexdata_split1[0], 16),
+                       data=bytearray.fromhex(hexdata_split1[1]))
+
     def parse_hexdata(self, hexdata):
 
-        pass
+        return self.parse_hexline(self.decode_hexdata(hexdata))
 
     @abstractmethod
-    def get_id_str(self):
+    def begin_new_frame(self, hexline):
 
         pass
 
+    def complete_msg(self):
+
+        # Called when a message is complete. Returns False if the
+        # message should be discarded.
+        return True
+
+    def __continue_frame(self, hexline):
+
+        if self.state == STATE_IDLE:
+            # The lines belong to a frame that began before the input
+            return False
+
+        if hexline.addr == self.next_addr:
+            if self.state == STATE_FRAME:
+                if self.stats.lines - self.last_line <= self.max_stale_lines:
+                    self.next_addr += len(hexline.data)
+                    self.last_line = self.stats.lines
+                    return self.append_msg_data(hexline.data)
+                # The message in flight is stale (see is_stale)
+                self.abort_frame()
+            elif self.state == STATE_DUMP:
+                self.next_addr += len(hexline.data)
+                return False
+        elif self.is_stale(self.stats.lines):
+            self.abort_frame()
+
+        if self.skips_line(hexline.addr, self.stats.lines):
+            # Continuation of a dump from another endpoint
+            self.skip_addr += len(hexline.data)
+            self.skip_line = self.stats.lines
+            return False
+
+        self.stats.dropped_lines += 1
+        if self.state != STATE_RESYNC:
+            # Address discontinuity: one or more lines have been lost
+            self.abort_frame()
+        return False
+
+    def parse_hexline(self, hexline):
+
+        self.stats.lines += 1
+
+        # Address = 0 means a new msg
+        if hexline.addr == 0:
+            if self.is_stale(self.stats.lines):
+                self.abort_frame()
+            if self.state == STATE_FRAME and \
+               (len(hexline.data) == 0 or hexline.data[0] != self.eid):
+                # A frame from another endpoint. The message in flight is
+                # kept until it is complete or stale.
+                self.skip_addr = len(hexline.data)
+                self.skip_line = self.stats.lines
+                return False
+            if self.state == STATE_FRAME:
+                # The previous message never got all of its data
+                self.stats.truncated_frames += 1
+            self.state = STATE_DUMP
+            self.next_addr = len(hexline.data)
+            full_msg = self.begin_new_frame(hexline)
+            if self.valid_msg and not full_msg:
+                self.state = STATE_FRAME
+                self.last_line = self.stats.lines
+        else:
+            full_msg = self.__continue_frame(hexline)
+
+        if not full_msg:
+            return False
+
+        # The rest of the dump (if any) is padding
+        self.state = STATE_DUMP
+        if not self.complete_msg():
+            return False
+
+        # The completed message is a read-only record (see Message)
+        self.msg.freeze()
+        self.stats.messages += 1
+        return True
+
+    def get_analyzers(self):
+
+        # Returns all analyzers (reassembly contexts)
+        return [self]
+
+    def get_frame_analyzers(self):
+
+        # Returns the analyzers (reassembly contexts) with a message
+        # in flight
+        if self.state == STATE_FRAME:
+            return [self]
+
+        return []
+
+    def get_stats(self):
+
+        return self.stats
+
+    def get_message(self):
+
+        if not self.full_msg:
+            return None
+
+        return self.msg
+
+    def get_id_str(self):
+
+        if not self.msg or self.msg.proto is None:
+            return ''
+
+        return self.msg.get_id_str(self.timestamps)
+
     def get_timestamp(self):
 
-        if self.timestamps:
-            return self.ts
+        if self.timestamps and self.msg:
+            return self.msg.ts
         else:
             return None
 
@@ -183,69 +420,29 @@ class Analyzer:
         if not self.valid_msg:
             return None
 
-        return self.cur_data
+        return self.msg.data
 
     def get_htc_hdr_str(self):
 
         if not self.valid_msg:
             return None
 
-        str = ''
-        str = '{0}00000000:  '.format(str)
-        iter_a = self.htc_hdr_data
-        for j in range(0, len(iter_a)):
-            str = '{0}{1} '.format(str, iter_a[j])
-        str = '{}\n'.format(str)
-
-        return str
+        return ''.join(hexdump_lines(self.msg.htc_hdr_data))
 
     def get_data_str(self):
 
         if not self.valid_msg:
             return None
 
-        str = ''
-        no_of_lines = len(self.cur_data) // 16
-        iter_a = self.cur_data
-        for i in range(0, no_of_lines + 1):
-            if len(iter_a) == 0:
-                break
-            str = '{0}{1:08x}:  '.format(str, i * 16)
-            iter_len = min(16, len(iter_a))
-            for j in range(0, iter_len):
-                str = '{0}{1} '.format(str, iter_a[j])
-            str = '{}\n'.format(str)
-            iter_a = iter_a[iter_len:]
-
-        return str
+        return ''.join(hexdump_lines(self.msg.data))
 
     def get_trailer_str(self):
 
         if not self.valid_msg:
             return None
 
-        str = ''
-        no_of_lines = len(self.cur_trailer) // 16
-        iter_a = self.cur_trailer
-        for i in range(0, no_of_lines + 1):
-            if len(iter_a) == 0:
-                break
-            str = '{0}{1:08x}:  '.format(str, i * 16)
-            iter_len = min(16, len(iter_a))
-            for j in range(0, iter_len):
-                str = '{0}{1} '.format(str, iter_a[j])
-            str = '{}\n'.format(str)
-            iter_a = iter_a[iter_len:]
-
-        return str
+        return ''.join(hexdump_lines(self.msg.trailer))
 
     def print_data(self, fp):
 
-        htc_hdr_data = self.get_htc_hdr_str()
-        fp.write("HTC header:\n%s" % (htc_hdr_data))
-        msg_data = self.get_data_str()
-        fp.write("msg data:\n%s" % (msg_data))
-        msg_trailer = self.get_trailer_str()
-        if msg_trailer:
-            fp.write("msg trailer:\n%s" % (msg_trailer))
-        fp.write("\n")
+        self.msg.print_data(fp)
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+
+from .analyzer import AnalyzerStats
+from .message import Message, get_msg_enum
+from .wmi_ctrl_analyzer import decode_tlv_msg
+
+
+# Default maximum size (in bytes) of all cache entries
+_MAX_SIZE = 1 << 30
+
+# Size of the blocks (at the start and the end of the input file) included
+# in the input fingerprint
+_FINGERPRINT_BLOCK_SIZE = 1 << 16
+
+_ENTRY_SUFFIX = '.bin'
+_MAGIC = b'QHAC\x01'
+
+_PROTOS = ['wmi-ctrl', 'htc-ctrl', 'htt']
+
+# Message record: flags, protocol, msg_id, if_idx, HTC header length,
+# timestamp length and message (buf) length. The record is followed by
+# the timestamp (ascii) and the message.
+_RECORD_STRUCT = struct.Struct('<BBIIBHI')
+_FLAG_T2H = 0x01
+_FLAG_IF_IDX = 0x02
+_FLAG_ENUM = 0x04
+# The end of the message records is marked with a record with only the
+# _FLAG_END flag set. It is followed by the analyzer statistics.
+_FLAG_END = 0x80
+_STATS_STRUCT = struct.Struct('<{}Q'.format(len(AnalyzerStats.__slots__)))
+
+_tool_fingerprint = None
+
+
+def get_tool_fingerprint():
+
+    # Hash of the source of the package. Any change of the tool (e.g. an
+    # upgrade) changes the fingerprint, which invalidates all cache entries
+    # and checkpoints.
+    global _tool_fingerprint
+    if _tool_fingerprint is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.sha1()
+        for name in sorted(os.listdir(package_dir)):
+            if not name.endswith('.py'):
+                continue
+            h.update(name.encode('utf-8'))
+            with open(os.path.join(package_dir, name), 'rb') as fp:
+                h.update(fp.read())
+        _tool_fingerprint = h.hexdigest()
+    return _tool_fingerprint
+
+
+def _get_file_fingerprint(path):
+
+    # Size, mtime and a hash of the first and last block of the file
+    st = os.stat(path)
+    h = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        h.update(fp.read(_FINGERPRINT_BLOCK_SIZE))
+        if st.st_size > _FINGERPRINT_BLOCK_SIZE:
+            fp.seek(max(_FINGERPRINT_BLOCK_SIZE,
+                        st.st_size - _FINGERPRINT_BLOCK_SIZE))
+            h.update(fp.read())
+    return [st.st_size, repr(st.st_mtime), h.hexdigest()]
+
+
+##
+# Reader of a cache entry.
+# iter_messages is a generator yielding the cached messages. The analyzer
+# statistics of the cached analysis are available in stats once all
+# messages have been read.
+class _CacheEntryReader(object):
+
+    def __init__(self, path, tlv_analysis=False):
+
+        self.path = path
+        self.tlv_analysis = tlv_analysis
+        self.stats = AnalyzerStats()
+
+    def iter_messages(self):
+
+        with open(self.path, 'rb') as fp:
+            if fp.read(len(_MAGIC)) != _MAGIC:
+                raise IOError('{}: invalid cache entry'.format(self.path))
+            while True:
+                record = fp.read(_RECORD_STRUCT.size)
+                if len(record) < _RECORD_STRUCT.size:
+                    raise IOError('{}: truncated cache entry'.format(self.path))
+                (flags, proto, msg_id, if_idx, hdr_len, ts_len,
+                 buf_len) = _RECORD_STRUCT.unpack(record)
+                if flags & _FLAG_END:
+                    break
+
+                if ts_len:
+                    ts = fp.read(ts_len).decode('ascii')
+                else:
+                    ts = None
+                msg = Message(fp.read(buf_len), hdr_len,
+                              t2h=bool(flags & _FLAG_T2H), ts=ts)
+                msg.proto = _PROTOS[proto]
+                msg.msg_id = msg_id
+                if flags & _FLAG_IF_IDX:
+                    msg.if_idx = if_idx
+                if flags & _FLAG_ENUM:
+                    msg.enum = get_msg_enum(msg.proto, msg.t2h, msg_id)
+                if self.tlv_analysis and msg.proto == 'wmi-ctrl':
+                    msg.tlv_decoder = decode_tlv_msg
+                msg.freeze()
+                yield msg
+
+            values = _STATS_STRUCT.unpack(fp.read(_STATS_STRUCT.size))
+            for (name, value) in zip(AnalyzerStats.__slots__, values):
+                setattr(self.stats, name, value)
+
+
+##
+# Writer of a cache entry.
+# The entry is written to a temporary file that replaces the entry when
+# close is called, i.e. only complete analyses are cached.
+class _CacheEntryWriter(object):
+
+    def __init__(self, cache, path):
+
+        self.cache = cache
+        self.path = path
+        (fd, self.tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path),
+                                               suffix='.tmp')
+        self.fp = os.fdopen(fd, 'wb')
+        self.fp.write(_MAGIC)
+        self.proto_idx = dict((proto, i) for (i, proto) in enumerate(_PROTOS))
+
+    def add(self, msg):
+
+        flags = 0
+        if msg.t2h:
+            flags |= _FLAG_T2H
+        if msg.if_idx is not None:
+            flags |= _FLAG_IF_IDX
+            if_idx = msg.if_idx
+        else:
+            if_idx = 0
+        if msg.enum:
+            flags |= _FLAG_ENUM
+        if msg.ts is not None:
+            ts = msg.ts.encode('ascii')
+        else:
+            ts = b''
+        self.fp.write(_RECORD_STRUCT.pack(flags, self.proto_idx[msg.proto],
+                                          msg.msg_id, if_idx, msg.hdr_len,
+                                          len(ts), len(msg.buf)))
+        self.fp.write(ts)
+        self.fp.write(msg.buf)
+
+    def close(self, stats):
+
+        self.fp.write(_RECORD_STRUCT.pack(_FLAG_END, 0, 0, 0, 0, 0, 0))
+        self.fp.write(_STATS_STRUCT.pack(*[getattr(stats, name) for name in
+                                           AnalyzerStats.__slots__]))
+        self.fp.close()
+        os.rename(self.tmp_path, self.path)
+        self.cache.evict()
+
+    def abort(self):
+
+        if not self.fp.closed:
+            self.fp.close()
+            os.remove(self.tmp_path)
+
+
+##
+# Persistent cache of decoded message streams.
+# The messages decoded from an input file are stored in a compact binary
+# form in a cache directory. When the same file is analyzed again with the
+# same decoding options, the cached messages are read instead of parsing
+# the log again.
+# The cache entries are keyed by the fingerprint of the input file (size,
+# mtime and a hash of the first and last 64 KiB), the options that affect
+# the decoding and the fingerprint of the tool itself (so upgrading the
+# tool invalidates all entries).
+# When the total size of the entries exceeds max_size bytes, the least
+# recently used entries are removed.
+class DecodeCache(object):
+
+    def __init__(self, directory, max_size=_MAX_SIZE):
+
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get_key(self, path, mode, analyzer_options, scanner_options,
+                native_scanner=False):
+
+        # The built-in scanner and hexfilter can differ on malformed lines,
+        # so their analyses are cached separately
+        key = {'tool': get_tool_fingerprint(),
+               'input': _get_file_fingerprint(path),
+               'mode': mode,
+               'analyzer': analyzer_options,
+               'scanner': scanner_options,
+               'native_scanner': native_scanner}
+        return hashlib.sha1(json.dumps(key, sort_keys=True)
+                            .encode('utf-8')).hexdigest()
+
+    def __get_path(self, key):
+
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+    def read(self, key, tlv_analysis=False):
+
+        # Returns a reader of the cache entry or None if there is no entry
+        # with the given key.
+        path = self.__get_path(key)
+        if not os.path.isfile(path):
+            return None
+
+        # The mtime of the entries is used as last used time
+        os.utime(path, None)
+        return _CacheEntryReader(path, tlv_analysis=tlv_analysis)
+
+    def write(self, key):
+
+        return _CacheEntryWriter(self, self.__get_path(key))
+
+    def evict(self):
+
+        # Removes the least recently used entries until the total size of
+        # the entries is at most max_size
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, path, st.st_size))
+            total_size += st.st_size
+
+        entries.sort()
+        for (_, path, size) in entries:
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import pickle
+
+from .cache import get_tool_fingerprint
+
+
+CHECKPOINT_VERSION = 1
+
+# Size of the blocks read when searching backwards for a line end
+_BLOCK_SIZE = 1 << 16
+
+
+def get_last_line_end(path, offset=0):
+
+    # Returns the offset after the last complete line (the last newline) of
+    # the file, or offset if there is no complete line after offset. The
+    # file may still be written, so the last line can be incomplete.
+    with open(path, 'rb') as fp:
+        end = os.fstat(fp.fileno()).st_size
+        while end > offset:
+            start = max(offset, end - _BLOCK_SIZE)
+            fp.seek(start)
+            pos = fp.read(end - start).rfind(b'\n')
+            if pos >= 0:
+                return start + pos + 1
+            end = start
+    return offset
+
+
+def _get_line_hash(fp, end):
+
+    # Hash of the line ending at offset end (newline included)
+    if end == 0:
+        return None
+
+    start = end - 1
+    while start > 0:
+        block_start = max(0, start - _BLOCK_SIZE)
+        fp.seek(block_start)
+        pos = fp.read(start - block_start).rfind(b'\n')
+        if pos >= 0:
+            start = block_start + pos + 1
+            break
+        start = block_start
+
+    fp.seek(start)
+    return hashlib.sha1(fp.read(end - start)).hexdigest()
+
+
+##
+# Analyzer checkpoint.
+# A checkpoint makes it possible to analyze a growing log incrementally:
+# each analysis resumes where the previous one stopped, so only the new
+# part of the log is read.
+# The checkpoint file holds the input offset (the end of the last complete
+# line analyzed), the inode of the input file, a hash of the line before
+# the offset and the pickled analyzer, i.e. the complete reassembly state
+# (the messages in flight, the frame order of the all analyzer etc.).
+# A checkpoint is only used if it matches the input file (same inode, the
+# file has not been truncated and the line before the offset is unchanged),
+# the decoding options and the version of the tool. Otherwise the analysis
+# starts from the beginning of the input.
+class AnalyzerCheckpoint(object):
+
+    def __init__(self, path, options):
+
+        self.path = path
+        # The options (a dict) used to create the analyzer and scanner
+        self.options = options
+
+    def load(self, input_path):
+
+        # Returns a tuple with the input offset and the analyzer of the
+        # checkpoint or None if there is no matching checkpoint.
+        if not os.path.isfile(self.path):
+            return None
+
+        try:
+            with open(self.path, 'rb') as fp:
+                checkpoint = pickle.load(fp)
+        except Exception:
+            return None
+
+        if checkpoint.get('version') != CHECKPOINT_VERSION or \
+           checkpoint['tool'] != get_tool_fingerprint() or \
+           checkpoint['options'] != self.options:
+            return None
+
+        offset = checkpoint['offset']
+        with open(input_path, 'rb') as fp:
+            st = os.fstat(fp.fileno())
+            if st.st_ino != checkpoint['inode'] or st.st_size < offset or \
+               _get_line_hash(fp, offset) != checkpoint['line_hash']:
+                return None
+
+        return (offset, checkpoint['analyzer'])
+
+    def save(self, input_path, offset, analyzer):
+
+        with open(input_path, 'rb') as fp:
+            checkpoint = {'version': CHECKPOINT_VERSION,
+                          'tool': get_tool_fingerprint(),
+                          'options': self.options,
+                          'inode': os.fstat(fp.fileno()).st_ino,
+                          'offset': offset,
+                          'line_hash': _get_line_hash(fp, offset),
+                          'analyzer': analyzer}
+
+        # The old checkpoint is replaced only when the new one is complete
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump(checkpoint, fp, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self.path)
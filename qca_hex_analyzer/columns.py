@@ -0,0 +1,245 @@
+import array
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    # numpy is only needed for the .npz format and for load_columns
+    # returning numpy arrays
+    numpy = None
+
+
+SCHEMA_VERSION = 1
+SCHEMA_FILE = 'schema.json'
+PAYLOAD_FILE = 'payload.bin'
+
+# Protocol column values (index into this list)
+PROTOS = ['wmi-ctrl', 'htc-ctrl', 'htt']
+
+# Missing (None) values of the unsigned integer columns
+NONE_U32 = 0xffffffff
+
+
+def _typecode(kind, size):
+
+    # Returns the array module typecode of the integer type with the given
+    # size. kind is 'u' (unsigned) or 'i' (signed). The size of the C types
+    # differs between platforms, e.g. 'L' is 4 bytes on 32 bit platforms.
+    for typecode in ['B', 'H', 'I', 'L', 'Q']:
+        if array.array(typecode).itemsize == size:
+            if kind == 'i':
+                return typecode.lower()
+            return typecode
+    raise ValueError('No {} byte integer type'.format(size))
+
+
+# Columns: name, array typecode and numpy dtype (without byte order).
+_COLUMNS = [
+    ('ts', 'd', 'f8'),
+    ('t2h', 'B', 'u1'),
+    ('eid', _typecode('u', 4), 'u4'),
+    ('proto', 'B', 'u1'),
+    ('msg_id', _typecode('u', 4), 'u4'),
+    ('if_idx', _typecode('u', 4), 'u4'),
+    ('enum', _typecode('i', 4), 'i4'),
+    ('length', _typecode('u', 4), 'u4'),
+    ('data_len', _typecode('u', 4), 'u4'),
+    ('payload_offset', _typecode('u', 8), 'u8'),
+]
+
+# Number of messages buffered in the columns before they are written
+_BATCH_SIZE = 1 << 16
+
+if sys.byteorder == 'little':
+    _BYTE_ORDER = '<'
+else:
+    _BYTE_ORDER = '>'
+
+
+##
+# Columnar (struct of arrays) export of decoded messages.
+# Each message field is appended to a fixed width column and the message
+# payloads are concatenated into a single payload blob:
+#
+# ts             float64  timestamp (NaN if the message has no timestamp)
+# t2h            uint8    1 for target to host messages
+# eid            uint32   HTC endpoint
+# proto          uint8    protocol, index into schema['protos']
+# msg_id         uint32   message id
+# if_idx         uint32   WMI interface index (0xffffffff if none)
+# enum           int32    message enum, index into schema['enums'] (or -1)
+# length         uint32   HTC length
+# data_len       uint32   payload length
+# payload_offset uint64   offset of the payload in the payload blob
+#
+# If path ends with '.npz', the columns (and the payload blob as a uint8
+# array) are saved as a NumPy .npz file (requires numpy). Otherwise path is
+# a directory that will contain one raw (native byte order) file per column
+# (<name>.bin), the payload blob (payload.bin) and a JSON schema
+# (schema.json) describing the files.
+# The columns are written in batches, so the memory usage does not depend
+# on the number of messages (except for the .npz format, that is created
+# from the raw files when the writer is closed).
+class ColumnWriter(object):
+
+    def __init__(self, path):
+
+        self.path = path
+        self.npz = path.endswith('.npz')
+        if self.npz:
+            if not numpy:
+                raise IOError('{}: the .npz format requires numpy'.format(path))
+            self.dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.dir = path
+
+        self.count = 0
+        self.payload_size = 0
+        self.enums = []
+        self.enum_idx = {}
+        self.proto_idx = dict((proto, i) for (i, proto) in enumerate(PROTOS))
+        self.columns = [array.array(typecode)
+                        for (_, typecode, _) in _COLUMNS]
+        self.files = [open(os.path.join(self.dir, '{}.bin'.format(name)), 'wb')
+                      for (name, _, _) in _COLUMNS]
+        self.payload_fp = open(os.path.join(self.dir, PAYLOAD_FILE), 'wb')
+
+    def __get_enum_idx(self, enum):
+
+        if not enum:
+            return -1
+
+        idx = self.enum_idx.get(enum)
+        if idx is None:
+            idx = len(self.enums)
+            self.enum_idx[enum] = idx
+            self.enums.append('{}.{}'.format(type(enum).__name__, enum.name))
+        return idx
+
+    def __write_columns(self):
+
+        for (column, fp) in zip(self.columns, self.files):
+            column.tofile(fp)
+        self.columns = [array.array(typecode)
+                        for (_, typecode, _) in _COLUMNS]
+
+    def add(self, msg):
+
+        data = msg.data
+        data_len = len(data)
+        if msg.ts is None:
+            ts = float('nan')
+        else:
+            ts = float(msg.ts)
+        if msg.if_idx is None:
+            if_idx = NONE_U32
+        else:
+            if_idx = msg.if_idx
+
+        # Same order as _COLUMNS
+        values = (ts, int(msg.t2h), msg.eid, self.proto_idx[msg.proto],
+                  msg.msg_id, if_idx, self.__get_enum_idx(msg.enum),
+                  msg.length, data_len, self.payload_size)
+        for (column, value) in zip(self.columns, values):
+            column.append(value)
+
+        self.payload_fp.write(data)
+        self.payload_size += data_len
+        self.count += 1
+        if len(self.columns[0]) >= _BATCH_SIZE:
+            self.__write_columns()
+
+    def get_schema(self):
+
+        columns = [{'name': name,
+                    'dtype': '{}{}'.format(_BYTE_ORDER, dtype),
+                    'file': '{}.bin'.format(name)}
+                   for (name, _, dtype) in _COLUMNS]
+        return {'version': SCHEMA_VERSION,
+                'count': self.count,
+                'columns': columns,
+                'payload': {'file': PAYLOAD_FILE,
+                            'size': self.payload_size},
+                'protos': PROTOS,
+                'enums': self.enums}
+
+    def __save_npz(self):
+
+        arrays = {}
+        for (name, _, dtype) in _COLUMNS:
+            arrays[name] = numpy.fromfile(os.path.join(self.dir,
+                                                       '{}.bin'.format(name)),
+                                          dtype=dtype)
+        arrays['payload'] = numpy.fromfile(os.path.join(self.dir,
+                                                        PAYLOAD_FILE),
+                                           dtype='u1')
+        arrays['protos'] = numpy.array(PROTOS)
+        arrays['enums'] = numpy.array(self.enums, dtype=str)
+        numpy.savez(self.path, **arrays)
+
+    def close(self):
+
+        if self.files is None:
+            return
+
+        self.__write_columns()
+        for fp in self.files:
+            fp.close()
+        self.payload_fp.close()
+        self.files = None
+
+        if self.npz:
+            try:
+                self.__save_npz()
+            finally:
+                shutil.rmtree(self.dir)
+            return
+
+        with open(os.path.join(self.dir, SCHEMA_FILE), 'w') as fp:
+            json.dump(self.get_schema(), fp, indent=2)
+            fp.write('\n')
+
+
+##
+# Loads a columnar export directory (see ColumnWriter).
+# Returns a tuple with the schema, a dict with all columns (column name
+# as key) and the payload blob. The columns are numpy arrays (memory mapped)
+# if numpy is available, otherwise array.array's.
+def load_columns(path):
+
+    with open(os.path.join(path, SCHEMA_FILE)) as fp:
+        schema = json.load(fp)
+    if schema['version'] != SCHEMA_VERSION:
+        raise ValueError('{}: unsupported schema version {}'.format(
+            path, schema['version']))
+
+    typecodes = dict((name, typecode) for (name, typecode, _) in _COLUMNS)
+    columns = {}
+    for column in schema['columns']:
+        column_path = os.path.join(path, column['file'])
+        if numpy:
+            if schema['count']:
+                columns[column['name']] = numpy.memmap(column_path,
+                                                       dtype=column['dtype'],
+                                                       mode='r')
+            else:
+                columns[column['name']] = numpy.zeros(0, dtype=column['dtype'])
+            continue
+        if column['dtype'][0] != _BYTE_ORDER:
+            raise ValueError('{}: byte order not supported without '
+                             'numpy'.format(column_path))
+        arr = array.array(typecodes[column['name']])
+        with open(column_path, 'rb') as fp:
+            arr.fromfile(fp, schema['count'])
+        columns[column['name']] = arr
+
+    with open(os.path.join(path, schema['payload']['file']), 'rb') as fp:
+        payload = fp.read()
+
+    return (schema, columns, payload)
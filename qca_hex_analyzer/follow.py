@@ -0,0 +1,131 @@
+import os
+import select
+import sys
+import time
+
+
+_READ_SIZE = 1 << 16
+# Poll interval (seconds) used when waiting for more data. The interval
+# is short enough to keep the latency of follow mode well below 10 ms.
+_POLL_INTERVAL = 0.002
+
+
+##
+# Log follower.
+# Reads a log that is still being written, either a growing file (path)
+# or a pipe (fd), e.g. the output of 'dmesg -w'. All data is read as
+# soon as it is available and the reading never stops at EOF: a file is
+# polled for more data and a pipe is read until the writer closes it.
+# A rotated (replaced or truncated) log file is reopened and read from
+# the beginning.
+# on_idle (if given) is called each time the follower is about to wait
+# for more data.
+class LogFollower(object):
+
+    def __init__(self, path=None, fd=None, poll_interval=_POLL_INTERVAL,
+                 on_idle=None):
+
+        self.path = path
+        self.fd = fd
+        self.poll_interval = poll_interval
+        self.on_idle = on_idle
+        self.pos = 0
+
+    def __open(self):
+
+        self.fd = os.open(self.path, os.O_RDONLY)
+        self.pos = 0
+
+    def __rotated(self):
+
+        # Returns True if the log file has been replaced by a new file
+        # or truncated.
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # The old file has been moved, but the new one is not created
+            # yet. Keep reading the old one.
+            return False
+
+        if st.st_ino != os.fstat(self.fd).st_ino:
+            os.close(self.fd)
+            self.__open()
+            return True
+
+        if st.st_size < self.pos:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            self.pos = 0
+            return True
+
+        return False
+
+    def __idle(self):
+
+        if self.on_idle:
+            self.on_idle()
+
+    def __read(self):
+
+        # Returns the next block of data or None if no data is available.
+        # b'' is returned when the writer of a pipe has closed it.
+        if self.path is None:
+            if not select.select([self.fd], [], [], 0)[0]:
+                self.__idle()
+                select.select([self.fd], [], [], self.poll_interval)
+                return None
+            return os.read(self.fd, _READ_SIZE)
+
+        data = os.read(self.fd, _READ_SIZE)
+        if data:
+            self.pos += len(data)
+            return data
+
+        if not self.__rotated():
+            self.__idle()
+            time.sleep(self.poll_interval)
+        return None
+
+    def iter_chunks(self):
+
+        # Generator yielding blocks (bytes) of complete lines.
+        # An incomplete line is kept until the rest of the line has been
+        # written.
+        if self.path is not None:
+            self.__open()
+
+        rest = b''
+        try:
+            while True:
+                pos = self.pos
+                data = self.__read()
+                if data is None:
+                    if self.pos < pos and rest:
+                        # The log was rotated. The last line of the old log
+                        # had no newline.
+                        yield rest
+                        rest = b''
+                    continue
+                if not data:
+                    break
+
+                data = rest + data
+                end = data.rfind(b'\n') + 1
+                if end:
+                    yield data[:end]
+                rest = data[end:]
+
+            if rest:
+                yield rest
+        finally:
+            if self.path is not None:
+                os.close(self.fd)
+
+    def iter_lines(self):
+
+        # Generator yielding the log lines (text)
+        for chunk in self.iter_chunks():
+            for line in chunk.splitlines(True):
+                if sys.version_info[0] >= 3:
+                    line = line.decode('utf-8', 'replace')
+                yield line
+
@@ -0,0 +1,236 @@
+from collections import namedtuple
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+
+from .logfile import get_compression
+from .stream import create_analyzer, create_scanner, create_hexfilter
+
+
+FrameIndexEntry = namedtuple('FrameIndexEntry',
+                             ['offset', 'ts', 'eid', 'msg_id'],
+                             verbose=False)
+
+FRAME_INDEX_SUFFIX = '.frames'
+
+_MAGIC = b'QHAF\x03'
+# Header: magic, size and mtime of the log file and the SHA-1 digest of the
+# options that select the frames (see _get_selection_options).
+_HEADER_STRUCT = struct.Struct('<5sQd20s')
+# Entry: offset of the frame start line, timestamp (NaN if none), eid and
+# message id.
+_ENTRY_STRUCT = struct.Struct('<QdBI')
+
+# Number of entries written at a time
+_BATCH_SIZE = 4096
+
+
+def get_frame_index_path(log_path):
+
+    return log_path + FRAME_INDEX_SUFFIX
+
+
+def _get_selection_options(mode, analyzer_options, scanner_options,
+                           native_scanner):
+
+    # Timestamps and TLV analysis don't change which frames are decoded.
+    # The index always has the timestamps of the log (if any).
+    scanner_options = dict(scanner_options or {})
+    timestamps = scanner_options.get('log_has_timestamps', True)
+    scanner_options['timestamps'] = timestamps
+    analyzer_options = dict(analyzer_options or {}, timestamps=timestamps,
+                            tlv_analysis=False)
+    return (mode, analyzer_options, scanner_options, native_scanner)
+
+
+def _get_header(log_path, mode, analyzer_options, scanner_options,
+                native_scanner):
+
+    st = os.stat(log_path)
+    options = json.dumps(_get_selection_options(mode, analyzer_options,
+                                                scanner_options,
+                                                native_scanner),
+                         sort_keys=True)
+    return _HEADER_STRUCT.pack(_MAGIC, st.st_size, st.st_mtime,
+                               hashlib.sha1(options.encode('utf-8')).digest())
+
+
+def _iter_hexfilter_lines(fp, hf, analyzer):
+
+    # Generator yielding an (offset, HexLine) tuple for each hexdump line
+    # of the log file fp (opened in binary mode) accepted by the hexfilter
+    # hf, i.e. the lines of an analysis without --native-scanner
+    offset = 0
+    for line in fp:
+        if sys.version_info[0] < 3:
+            text = line
+        else:
+            text = line.decode('utf-8', 'replace')
+        if hf.parse_line(text):
+            yield (offset, analyzer.decode_hexdata(hf.get_hex()))
+        offset += len(line)
+
+
+##
+# Builds the frame index of a log file.
+# The frame index is a sidecar file (<log>.frames by default) with one fixed
+# size entry (21 bytes) for each frame start (address 0 line) of the log
+# that begins a message: the byte offset of the line, the timestamp, the
+# eid and the message id (see FrameIndexEntry). The entries are in the
+# order of the log.
+# The frames are decoded by an analyzer created from mode and
+# analyzer_options (see create_analyzer) from the hexdump lines selected by
+# scanner_options, so frames of other endpoints and directions and frames
+# rejected by the message id filters are not indexed. The hexdump lines are
+# found by the built-in scanner (see create_scanner) if native_scanner is
+# True, otherwise by hexfilter, i.e. the same way as in the analysis.
+# Entry N is the frame of message N of the analysis with the same options,
+# unless frames are truncated.
+# Only uncompressed files can be indexed (compressed files can't be read
+# from an offset).
+def build_frame_index(log_path, index_path=None, mode='all',
+                      analyzer_options=None, scanner_options=None,
+                      native_scanner=False):
+
+    if get_compression(log_path):
+        raise IOError('{}: compressed files can\'t be indexed'.format(log_path))
+    if index_path is None:
+        index_path = get_frame_index_path(log_path)
+
+    header = _get_header(log_path, mode, analyzer_options, scanner_options,
+                         native_scanner)
+    (mode, analyzer_options, scanner_options, native_scanner) = \
+        _get_selection_options(mode, analyzer_options, scanner_options,
+                               native_scanner)
+    analyzer = create_analyzer(mode, **analyzer_options)
+    # A frame begins a message if the analyzer (one of the reassembly
+    # contexts of the analyzer) has a new valid message after its start line
+    contexts = analyzer.get_analyzers()
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as index_fp:
+        # The header is written last, so an interrupted build never leaves
+        # a valid index behind
+        index_fp.write(b'\0' * _HEADER_STRUCT.size)
+        entries = []
+        with open(log_path, 'rb') as fp:
+            buf = b''
+            if native_scanner:
+                try:
+                    buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty files can't be mapped
+                    pass
+                hexlines = create_scanner(**scanner_options).scan_range(
+                    buf, 0, len(buf))
+            else:
+                hexlines = _iter_hexfilter_lines(
+                    fp, create_hexfilter(**scanner_options), analyzer)
+            try:
+                for (offset, hexline) in hexlines:
+                    if hexline.addr != 0:
+                        analyzer.parse_hexline(hexline)
+                        continue
+
+                    msgs = [a.msg for a in contexts]
+                    analyzer.parse_hexline(hexline)
+                    for (a, msg) in zip(contexts, msgs):
+                        if not a.valid_msg or a.msg is msg:
+                            continue
+                        if hexline.ts:
+                            ts = float(hexline.ts)
+                        else:
+                            ts = float('nan')
+                        entries.append(_ENTRY_STRUCT.pack(offset, ts,
+                                                          a.msg.eid,
+                                                          a.msg.msg_id))
+                    if len(entries) >= _BATCH_SIZE:
+                        index_fp.write(b''.join(entries))
+                        entries = []
+            finally:
+                if buf:
+                    buf.close()
+        index_fp.write(b''.join(entries))
+        index_fp.seek(0)
+        index_fp.write(header)
+
+    os.rename(tmp_path, index_path)
+    return FrameIndex(index_path)
+
+
+##
+# Frame index (see build_frame_index).
+# The entries are read directly from the index file, so opening an index
+# is cheap regardless of the size of the log.
+class FrameIndex(object):
+
+    def __init__(self, index_path):
+
+        self.path = index_path
+        self.fp = open(index_path, 'rb')
+        self.header = self.fp.read(_HEADER_STRUCT.size)
+        if len(self.header) < _HEADER_STRUCT.size or \
+           _HEADER_STRUCT.unpack(self.header)[0] != _MAGIC:
+            self.fp.close()
+            raise IOError('{}: invalid frame index'.format(index_path))
+        size = os.fstat(self.fp.fileno()).st_size
+        self.count = (size - _HEADER_STRUCT.size) // _ENTRY_STRUCT.size
+
+    def __len__(self):
+
+        return self.count
+
+    def is_valid(self, log_path, mode='all', analyzer_options=None,
+                 scanner_options=None, native_scanner=False):
+
+        # Returns True if the index is up to date with the log file and
+        # was built with the same options
+        return self.header == _get_header(log_path, mode, analyzer_options,
+                                          scanner_options, native_scanner)
+
+    def get_entry(self, n):
+
+        if n < 0 or n >= self.count:
+            raise IndexError('Frame {} not in frame index ({} frames)'.format(
+                n, self.count))
+
+        self.fp.seek(_HEADER_STRUCT.size + n * _ENTRY_STRUCT.size)
+        (offset, ts, eid, msg_id) = _ENTRY_STRUCT.unpack(
+            self.fp.read(_ENTRY_STRUCT.size))
+        if math.isnan(ts):
+            ts = None
+        return FrameIndexEntry(offset=offset, ts=ts, eid=eid, msg_id=msg_id)
+
+    def close(self):
+
+        self.fp.close()
+
+
+##
+# Opens the frame index of a log file (<log>.frames) for the given analysis
+# options (see build_frame_index). The index is built (or rebuilt, if the
+# log or the options have changed) if necessary.
+def open_frame_index(log_path, mode='all', analyzer_options=None,
+                     scanner_options=None, native_scanner=False):
+
+    index_path = get_frame_index_path(log_path)
+    if os.path.isfile(index_path):
+        try:
+            index = FrameIndex(index_path)
+        except IOError:
+            index = None
+        if index is not None:
+            if index.is_valid(log_path, mode=mode,
+                              analyzer_options=analyzer_options,
+                              scanner_options=scanner_options,
+                              native_scanner=native_scanner):
+                return index
+            index.close()
+
+    return build_frame_index(log_path, index_path, mode=mode,
+                             analyzer_options=analyzer_options,
+                             scanner_options=scanner_options,
+                             native_scanner=native_scanner)
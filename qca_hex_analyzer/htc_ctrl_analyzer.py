@@ -1,114 +1,82 @@
-from collections import namedtuple
-from .analyzer import Analyzer, HtcHeader
+import struct
+from .analyzer import Analyzer
 from .htc_ctrl import HtcCtrl
 
 
-HtcCtrlHeader = namedtuple('HtcCtrlHeader',
-                           ['msg_id'],
-                           verbose=False)
+# HTC control header: 16 bit message id (LE)
+_HTC_CTRL_HDR_STRUCT = struct.Struct('<H')
 
 
 class HtcCtrlAnalyzer(Analyzer):
 
-    def __init__(self, short_htc_hdr=False, timestamps=False, t2h=False):
+    proto = 'htc-ctrl'
+
+    def __init__(self, short_htc_hdr=False, timestamps=False, t2h=False,
+                 msg_id_filter=None, msg_id_exclude_filter=None,
+                 max_stale_lines=128):
 
         Analyzer.__init__(self,
                           short_htc_hdr=short_htc_hdr,
                           timestamps=timestamps,
-                          t2h=t2h)
+                          t2h=t2h,
+                          msg_id_filter=msg_id_filter,
+                          msg_id_exclude_filter=msg_id_exclude_filter,
+                          max_stale_lines=max_stale_lines)
 
         # eid is always 0 for HTC control
         self.eid = 0
-        self.hdr_len = 2
-        self.htc_ctrl_hdr = None
-
-    def __create_htc_ctrl_hdr(self, hexdata):
+        self.hdr_len = _HTC_CTRL_HDR_STRUCT.size
 
-        if len(hexdata) < self.hdr_len:
-            return None
+    def __create_htc_ctrl_hdr(self, data):
 
-        id1 = int(hexdata[0], 16)
-        id2 = int(hexdata[1], 16)
-        msg_id = ((id2 << 8) & 0xFF00) | (id1 & 0xFF)
+        # The HTC control header is located right after the HTC header
+        if len(data) < self.htc_hdr_len + self.hdr_len:
+            return False
 
-        hdr = HtcCtrlHeader(msg_id=msg_id)
-        return hdr
+        (self.msg.msg_id,) = _HTC_CTRL_HDR_STRUCT.unpack_from(data,
+                                                              self.htc_hdr_len)
+        return True
 
-    def __begin_new_frame(self, hexdata):
+    def begin_new_frame(self, hexline):
 
         # Verify that the hexdump has enough data for the HTC hdr
         # and HTC ctrl hdr.
-        # A linux hexdump has 16 values = 15 spaces in one line at most
-        hexdata_a = hexdata.split(' ', 15)
-
+        data = hexline.data
         self.clear()
-        valid_htc_hdr = self.create_htc_hdr(hexdata_a)
+        valid_htc_hdr = self.create_htc_hdr(data, self.eid, ts=hexline.ts)
         if not valid_htc_hdr:
             return False
 
-        if self.htc_hdr.eid != self.eid:
-            return False
-
         # Examine the HTC header and check if it is a "trailer only"
         # message. A "trailer only" message is a message with no data,
         # just trailer. These messages will have message id set to the
         # special value: 0xffff
         data_len = self.get_data_len()
         if self.t2h and data_len == 0:
-            self.htc_ctrl_hdr = self.__create_htc_ctrl_hdr(['ff', 'ff'])
-            self.htc_ctrl_enum = \
-                HtcCtrl.get_msg_id_enum(self.htc_ctrl_hdr.msg_id)
+            self.msg.msg_id = 0xffff
+            self.msg.enum = HtcCtrl.get_msg_id_enum(self.msg.msg_id)
+            self.msg.proto = 'htc-ctrl'
+            if not self.keep_msg_id(self.msg.msg_id):
+                self.clear()
+                return False
             self.valid_msg = True
-            return self.append_msg_data(hexdata_a[self.htc_hdr_len:16])
+            return self.append_msg_data(data[self.htc_hdr_len:16])
 
-        htc_ctrl_hdr = self.__create_htc_ctrl_hdr(hexdata_a[self.htc_hdr_len:])
-        if not htc_ctrl_hdr:
+        if not self.__create_htc_ctrl_hdr(data):
+            self.stats.bad_headers += 1
             return False
 
-        self.htc_ctrl_hdr = htc_ctrl_hdr
-        self.htc_ctrl_enum = HtcCtrl.get_msg_id_enum(self.htc_ctrl_hdr.msg_id)
-        if not self.htc_ctrl_enum:
+        self.msg.enum = HtcCtrl.get_msg_id_enum(self.msg.msg_id)
+        if not self.msg.enum:
+            self.stats.bad_headers += 1
             return False
+        self.msg.proto = 'htc-ctrl'
 
-        # Append the last bytes to the saved data array
-        self.valid_msg = True
-        return self.append_msg_data(hexdata_a[self.htc_hdr_len:16])
-
-    def __continue_frame(self, hexdata):
-
-        if not self.valid_msg or self.full_msg:
+        # Apply the HTC ctrl id filters. Rejected frames are skipped.
+        if not self.keep_msg_id(self.msg.msg_id):
+            self.clear()
             return False
 
-        hexdata_a = hexdata.split(' ', 15)
-
-        full_msg = self.append_msg_data(hexdata_a)
-
-        return full_msg
-
-    def parse_hexdata(self, hexdata):
-
-        (ts, hexdata) = self.parse_timestamp(hexdata)
-
-        # Read the dump address. Address = 0 means a new msg
-        hexdata_split1 = hexdata.split(': ', 1)
-        addr = int(hexdata_split1[0], 16)
-        if addr == 0:
-            self.ts = ts
-            return self.__begin_new_frame(hexdata_split1[1])
-        else:
-            return self.__continue_frame(hexdata_split1[1])
-
-    def get_id_str(self):
-
-        if not self.htc_ctrl_hdr:
-            return ''
-
-        str = ''
-        if self.timestamps:
-            str = '[{}]'.format(self.ts)
-            str = str.ljust(16)
-        str = '{}HTC ctrl msg id: {:6x}'.format(str, self.htc_ctrl_hdr.msg_id)
-        if self.htc_ctrl_enum:
-            str = '{},  {}'.format(str, self.htc_ctrl_enum.name)
-        str = '{}\n'.format(str)
-        return str
+        # Append the last bytes to the saved data array
+        self.valid_msg = True
+        return self.append_msg_data(data[self.htc_hdr_len:16])
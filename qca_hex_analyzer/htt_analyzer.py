@@ -1,83 +1,51 @@
-from collections import namedtuple
 from .htt import Htt
-from .analyzer import Analyzer, HtcHeader
+from .analyzer import Analyzer
 
 
 class HttAnalyzer(Analyzer):
 
+    proto = 'htt'
+
     def __init__(self, eid=2, short_htc_hdr=False, timestamps=False,
-                 t2h=False):
+                 t2h=False, msg_id_filter=None, msg_id_exclude_filter=None,
+                 max_stale_lines=128):
 
         Analyzer.__init__(self,
                           short_htc_hdr=short_htc_hdr,
                           timestamps=timestamps,
-                          t2h=t2h)
+                          t2h=t2h,
+                          msg_id_filter=msg_id_filter,
+                          msg_id_exclude_filter=msg_id_exclude_filter,
+                          max_stale_lines=max_stale_lines)
 
         self.eid = eid
-        self.enum = None
-        self.htt_id = None
 
-    def __begin_new_frame(self, hexdata):
+    def begin_new_frame(self, hexline):
 
         # Verify that the hexdump has enough data for the HTC hdr
         # and a HTT message id.
-        # A linux hexdump has 16 values = 15 spaces in one line at most
-        hexdata_a = hexdata.split(' ', 15)
-
+        data = hexline.data
         self.clear()
-        valid_htc_hdr = self.create_htc_hdr(hexdata_a)
+        valid_htc_hdr = self.create_htc_hdr(data, self.eid, ts=hexline.ts)
         if not valid_htc_hdr:
             return False
 
-        if self.htc_hdr.eid != self.eid:
+        if len(data) < self.htc_hdr_len + 1:
+            self.stats.bad_headers += 1
             return False
 
-        if len(hexdata_a) < self.htc_hdr_len + 1:
-            return False
-
-        self.htt_id = int(hexdata_a[self.htc_hdr_len], 16)
+        self.msg.msg_id = data[self.htc_hdr_len]
         if self.t2h:
-            self.enum = Htt.get_t2h_enum(self.htt_id)
+            self.msg.enum = Htt.get_t2h_enum(self.msg.msg_id)
         else:
-            self.enum = Htt.get_h2t_enum(self.htt_id)
+            self.msg.enum = Htt.get_h2t_enum(self.msg.msg_id)
+        self.msg.proto = 'htt'
 
-        # Append the last bytes to the saved data array
-        self.valid_msg = True
-        return self.append_msg_data(hexdata_a[self.htc_hdr_len:16])
-
-    def __continue_frame(self, hexdata):
-
-        if not self.valid_msg or self.full_msg:
+        # Apply the HTT id filters. Rejected frames are skipped.
+        if not self.keep_msg_id(self.msg.msg_id):
+            self.clear()
             return False
 
-        hexdata_a = hexdata.split(' ', 15)
-
-        return self.append_msg_data(hexdata_a)
-
-    def parse_hexdata(self, hexdata):
-
-        (ts, hexdata) = self.parse_timestamp(hexdata)
-
-        # Read the dump address. Address = 0 means a new msg
-        hexdata_split1 = hexdata.split(': ', 1)
-        addr = int(hexdata_split1[0], 16)
-        if addr == 0:
-            self.ts = ts
-            return self.__begin_new_frame(hexdata_split1[1])
-        else:
-            return self.__continue_frame(hexdata_split1[1])
-
-    def get_id_str(self):
-
-        if self.htt_id is None:
-            return ''
-
-        str = ''
-        if self.timestamps:
-            str = '[{}]'.format(self.ts)
-            str = str.ljust(16)
-        str = '{}HTT msg id: {:6x}'.format(str, self.htt_id)
-        if self.enum:
-            str = '{},  {}'.format(str, self.enum.name)
-        str = '{}\n'.format(str)
-        return str
+        # Append the last bytes to the saved data array
+        self.valid_msg = True
+        return self.append_msg_data(data[self.htc_hdr_len:16])
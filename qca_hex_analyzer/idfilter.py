@@ -0,0 +1,217 @@
+import argparse
+import bisect
+import re
+
+from .wmi_unified import WmiUnified, WmiUnifiedCmd, WmiUnifiedEvt, \
+                         WmiUnifiedCmdGrpId
+from .htt import HttH2tMsgType, HttT2hMsgType
+from .htc_ctrl import HtcCtrlMsgId
+
+
+# Ranges with at most this many ids in total are expanded into a set.
+# Larger filters are matched with a binary search over the ranges.
+_MAX_SET_SIZE = 1 << 16
+
+_RANGE_RE = re.compile(r'^\s*(\w+)\s*-\s*(\w+)\s*$')
+
+# The WMI command group is bits 12-23 of the (24 bit) WMI command and event
+# ids
+_WMI_GRP_SHIFT = 12
+_WMI_GRP_COUNT = 1 << 12
+_WMI_GRP_PREFIX = 'WMI_GRP_'
+
+# Message enums by protocol: (host to target, target to host)
+_MSG_ENUMS = {'wmi-ctrl': ([WmiUnifiedCmd], [WmiUnifiedEvt]),
+              'htt': ([HttH2tMsgType], [HttT2hMsgType]),
+              'htc-ctrl': ([HtcCtrlMsgId], [HtcCtrlMsgId])}
+
+
+def _get_msg_enums(proto=None, t2h=None):
+
+    # Returns the enums in which message id names are looked up. None
+    # (proto or t2h) means all protocols or both directions.
+    if proto is None:
+        protos = sorted(_MSG_ENUMS.keys())
+    else:
+        protos = [proto]
+
+    enums = []
+    for proto in protos:
+        (h2t_enums, t2h_enums) = _MSG_ENUMS[proto]
+        if t2h is None or not t2h:
+            enums.extend(h2t_enums)
+        if t2h is None or t2h:
+            enums.extend(t2h_enums)
+    return enums
+
+
+def _parse_name(name, proto=None, t2h=None):
+
+    # Returns the message id of the enum name (case insensitive)
+    key = name.strip().upper()
+    for enum in _get_msg_enums(proto, t2h):
+        if key in enum.__members__:
+            return enum.__members__[key].value
+    if proto is None:
+        raise ValueError('Unknown message id: {}'.format(name))
+    raise ValueError('Unknown {} message id: {}'.format(proto, name))
+
+
+def _parse_value(value, proto=None, t2h=None):
+
+    try:
+        return int(value, 0)
+    except ValueError:
+        return _parse_name(value, proto, t2h)
+
+
+def _parse_spec(spec, proto=None, t2h=None):
+
+    # Returns the inclusive range (lo, hi) of an id filter item: an id
+    # (e.g. 0x5008), an id range (e.g. 0x5000-0x5fff) or a message enum
+    # name (e.g. WMI_INIT_CMDID)
+    if not isinstance(spec, (type(''), type(u''))):
+        return (spec, spec)
+
+    m = _RANGE_RE.match(spec)
+    if m:
+        lo = _parse_value(m.group(1), proto, t2h)
+        hi = _parse_value(m.group(2), proto, t2h)
+        if lo > hi:
+            raise ValueError('Invalid message id range: {}'.format(spec))
+        return (lo, hi)
+
+    msg_id = _parse_value(spec, proto, t2h)
+    return (msg_id, msg_id)
+
+
+def msg_id_spec(value):
+
+    # argparse type of the id filter options. The items are kept as
+    # strings (enum names can only be resolved once the protocol and the
+    # direction are known), but their syntax is validated here.
+    try:
+        _parse_spec(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError('{}'.format(err))
+    return value
+
+
+##
+# Compiled message id filter.
+# The filter is a set of inclusive id ranges. Membership is tested with
+# the in operator: a set lookup if the ranges contain at most
+# _MAX_SET_SIZE ids in total, otherwise a binary search over the merged
+# ranges.
+class MsgIdFilter(object):
+
+    def __init__(self, ranges):
+
+        # Merged, sorted ranges
+        self.ranges = []
+        for (lo, hi) in sorted(ranges):
+            if self.ranges and lo <= self.ranges[-1][1] + 1:
+                if hi > self.ranges[-1][1]:
+                    self.ranges[-1] = (self.ranges[-1][0], hi)
+            else:
+                self.ranges.append((lo, hi))
+
+        size = sum(hi - lo + 1 for (lo, hi) in self.ranges)
+        if size <= _MAX_SET_SIZE:
+            ids = set()
+            for (lo, hi) in self.ranges:
+                ids.update(range(lo, hi + 1))
+            self.ids = frozenset(ids)
+        else:
+            self.ids = None
+        self.starts = [lo for (lo, _) in self.ranges]
+
+    def __contains__(self, msg_id):
+
+        if self.ids is not None:
+            return msg_id in self.ids
+
+        i = bisect.bisect_right(self.starts, msg_id) - 1
+        return i >= 0 and msg_id <= self.ranges[i][1]
+
+    def __len__(self):
+
+        return len(self.ranges)
+
+
+##
+# Compiles a message id filter.
+# specs is an iterable of ids (ints) and id filter items (strings: ids,
+# inclusive id ranges such as '0x5000-0x5fff' or message enum names such as
+# 'WMI_INIT_CMDID'). Enum names are looked up in the message enums of
+# protocol proto and direction t2h (None means all protocols or both
+# directions). Returns None if specs is None. A compiled filter is returned
+# as is.
+def compile_msg_id_filter(specs, proto=None, t2h=None):
+
+    if specs is None or isinstance(specs, MsgIdFilter):
+        return specs
+
+    return MsgIdFilter([_parse_spec(spec, proto, t2h) for spec in specs])
+
+
+def _parse_wmi_group(name):
+
+    # Returns the WMI group enum of a group name (case insensitive, with or
+    # without the WMI_GRP_ prefix) or group id. Group enums and ids (ints)
+    # are accepted as well.
+    if isinstance(name, WmiUnifiedCmdGrpId):
+        return name
+    if isinstance(name, int):
+        return WmiUnifiedCmdGrpId(name)
+
+    key = name.strip().upper()
+    try:
+        return WmiUnifiedCmdGrpId(int(key, 0))
+    except ValueError:
+        pass
+    if not key.startswith(_WMI_GRP_PREFIX):
+        key = _WMI_GRP_PREFIX + key
+    if key not in WmiUnifiedCmdGrpId.__members__:
+        raise ValueError('Unknown WMI group: {}'.format(name))
+    return WmiUnifiedCmdGrpId.__members__[key]
+
+
+def wmi_group_spec(value):
+
+    # argparse type of the WMI group filter options. Returns the names of
+    # the groups of a comma separated list (e.g. VDEV,PEER,STA_PS).
+    try:
+        return [_parse_wmi_group(name).name for name in value.split(',')
+                if name.strip()]
+    except ValueError as err:
+        raise argparse.ArgumentTypeError('{}'.format(err))
+
+
+##
+# Compiles WMI group filters into a lookup table indexed by the group id
+# (msg_id >> 12) of a WMI command or event id. The table entry is non-zero
+# if messages of the group are kept: the group is in groups (all groups if
+# groups is None) and not in exclude_groups.
+# The groups are given as names, ids or WmiUnifiedCmdGrpId enums. Returns
+# None if there are no group filters.
+def compile_wmi_group_filter(groups=None, exclude_groups=None):
+
+    if groups is None and exclude_groups is None:
+        return None
+
+    if groups is not None:
+        groups = set(_parse_wmi_group(group) for group in groups)
+    if exclude_groups is not None:
+        exclude_groups = set(_parse_wmi_group(group)
+                             for group in exclude_groups)
+
+    table = bytearray(_WMI_GRP_COUNT)
+    for grp_id in range(_WMI_GRP_COUNT):
+        group = WmiUnified.get_cmd_group(grp_id << _WMI_GRP_SHIFT)
+        if groups is not None and group not in groups:
+            continue
+        if exclude_groups is not None and group in exclude_groups:
+            continue
+        table[grp_id] = 1
+    return table
@@ -0,0 +1,212 @@
+import bz2
+import gzip
+import io
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import lzma
+except ImportError:
+    # lzma is not available in python 2
+    lzma = None
+
+
+# Magic bytes of the supported compression formats
+_MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+]
+
+# Compressed logs are decompressed in chunks of _CHUNK_SIZE bytes.
+# At most _MAX_CHUNKS decompressed chunks are buffered.
+_CHUNK_SIZE = 1 << 20
+_MAX_CHUNKS = 8
+
+
+def get_compression(path):
+
+    # Returns the compression format of the file ('gzip', 'bz2' or 'xz')
+    # or None if the file is not compressed.
+    with open(path, 'rb') as fp:
+        magic = fp.read(6)
+
+    for (magic_bytes, compression) in _MAGIC:
+        if magic.startswith(magic_bytes):
+            return compression
+
+    return None
+
+
+##
+# Read ahead reader.
+# Reads (and decompresses) chunks from fp in a separate thread, so the
+# decompression of the next chunks is done while the current chunk is
+# analyzed. The decompressors release the GIL while decompressing.
+class _ReadAheadReader(io.RawIOBase):
+
+    def __init__(self, fp, chunk_size=_CHUNK_SIZE, max_chunks=_MAX_CHUNKS):
+
+        io.RawIOBase.__init__(self)
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(max_chunks)
+        self.chunk = b''
+        self.chunk_pos = 0
+        self.eof = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.__read_chunks)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __put(self, item):
+
+        # The timeout makes sure the thread terminates if the reader
+        # is closed before all chunks have been read
+        while not self.stopped:
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __read_chunks(self):
+
+        try:
+            while not self.stopped:
+                chunk = self.fp.read(self.chunk_size)
+                self.__put(chunk)
+                if not chunk:
+                    return
+        except Exception as err:
+            # Errors are raised by readinto in the consuming thread
+            self.__put(err)
+
+    def readable(self):
+
+        return True
+
+    def readinto(self, b):
+
+        while self.chunk_pos >= len(self.chunk):
+            if self.eof:
+                return 0
+            item = self.chunks.get()
+            if isinstance(item, Exception):
+                # Truncated or corrupt input. The decompressors raise
+                # different exceptions (EOFError, zlib.error etc.), they
+                # are all reported as IOError.
+                self.eof = True
+                raise IOError('Failed to decompress input: {}'.format(item))
+            if not item:
+                self.eof = True
+                return 0
+            self.chunk = item
+            self.chunk_pos = 0
+
+        n = min(len(b), len(self.chunk) - self.chunk_pos)
+        b[0:n] = self.chunk[self.chunk_pos:self.chunk_pos + n]
+        self.chunk_pos += n
+        return n
+
+    def close(self):
+
+        if not self.closed:
+            self.stopped = True
+            self.thread.join()
+            self.fp.close()
+        io.RawIOBase.close(self)
+
+
+##
+# Reader of a file (fp) from its current position up to byte end
+class _RangeReader(io.RawIOBase):
+
+    def __init__(self, fp, end):
+
+        io.RawIOBase.__init__(self)
+        self.fp = fp
+        self.end = end
+
+    def readable(self):
+
+        return True
+
+    def readinto(self, b):
+
+        n = min(len(b), self.end - self.fp.tell())
+        if n <= 0:
+            return 0
+        data = self.fp.read(n)
+        b[0:len(data)] = data
+        return len(data)
+
+    def close(self):
+
+        if not self.closed:
+            self.fp.close()
+        io.RawIOBase.close(self)
+
+
+def _open_decompressor(path, compression):
+
+    if compression == 'gzip':
+        return gzip.GzipFile(path, 'rb')
+    elif compression == 'bz2':
+        return bz2.BZ2File(path, 'rb')
+    elif compression == 'xz':
+        if not lzma:
+            raise IOError('{}: xz compressed input requires the lzma '
+                          'module'.format(path))
+        return lzma.LZMAFile(path, 'rb')
+
+    raise ValueError('Unsupported compression: {}'.format(compression))
+
+
+##
+# Opens a log file for reading.
+# gzip, bz2 and xz compressed files are detected from their magic bytes
+# and decompressed while the file is read. Uncompressed files are opened
+# as usual.
+# If binary is True, the file is opened in binary mode (bytes lines),
+# otherwise in text mode.
+# If offset is given, reading starts at the first line starting at or
+# after byte offset. If end is given, reading stops at byte end. Ranges
+# are only supported for uncompressed files.
+def open_log(path, binary=False, offset=0, end=None):
+
+    compression = get_compression(path)
+    if offset or end is not None:
+        if compression:
+            raise IOError('{}: can\'t read a range of a compressed '
+                          'file'.format(path))
+        fp = io.open(path, 'rb')
+        if offset:
+            fp.seek(offset - 1)
+            if fp.read(1) != b'\n':
+                # Skip the rest of the line
+                fp.readline()
+        if end is not None:
+            fp = io.BufferedReader(_RangeReader(fp, end))
+        if binary or sys.version_info[0] < 3:
+            return fp
+        return io.TextIOWrapper(fp)
+
+    if not compression:
+        if binary:
+            return open(path, 'rb')
+        return open(path, 'r')
+
+    fp = io.BufferedReader(_ReadAheadReader(_open_decompressor(path,
+                                                               compression)),
+                           _CHUNK_SIZE)
+    if binary or sys.version_info[0] < 3:
+        # In python 2 the text lines are the bytes lines
+        return fp
+
+    return io.TextIOWrapper(fp)
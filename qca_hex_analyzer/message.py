@@ -0,0 +1,247 @@
+from collections import namedtuple, OrderedDict
+import base64
+import binascii
+import struct
+from .wmi_unified import WmiUnified
+from .htt import Htt
+from .htc_ctrl import HtcCtrl
+
+
+HtcHeader = namedtuple('HtcHeader',
+                       ['eid', 'flags', 'length', 'ctrl0', 'ctrl1'],
+                       verbose=False)
+
+# HTC header layouts: eid, flags, length (LE), ctrl0 and ctrl1.
+# The 8 byte header has two additional bytes that are not decoded.
+HTC_HDR_STRUCT = struct.Struct('<BBHBB2x')
+HTC_HDR_SHORT_STRUCT = struct.Struct('<BBHBB')
+
+_HEX_BYTES = ['{:02x} '.format(x) for x in range(256)]
+
+# Encodings of the message payload in Message.get_dict
+_PAYLOAD_ENCODERS = {
+    'hex': lambda data: binascii.hexlify(data).decode('ascii'),
+    'base64': lambda data: base64.b64encode(data).decode('ascii'),
+}
+
+_ID_STR_PREFIX = {
+    'wmi-ctrl': 'WMI',
+    'htt': 'HTT',
+    'htc-ctrl': 'HTC ctrl',
+}
+
+
+def get_msg_enum(proto, t2h, msg_id):
+
+    # Returns the enum of a message id in the same way as the analyzers
+    # (None if the id is not valid)
+    if proto == 'wmi-ctrl':
+        if t2h:
+            return WmiUnified.get_evt_enum(msg_id)
+        return WmiUnified.get_cmd_enum(msg_id)
+    elif proto == 'htt':
+        if t2h:
+            return Htt.get_t2h_enum(msg_id)
+        return Htt.get_h2t_enum(msg_id)
+    elif proto == 'htc-ctrl':
+        return HtcCtrl.get_msg_id_enum(msg_id)
+    return None
+
+
+def hexdump_lines(data, addr=0):
+
+    # Renders data in the same format as the linux hexdumps, i.e:
+    # '00000000:  xx xx ... xx \n' with (at most) 16 values per line.
+    # Each byte is formatted exactly once, so the rendering is linear
+    # in the size of data.
+    hex_a = [_HEX_BYTES[x] for x in bytearray(data)]
+    for i in range(0, len(hex_a), 16):
+        yield '{:08x}:  {}\n'.format(addr + i, ''.join(hex_a[i:i + 16]))
+
+
+##
+# Decoded message.
+# A message is a single small object holding the full decode result.
+# The raw message (HTC header, data and trailer) is kept in one buffer
+# (buf). The HTC header fields are unpacked once, when the message is
+# created (buf must hold the HTC header at that point).
+# While a message is being assembled buf is a bytearray owned by the
+# analyzer. Once complete the message is frozen: buf is replaced by an
+# immutable bytes object and setting any attribute raises AttributeError.
+# The messages returned from Analyzer.get_message, iter_messages, the cache
+# and the store are therefore read-only records, and htc_hdr_data, data and
+# trailer are read-only memoryviews.
+# The TLV message (tlv_msg) is decoded by tlv_decoder (if set) the first
+# time it is read, so messages that are never printed (e.g. rejected by
+# --where) are not TLV decoded.
+class Message(object):
+
+    __slots__ = ('buf', 'hdr_len', 't2h', 'ts', 'eid', 'flags', 'length',
+                 'ctrl0', 'ctrl1', 'proto', 'msg_id', 'if_idx', 'enum',
+                 'tlv_decoder', '_tlv_msg')
+
+    def __init__(self, buf, hdr_len, t2h=False, ts=None):
+
+        self.buf = buf
+        self.hdr_len = hdr_len
+        self.t2h = t2h
+        self.ts = ts
+        # The 8 byte header starts with the same fields as the short one
+        (self.eid, self.flags, self.length, self.ctrl0, self.ctrl1) = \
+            HTC_HDR_SHORT_STRUCT.unpack_from(buf)
+        self.proto = None
+        self.msg_id = None
+        self.if_idx = None
+        self.enum = None
+        # Function returning the TLV message of a message
+        self.tlv_decoder = None
+        self._tlv_msg = None
+
+    def __getstate__(self):
+
+        # Messages are pickled with the analyzer (checkpoints). The slots
+        # are restored without going through __setattr__, so frozen
+        # messages can be restored too.
+        return tuple(getattr(self, name) for name in Message.__slots__)
+
+    def __setstate__(self, state):
+
+        for (name, value) in zip(Message.__slots__, state):
+            object.__setattr__(self, name, value)
+
+    def freeze(self):
+
+        # Called once the message is complete. The message becomes a
+        # _FrozenMessage, so the messages being assembled don't pay for
+        # the read-only check on each attribute assignment.
+        self.buf = bytes(self.buf)
+        self.__class__ = _FrozenMessage
+
+    @property
+    def tlv_msg(self):
+
+        if self.tlv_decoder is not None:
+            # Also done for frozen messages: the TLV message is part of the
+            # decode result, it is just not decoded up front
+            object.__setattr__(self, '_tlv_msg', self.tlv_decoder(self))
+            object.__setattr__(self, 'tlv_decoder', None)
+        return self._tlv_msg
+
+    @tlv_msg.setter
+    def tlv_msg(self, tlv_msg):
+
+        self._tlv_msg = tlv_msg
+        self.tlv_decoder = None
+
+    @property
+    def htc_hdr(self):
+
+        return HtcHeader(self.eid, self.flags, self.length, self.ctrl0,
+                         self.ctrl1)
+
+    @property
+    def data_len(self):
+
+        if self.t2h:
+            # t2h data length is defined as: total length - trailer length
+            return self.length - self.ctrl0
+        else:
+            # h2t data length is just: total length
+            return self.length
+
+    @property
+    def htc_hdr_data(self):
+
+        return memoryview(self.buf)[0:self.hdr_len]
+
+    @property
+    def data(self):
+
+        return memoryview(self.buf)[self.hdr_len:self.hdr_len + self.data_len]
+
+    @property
+    def trailer(self):
+
+        # In the t2h case the trailer is located after the data
+        return memoryview(self.buf)[self.hdr_len + self.data_len:]
+
+    def get_id_str(self, timestamps=False):
+
+        str = ''
+        if timestamps:
+            str = '[{}]'.format(self.ts)
+            str = str.ljust(16)
+        str = '{}{} msg id: {:6x}'.format(str, _ID_STR_PREFIX[self.proto],
+                                          self.msg_id)
+        if self.enum:
+            str = '{},  {}'.format(str, self.enum.name)
+        str = '{}\n'.format(str)
+        return str
+
+    def get_dict(self, payload_encoding='hex'):
+
+        # Returns the decoded message as a dict suitable for JSON
+        # serialization. payload_encoding is either 'hex' or 'base64'.
+        encode = _PAYLOAD_ENCODERS[payload_encoding]
+        d = OrderedDict()
+        if self.ts is not None:
+            d['ts'] = float(self.ts)
+        else:
+            d['ts'] = None
+        if self.t2h:
+            d['direction'] = 't2h'
+        else:
+            d['direction'] = 'h2t'
+        d['eid'] = self.eid
+        d['flags'] = self.flags
+        d['length'] = self.length
+        d['ctrl0'] = self.ctrl0
+        d['ctrl1'] = self.ctrl1
+        d['proto'] = self.proto
+        d['msg_id'] = self.msg_id
+        d['if_idx'] = self.if_idx
+        if self.enum:
+            d['enum'] = self.enum.name
+        else:
+            d['enum'] = None
+        d['payload'] = encode(self.data.tobytes())
+        d['trailer'] = encode(self.trailer.tobytes())
+        if self.tlv_msg:
+            tlv = self.tlv_msg.get_dict()
+            if tlv:
+                d['tlv'] = tlv
+        return d
+
+    def print_data(self, fp):
+
+        if self.tlv_msg and self.tlv_msg.get_tuples():
+            self.tlv_msg.print_data(fp)
+            fp.write("\n")
+            return
+
+        # The hexdump lines are written directly to fp instead of
+        # being concatenated into one string first.
+        fp.write("HTC header:\n")
+        fp.writelines(hexdump_lines(self.htc_hdr_data))
+        fp.write("msg data:\n")
+        fp.writelines(hexdump_lines(self.data))
+        trailer = self.trailer
+        if len(trailer) > 0:
+            fp.write("msg trailer:\n")
+            fp.writelines(hexdump_lines(trailer))
+        fp.write("\n")
+
+
+##
+# Complete (read-only) message. See Message.
+class _FrozenMessage(Message):
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+
+        raise AttributeError('Message is read-only')
+
+    def freeze(self):
+
+        pass
@@ -0,0 +1,105 @@
+import json
+import time
+
+
+# Default size (in characters) of the output buffer
+_BUFFER_SIZE = 1 << 16
+
+
+##
+# Buffered output sink.
+# File like object (write) gathering the (many small) writes of the
+# rendered messages into large chunks that are written to fp in bulk.
+# The buffered output is written to fp (and fp is flushed):
+# - when buffer_size characters have been buffered (without flushing fp)
+# - when batch_size messages have been written (if batch_size is set)
+# - when the oldest buffered message is older than interval seconds
+#   (if interval is set)
+# - on idle (no more input available for now) if batch_size or interval
+#   is set. If interval is set, only when the interval has expired.
+# - on flush
+# message_done must be called each time a complete message has been
+# written. batch_size=1 flushes each message (used by follow mode).
+class OutputSink(object):
+
+    def __init__(self, fp, buffer_size=_BUFFER_SIZE, batch_size=None,
+                 interval=None):
+
+        self.fp = fp
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.buf = []
+        self.buf_len = 0
+        self.pending = 0
+        self.first_pending = None
+
+    def __write_buffer(self):
+
+        if self.buf:
+            self.fp.write(''.join(self.buf))
+            self.buf = []
+            self.buf_len = 0
+
+    def __expired(self):
+
+        return self.interval is not None and \
+            time.time() - self.first_pending >= self.interval
+
+    def write(self, str):
+
+        self.buf.append(str)
+        self.buf_len += len(str)
+        if self.buf_len >= self.buffer_size:
+            self.__write_buffer()
+
+    def writelines(self, lines):
+
+        for line in lines:
+            self.write(line)
+
+    def message_done(self):
+
+        if self.batch_size is None and self.interval is None:
+            return
+
+        self.pending += 1
+        if self.pending == 1 and self.interval is not None:
+            self.first_pending = time.time()
+
+        if (self.batch_size is not None and
+            self.pending >= self.batch_size) or \
+           self.__expired():
+            self.flush()
+
+    def idle(self):
+
+        if not self.pending:
+            return
+
+        if self.interval is None or self.__expired():
+            self.flush()
+
+    def flush(self):
+
+        self.__write_buffer()
+        self.fp.flush()
+        self.pending = 0
+
+
+##
+# Writes the output of a (complete) message to fp.
+# output_format is either 'text' (the message id line and, if print_data
+# is set, the message data) or 'jsonl' (one JSON object per line, see
+# Message.get_dict).
+def write_message(fp, msg, timestamps=False, print_data=False,
+                  output_format='text', payload_encoding='hex'):
+
+    if output_format == 'jsonl':
+        fp.write(json.dumps(msg.get_dict(payload_encoding)))
+        fp.write('\n')
+        return
+
+    fp.write(msg.get_id_str(timestamps))
+    if print_data:
+        msg.print_data(fp)
@@ -0,0 +1,203 @@
+import heapq
+import mmap
+import multiprocessing
+import os
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from .analyzer import AnalyzerStats, STATE_FRAME
+from .scanner import HexDumpScanner
+from .stream import create_analyzer
+from .output import write_message
+
+
+# The input is split into chunks of (at most) _CHUNK_SIZE bytes.
+# Small chunks keep the memory usage of the buffered output low, while
+# still being large enough to make the per chunk overhead negligible.
+_CHUNK_SIZE = 16 << 20
+
+
+def _render(analyzer, output_options):
+
+    fp = StringIO()
+    write_message(fp, analyzer.get_message(), **output_options)
+    return fp.getvalue()
+
+
+def _snapshot_stats(analyzer):
+
+    stats = AnalyzerStats()
+    stats.add(analyzer.get_stats())
+    return stats
+
+
+def _analyze_chunk(args):
+
+    # Worker function.
+    # A chunk is analyzed from its first frame (address 0 line) up to the
+    # first frame of the next chunk. Lines before the first frame belong
+    # to frames that started in the previous chunk and are analyzed by the
+    # worker of that chunk, i.e. each worker continues into the next chunk
+    # until all of its messages in flight have been completed or dropped.
+    # The worker of the next chunk begins without the reassembly state of
+    # this chunk, so its statistics can differ from a single process
+    # analysis until the states of both analyses are equal. The lines of
+    # the next chunk are therefore also analyzed by a second analyzer
+    # (shadow) the same way as by the next worker, until its state is
+    # equal to the state of the analyzer of this chunk. The statistics of
+    # the shadow are subtracted from the statistics of the chunk.
+    # Returns a tuple with the offset of the first frame of the next chunk
+    # (None if there is none), the statistics of the chunk and a list of
+    # (line offset, output) tuples for all messages of the chunk.
+    (path, start, end, first_chunk, scanner_options, mode,
+     analyzer_options, output_options) = args
+
+    scanner = HexDumpScanner(**scanner_options)
+    analyzer = create_analyzer(mode, **analyzer_options)
+    output = []
+    next_frame = None
+    shadow = None
+    # Messages in flight when the next chunk begins
+    pending = None
+    synced = first_chunk
+
+    with open(path, 'rb') as fp:
+        buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for (offset, hexline) in scanner.scan_range(buf, start,
+                                                        len(buf)):
+                if not synced:
+                    if hexline.addr != 0:
+                        continue
+                    if offset >= end:
+                        # No frames begin in this chunk
+                        return (offset, AnalyzerStats(), output)
+                    synced = True
+
+                if pending is None and offset >= end and hexline.addr == 0:
+                    next_frame = offset
+                    shadow = create_analyzer(mode, **analyzer_options)
+                    pending = dict((a, a.msg) for a in
+                                   analyzer.get_frame_analyzers())
+
+                if pending is not None:
+                    if not pending and analyzer.get_sync_state() == \
+                       shadow.get_sync_state():
+                        break
+                    shadow.parse_hexline(hexline)
+                    if analyzer.parse_hexline(hexline):
+                        msg = analyzer.get_message()
+                        if any(m is msg for m in pending.values()):
+                            output.append((offset,
+                                           _render(analyzer, output_options)))
+                    # Messages completed, dropped or replaced by a new
+                    # frame are no longer pending
+                    for (a, m) in list(pending.items()):
+                        if not (a.state == STATE_FRAME and a.msg is m):
+                            del pending[a]
+                    continue
+
+                if analyzer.parse_hexline(hexline):
+                    output.append((offset, _render(analyzer, output_options)))
+        finally:
+            buf.close()
+
+    stats = _snapshot_stats(analyzer)
+    if shadow is not None:
+        stats.subtract(shadow.get_stats())
+
+    return (next_frame, stats, output)
+
+
+##
+# Parallel analysis of a (large) log file.
+# The log is split into newline aligned byte ranges (chunks) that are
+# analyzed in jobs worker processes. The output of the workers is merged
+# back into the original order, so the output is the same as for a
+# single process analysis.
+# Only uncompressed files can be analyzed in parallel (the file is memory
+# mapped by each worker). The built-in hexdump scanner is always used.
+class ParallelAnalysis(object):
+
+    def __init__(self, path, jobs, mode='all', scanner_options=None,
+                 analyzer_options=None, output_options=None,
+                 chunk_size=_CHUNK_SIZE):
+
+        self.path = path
+        self.jobs = jobs
+        self.mode = mode
+        self.scanner_options = scanner_options or {}
+        self.analyzer_options = analyzer_options or {}
+        # Keyword arguments of write_message
+        self.output_options = output_options or {}
+        self.chunk_size = chunk_size
+        self.stats = AnalyzerStats()
+
+    def __get_chunks(self):
+
+        size = os.path.getsize(self.path)
+        if size == 0:
+            return []
+
+        # Make sure all jobs get at least one chunk
+        chunk_size = min(self.chunk_size, size // self.jobs + 1)
+
+        chunks = []
+        with open(self.path, 'rb') as fp:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                start = 0
+                while start < size:
+                    end = buf.find(b'\n', min(start + chunk_size, size) - 1)
+                    if end < 0:
+                        end = size
+                    else:
+                        end += 1
+                    chunks.append((start, end))
+                    start = end
+            finally:
+                buf.close()
+
+        return chunks
+
+    def iter_output(self):
+
+        # Generator yielding the output of each message in the same order
+        # as a single process analysis would produce it.
+        chunks = self.__get_chunks()
+        args = [(self.path, start, end, i == 0, self.scanner_options,
+                 self.mode, self.analyzer_options, self.output_options)
+                for (i, (start, end)) in enumerate(chunks)]
+
+        self.stats = AnalyzerStats()
+        messages = 0
+        # Output of messages completed in one chunk can be interleaved with
+        # the output of the next chunk. The output is kept in a heap ordered
+        # by line offset (and chunk) until all chunks that could precede it
+        # have been received.
+        heap = []
+        pool = multiprocessing.Pool(self.jobs)
+        try:
+            for (i, (next_frame, stats, output)) in \
+                    enumerate(pool.imap(_analyze_chunk, args)):
+                self.stats.add(stats)
+                messages += len(output)
+                for (n, (offset, str)) in enumerate(output):
+                    heapq.heappush(heap, (offset, i, n, str))
+                while heap and (next_frame is None or
+                                heap[0][0] < next_frame):
+                    yield heapq.heappop(heap)[3]
+            while heap:
+                yield heapq.heappop(heap)[3]
+        finally:
+            pool.terminate()
+            pool.join()
+
+        self.stats.messages = messages
+
+    def get_stats(self):
+
+        return self.stats
@@ -0,0 +1,151 @@
+import binascii
+import mmap
+import re
+from .analyzer import HexLine
+from .logfile import get_compression, open_log
+
+
+# A linux hexdump line (print_hex_dump with DUMP_PREFIX_OFFSET) is an
+# optional timestamp, a prefix (description string) and an 8 digit address
+# followed by (at most) 16 space separated hex values.
+# The optional ASCII column is separated from the hex values by at
+# least two spaces, so it is never matched as hex data.
+_TIMESTAMP_PATTERN = br'(?:\[\s*([0-9]+\.[0-9]+)\] ?)?'
+_HEXDUMP_PATTERN = br'(?<![0-9a-fA-F])([0-9a-f]{8}): ' \
+                   br'([0-9a-f]{2}(?: [0-9a-f]{2}){0,15})'
+
+
+def _compile_hexdump_re(desc_str, log_has_timestamps):
+
+    # The whole line is matched by a single regex, so lines without
+    # hexdumps (and lines not matching desc_str) never reach python code.
+    if log_has_timestamps:
+        ts = _TIMESTAMP_PATTERN
+    else:
+        # Empty group, the timestamp will always be empty
+        ts = b'()'
+
+    if desc_str:
+        prefix = b'([^\n]*?(?:' + \
+                 b'|'.join(re.escape(desc) for desc in desc_str) + \
+                 b')[^\n]*?)'
+    else:
+        prefix = b'([^\n]*?)'
+
+    return re.compile(b'^' + ts + prefix + _HEXDUMP_PATTERN, re.MULTILINE)
+
+
+##
+# Hexdump line scanner.
+# Finds hexdump lines in a log and decodes them into HexLine tuples
+# (the same tuples Analyzer.decode_hexdata produces from hexfilter output).
+# The log is scanned in bulk as bytes: lines not containing a hexdump are
+# skipped by the regex engine and are never split or decoded.
+# The description string (desc_str/desc_str_invert) filtering is the same
+# as the filtering done by hexfilter.
+class HexDumpScanner(object):
+
+    def __init__(self, desc_str=None, desc_str_invert=None, timestamps=False,
+                 log_has_timestamps=True):
+
+        self.desc_str_invert = self.__encode_desc(desc_str_invert)
+        self.timestamps = timestamps
+        self.hexdump_re = _compile_hexdump_re(self.__encode_desc(desc_str),
+                                              log_has_timestamps)
+
+    def __encode_desc(self, desc_str):
+
+        if not desc_str:
+            return None
+
+        return [desc.encode('utf-8') for desc in desc_str]
+
+    def scan_range(self, buf, pos, end):
+
+        # Yields a (line offset, HexLine) tuple for each hexdump line in
+        # buf[pos:end]. If pos is not the start of a line, the scanning
+        # starts at the next line.
+        desc_str_invert = self.desc_str_invert
+        for m in self.hexdump_re.finditer(buf, pos, end):
+            (ts, prefix, addr, hexdata) = m.groups()
+
+            if desc_str_invert and \
+               any(desc in prefix for desc in desc_str_invert):
+                continue
+
+            if self.timestamps and ts:
+                ts = ts.decode('ascii')
+            else:
+                ts = None
+
+            yield (m.start(),
+                   HexLine(ts=ts,
+                           addr=int(addr, 16),
+                           data=bytearray(binascii.unhexlify(
+                               hexdata.replace(b' ', b'')))))
+
+    def scan(self, buf):
+
+        # buf can be any bytes like object (bytes, bytearray or mmap)
+        for (offset, hexline) in self.scan_range(buf, 0, len(buf)):
+            yield hexline
+
+    def scan_file(self, path, offset=0, end=None):
+
+        # Yields the hexdump lines of the file, starting at the first line
+        # starting at or after byte offset and ending at byte end (which
+        # must be the start of a line).
+        if get_compression(path):
+            # Compressed files can't be memory mapped. They are
+            # decompressed while they are scanned instead.
+            with open_log(path, binary=True, offset=offset, end=end) as fp:
+                for hexline in self.scan_stream(fp):
+                    yield hexline
+            return
+
+        # The file is memory mapped, so it is never read into memory
+        # as a whole and no per line objects are created for lines
+        # without hexdumps.
+        with open(path, 'rb') as fp:
+            try:
+                buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                return
+            try:
+                if end is None:
+                    end = len(buf)
+                for (_, hexline) in self.scan_range(buf, offset, end):
+                    yield hexline
+            finally:
+                buf.close()
+
+    def scan_stream(self, fp, chunk_size=1 << 20):
+
+        # Used for inputs that can't be memory mapped (pipes, stdin).
+        # fp must be opened in binary mode. The input is read in large
+        # chunks and only complete lines are scanned; the last
+        # (incomplete) line of a chunk is kept until the next chunk
+        # has been read.
+        rest = b''
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                break
+            buf = rest + chunk
+            end = buf.rfind(b'\n') + 1
+            for (offset, hexline) in self.scan_range(buf, 0, end):
+                yield hexline
+            rest = buf[end:]
+
+        if rest:
+            for (offset, hexline) in self.scan_range(rest, 0, len(rest)):
+                yield hexline
+
+    def scan_chunks(self, chunks):
+
+        # chunks is an iterable of bytes blocks with complete lines
+        # (e.g. LogFollower.iter_chunks)
+        for chunk in chunks:
+            for (offset, hexline) in self.scan_range(chunk, 0, len(chunk)):
+                yield hexline
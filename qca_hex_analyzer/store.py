@@ -0,0 +1,196 @@
+import sqlite3
+
+from .idfilter import compile_msg_id_filter
+from .message import Message, get_msg_enum
+
+
+SCHEMA_VERSION = 1
+
+# Number of messages inserted per executemany call. All inserts of an
+# index pass are done in a single transaction.
+_BATCH_SIZE = 10000
+
+_CREATE_TABLES = [
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS messages ('
+    'id INTEGER PRIMARY KEY, '
+    'ts REAL, '
+    'ts_str TEXT, '
+    't2h INTEGER NOT NULL, '
+    'eid INTEGER NOT NULL, '
+    'proto TEXT NOT NULL, '
+    'msg_id INTEGER NOT NULL, '
+    'if_idx INTEGER, '
+    'enum TEXT, '
+    'htc_hdr BLOB NOT NULL, '
+    'payload BLOB NOT NULL, '
+    'trailer BLOB NOT NULL)',
+]
+
+# The indexes are created when all messages of an index pass have been
+# inserted, which is faster than updating them for each insert.
+_CREATE_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts)',
+    'CREATE INDEX IF NOT EXISTS messages_eid ON messages (eid)',
+    'CREATE INDEX IF NOT EXISTS messages_t2h ON messages (t2h)',
+    'CREATE INDEX IF NOT EXISTS messages_msg_id '
+    'ON messages (proto, msg_id)',
+]
+
+_INSERT = 'INSERT INTO messages (ts, ts_str, t2h, eid, proto, msg_id, ' \
+          'if_idx, enum, htc_hdr, payload, trailer) ' \
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+_SELECT = 'SELECT ts_str, t2h, proto, msg_id, if_idx, enum, htc_hdr, ' \
+          'payload, trailer FROM messages'
+
+
+def _id_clause(column, msg_id_filter, negate=False):
+
+    # Condition matching the ids of a compiled id filter. The ids are
+    # integers and are written into the statement, since a filter can have
+    # more items than the maximum number of SQLite parameters.
+    ids = []
+    terms = []
+    for (lo, hi) in msg_id_filter.ranges:
+        if lo == hi:
+            ids.append('{:d}'.format(lo))
+        else:
+            terms.append('{} BETWEEN {:d} AND {:d}'.format(column, lo, hi))
+    if ids:
+        terms.insert(0, '{} IN ({})'.format(column, ', '.join(ids)))
+    if not terms:
+        terms.append('0')
+
+    clause = '({})'.format(' OR '.join(terms))
+    if negate:
+        clause = 'NOT {}'.format(clause)
+    return clause
+
+
+##
+# SQLite message store.
+# Decoded messages are stored in an SQLite database (one row per message,
+# the HTC header, payload and trailer as BLOBs), so that repeated analyses
+# of the same log can be answered by queries instead of decoding the log
+# again.
+# The messages are added with add (in batches, within one transaction) and
+# the indexes (timestamp, endpoint, direction and protocol + message id)
+# are created by close. Messages can be added to an existing database,
+# e.g. the RX and TX dumps of a log in two index passes.
+class MessageStore(object):
+
+    def __init__(self, path):
+
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # The database can always be recreated from the log
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('PRAGMA journal_mode = MEMORY')
+        for sql in _CREATE_TABLES:
+            self.conn.execute(sql)
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?',
+                                ('version',)).fetchone()
+        if row is None:
+            self.conn.execute('INSERT INTO meta VALUES (?, ?)',
+                              ('version', str(SCHEMA_VERSION)))
+        elif int(row[0]) != SCHEMA_VERSION:
+            self.conn.close()
+            raise IOError('{}: unsupported database version {}'.format(
+                path, row[0]))
+        self.rows = []
+
+    def __insert_rows(self):
+
+        if self.rows:
+            self.conn.executemany(_INSERT, self.rows)
+            self.rows = []
+
+    def add(self, msg):
+
+        if msg.ts is not None:
+            ts = float(msg.ts)
+            ts_str = str(msg.ts)
+        else:
+            ts = None
+            ts_str = None
+        if msg.enum:
+            enum = msg.enum.name
+        else:
+            enum = None
+        self.rows.append((ts, ts_str, int(msg.t2h), msg.eid, msg.proto,
+                          msg.msg_id, msg.if_idx, enum,
+                          sqlite3.Binary(msg.htc_hdr_data.tobytes()),
+                          sqlite3.Binary(msg.data.tobytes()),
+                          sqlite3.Binary(msg.trailer.tobytes())))
+        if len(self.rows) >= _BATCH_SIZE:
+            self.__insert_rows()
+
+    def commit(self):
+
+        self.__insert_rows()
+        self.conn.commit()
+
+    def close(self):
+
+        if self.conn is None:
+            return
+
+        self.commit()
+        for sql in _CREATE_INDEXES:
+            self.conn.execute(sql)
+        self.conn.commit()
+        self.conn.close()
+        self.conn = None
+
+    def query(self, proto=None, t2h=None, eid=None, msg_id_filter=None,
+              msg_id_exclude_filter=None, since=None, until=None):
+
+        # Generator yielding the stored messages matching all of the given
+        # filters (None means no filtering) ordered by timestamp. since and
+        # until select the messages with timestamps within [since, until].
+        # Messages with the same (or no) timestamp are yielded in the order
+        # they were added. The id filters are compiled with
+        # compile_msg_id_filter.
+        msg_id_filter = compile_msg_id_filter(msg_id_filter, proto, t2h)
+        msg_id_exclude_filter = compile_msg_id_filter(msg_id_exclude_filter,
+                                                      proto, t2h)
+        where = []
+        args = []
+        if proto is not None:
+            where.append('proto = ?')
+            args.append(proto)
+        if t2h is not None:
+            where.append('t2h = ?')
+            args.append(int(t2h))
+        if eid is not None:
+            where.append('eid = ?')
+            args.append(eid)
+        if since is not None:
+            where.append('ts >= ?')
+            args.append(since)
+        if until is not None:
+            where.append('ts <= ?')
+            args.append(until)
+        if msg_id_filter is not None:
+            where.append(_id_clause('msg_id', msg_id_filter))
+        elif msg_id_exclude_filter is not None:
+            where.append(_id_clause('msg_id', msg_id_exclude_filter,
+                                    negate=True))
+
+        sql = _SELECT
+        if where:
+            sql = '{} WHERE {}'.format(sql, ' AND '.join(where))
+        sql = '{} ORDER BY ts, id'.format(sql)
+
+        for (ts_str, t2h, proto, msg_id, if_idx, enum, htc_hdr, payload,
+             trailer) in self.conn.execute(sql, args):
+            buf = b''.join([bytes(htc_hdr), bytes(payload), bytes(trailer)])
+            msg = Message(buf, len(htc_hdr), t2h=bool(t2h), ts=ts_str)
+            msg.proto = proto
+            msg.msg_id = msg_id
+            msg.if_idx = if_idx
+            if enum is not None:
+                msg.enum = get_msg_enum(proto, t2h, msg_id)
+            msg.freeze()
+            yield msg
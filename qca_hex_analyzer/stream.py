@@ -0,0 +1,178 @@
+import heapq
+import sys
+import hexfilter
+from .wmi_ctrl_analyzer import WmiCtrlAnalyzer
+from .htc_ctrl_analyzer import HtcCtrlAnalyzer
+from .htt_analyzer import HttAnalyzer
+from .all_analyzer import AllAnalyzer
+from .scanner import HexDumpScanner
+from .logfile import open_log
+
+
+def create_hexfilter(desc_str=None, desc_str_invert=None, timestamps=False,
+                     log_has_timestamps=True):
+
+    return hexfilter.HexFilterLinux(skip_timestamps=(not timestamps),
+                                    abs_timestamps=True,
+                                    dump_desc=desc_str,
+                                    dump_desc_invert=desc_str_invert,
+                                    log_has_timestamps=log_has_timestamps,
+                                    include_dump_desc_in_output=False,
+                                    remove_ascii_part=True)
+
+
+def create_scanner(desc_str=None, desc_str_invert=None, timestamps=False,
+                   log_has_timestamps=True):
+
+    return HexDumpScanner(desc_str=desc_str,
+                          desc_str_invert=desc_str_invert,
+                          timestamps=timestamps,
+                          log_has_timestamps=log_has_timestamps)
+
+
+def create_analyzer(mode='all', wmi_ctrl_eid=2, htt_eid=1,
+                    short_htc_hdr=False, wmi_unified=True, timestamps=False,
+                    t2h=False, tlv_analysis=False, msg_id_filter=None,
+                    msg_id_exclude_filter=None, max_stale_lines=128,
+                    wmi_group_filter=None, wmi_group_exclude_filter=None):
+
+    if mode == 'wmi-ctrl':
+        return WmiCtrlAnalyzer(eid=wmi_ctrl_eid,
+                               wmi_unified=wmi_unified,
+                               short_htc_hdr=short_htc_hdr,
+                               timestamps=timestamps,
+                               t2h=t2h,
+                               tlv_analysis=tlv_analysis,
+                               msg_id_filter=msg_id_filter,
+                               msg_id_exclude_filter=msg_id_exclude_filter,
+                               group_filter=wmi_group_filter,
+                               group_exclude_filter=wmi_group_exclude_filter,
+                               max_stale_lines=max_stale_lines)
+    elif mode == 'htc-ctrl':
+        return HtcCtrlAnalyzer(short_htc_hdr=short_htc_hdr,
+                               timestamps=timestamps,
+                               t2h=t2h,
+                               msg_id_filter=msg_id_filter,
+                               msg_id_exclude_filter=msg_id_exclude_filter,
+                               max_stale_lines=max_stale_lines)
+    elif mode == 'htt':
+        return HttAnalyzer(eid=htt_eid,
+                           short_htc_hdr=short_htc_hdr,
+                           timestamps=timestamps,
+                           t2h=t2h,
+                           msg_id_filter=msg_id_filter,
+                           msg_id_exclude_filter=msg_id_exclude_filter,
+                           max_stale_lines=max_stale_lines)
+    elif mode == 'all':
+        return AllAnalyzer(wmi_ctrl_eid=wmi_ctrl_eid,
+                           htt_eid=htt_eid,
+                           wmi_unified=wmi_unified,
+                           short_htc_hdr=short_htc_hdr,
+                           timestamps=timestamps,
+                           t2h=t2h,
+                           max_stale_lines=max_stale_lines,
+                           wmi_group_filter=wmi_group_filter,
+                           wmi_group_exclude_filter=wmi_group_exclude_filter)
+    else:
+        raise ValueError('Unsupported mode: {}'.format(mode))
+
+
+##
+# Generator yielding one HexLine for each hexdump line accepted by the
+# hexfilter hf. The hexdata is decoded by analyzer.
+def iter_hexfilter_lines(lines, hf, analyzer):
+
+    for line in lines:
+        if hf.parse_line(line):
+            yield analyzer.decode_hexdata(hf.get_hex())
+
+
+##
+# Generator yielding one HexLine for each hexdump line in the log file path
+# (stdin if path is None). The hexdump lines are found by the built-in
+# scanner if native_scanner is True, otherwise by hexfilter.
+# If offset is given, the file is read from the first line starting at or
+# after byte offset. If end is given, the file is read up to byte end.
+def iter_log_hexlines(path, analyzer, native_scanner=False, desc_str=None,
+                      desc_str_invert=None, timestamps=False,
+                      log_has_timestamps=True, offset=0, end=None):
+
+    if native_scanner:
+        scanner = create_scanner(desc_str=desc_str,
+                                 desc_str_invert=desc_str_invert,
+                                 timestamps=timestamps,
+                                 log_has_timestamps=log_has_timestamps)
+        if path:
+            return scanner.scan_file(path, offset=offset, end=end)
+        # The scanner works on bytes
+        return scanner.scan_stream(getattr(sys.stdin, 'buffer', sys.stdin))
+
+    if path:
+        lines = open_log(path, offset=offset, end=end)
+    else:
+        lines = sys.stdin
+    hf = create_hexfilter(desc_str=desc_str,
+                          desc_str_invert=desc_str_invert,
+                          timestamps=timestamps,
+                          log_has_timestamps=log_has_timestamps)
+    return iter_hexfilter_lines(lines, hf, analyzer)
+
+
+##
+# Generator yielding the messages decoded by analyzer from hexlines
+def iter_analyzer_messages(analyzer, hexlines):
+
+    for hexline in hexlines:
+        if analyzer.parse_hexline(hexline):
+            yield analyzer.get_message()
+
+
+def _timestamp_keys(messages, index):
+
+    # Messages without timestamp are given the timestamp of the
+    # previous message of the same source
+    ts = 0.0
+    for (seq, msg) in enumerate(messages):
+        if msg.ts is not None:
+            ts = float(msg.ts)
+        yield (ts, index, seq, msg)
+
+
+##
+# Generator merging the messages from several sources (message iterables)
+# into one sequence ordered by timestamp. The messages must have been
+# decoded with timestamps. Messages with the same timestamp are ordered by
+# source (in the order of sources).
+# The sources are read lazily, only one message per source is kept in
+# memory at a time.
+def merge_messages(sources):
+
+    keyed_sources = [_timestamp_keys(messages, index)
+                     for (index, messages) in enumerate(sources)]
+    for (ts, index, seq, msg) in heapq.merge(*keyed_sources):
+        yield msg
+
+
+##
+# Generator yielding one Message for each decoded message in lines.
+# lines can be any iterable of log lines (an open log file, sys.stdin etc.).
+# The log lines are filtered with hexfilter in the same way as the
+# qca_hex_analyzer tool does. All keyword arguments not related to the
+# hexfilter are passed on to create_analyzer.
+# The messages are produced lazily, one line at a time, so the memory usage
+# does not depend on the size of the log.
+def iter_messages(lines, mode='all', desc_str=None, desc_str_invert=None,
+                  log_has_timestamps=True, timestamps=False,
+                  **analyzer_options):
+
+    hf = create_hexfilter(desc_str=desc_str,
+                          desc_str_invert=desc_str_invert,
+                          timestamps=timestamps,
+                          log_has_timestamps=log_has_timestamps)
+    analyzer = create_analyzer(mode, timestamps=timestamps,
+                               **analyzer_options)
+
+    for msg in iter_analyzer_messages(analyzer,
+                                      iter_hexfilter_lines(lines, hf,
+                                                           analyzer)):
+        yield msg
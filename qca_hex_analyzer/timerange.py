@@ -0,0 +1,97 @@
+import mmap
+import re
+
+from .scanner import HexDumpScanner
+
+
+# Timestamp at the start of a line (same format as parse_timestamp)
+_LINE_TS_RE = re.compile(br'^\[\s*([0-9]+\.[0-9]+)\]', re.MULTILINE)
+
+
+def _next_ts(buf, pos):
+
+    # Returns a tuple with the offset and the timestamp of the first line
+    # with a timestamp starting at or after pos or None if there is none.
+    m = _LINE_TS_RE.search(buf, pos)
+    if not m:
+        return None
+    return (m.start(), float(m.group(1)))
+
+
+##
+# Returns the offset of the first line with a timestamp >= ts (> ts if after
+# is True) in buf or len(buf) if there is no such line.
+# The line is found by a binary search over the byte offsets of buf, i.e.
+# only a few lines are read regardless of the size of buf. The timestamps
+# of the log are assumed to be non-decreasing.
+def find_ts_offset(buf, ts, after=False):
+
+    lo = 0
+    hi = len(buf)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        line = _next_ts(buf, mid)
+        if line is None or line[1] > ts or (line[1] == ts and not after):
+            hi = mid
+        else:
+            lo = mid + 1
+
+    line = _next_ts(buf, lo)
+    if line is None:
+        return len(buf)
+    return line[0]
+
+
+##
+# Returns a tuple with the byte range (start, end) of the lines of the log
+# file path with timestamps within [since, until] (None means no limit).
+# start is the offset of the first line with a timestamp >= since.
+# end is the offset of the first frame start (hexdump line with address 0
+# matching the desc_str/desc_str_invert filters) after the last line with a
+# timestamp <= until, so frames started within the range are never cut.
+# end is None if the range extends to the end of the file.
+def find_time_range(path, since=None, until=None, desc_str=None,
+                    desc_str_invert=None):
+
+    with open(path, 'rb') as fp:
+        try:
+            buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped
+            return (0, None)
+        try:
+            start = 0
+            if since is not None:
+                start = find_ts_offset(buf, since)
+
+            end = None
+            if until is not None:
+                until_offset = find_ts_offset(buf, until, after=True)
+                scanner = HexDumpScanner(desc_str=desc_str,
+                                         desc_str_invert=desc_str_invert)
+                for (offset, hexline) in scanner.scan_range(buf, until_offset,
+                                                            len(buf)):
+                    if hexline.addr == 0:
+                        end = offset
+                        break
+        finally:
+            buf.close()
+
+    return (start, end)
+
+
+##
+# Generator yielding the messages with a timestamp within [since, until]
+# (None means no limit). The messages must have been decoded with
+# timestamps. The iteration stops at the first message with a timestamp
+# later than until, so the rest of the input is never read.
+def select_time_range(messages, since=None, until=None):
+
+    for msg in messages:
+        if msg.ts is None:
+            continue
+        ts = float(msg.ts)
+        if until is not None and ts > until:
+            break
+        if since is None or ts >= since:
+            yield msg
@@ -0,0 +1,544 @@
+import argparse
+from enum import Enum
+import operator
+import re
+
+from . import wmi_tlv
+from .wmi_unified import WmiUnified, WmiUnifiedCmd, WmiUnifiedEvt, \
+                         WmiUnifiedCmdGrpId
+from .htt import HttH2tMsgType, HttT2hMsgType
+from .htc_ctrl import HtcCtrlMsgId
+from .wmi_ctrl_analyzer import create_tlv_msg
+
+
+_TOKEN_RE = re.compile(r'\s*(?:'
+                       r'(?P<num>0[xX][0-9a-fA-F]+|[0-9]+\.[0-9]*|[0-9]+)|'
+                       r'(?P<str>\'[^\']*\'|"[^"]*")|'
+                       r'(?P<name>[A-Za-z_][A-Za-z0-9_.]*)|'
+                       r'(?P<op>==|!=|<=|>=|<|>|\(|\)))')
+
+_OPERATORS = {'==': operator.eq,
+              '!=': operator.ne,
+              '<': operator.lt,
+              '<=': operator.le,
+              '>': operator.gt,
+              '>=': operator.ge}
+
+_KEYWORDS = ('and', 'or', 'not')
+
+# Prefix of the names that are always looked up in the TLV message (e.g.
+# tlv.flags, since flags is also a HTC header field)
+_TLV_PREFIX = 'tlv.'
+
+# Value of fields not present in a message. All comparisons with a missing
+# field are false.
+_MISSING = object()
+
+# Cost of the predicates. The operands of and/or are evaluated in order of
+# increasing cost, so the TLV message is only decoded for the messages that
+# pass all header predicates.
+_COST_HEADER = 0
+_COST_TLV = 1
+
+
+def _get_ts(msg):
+
+    if msg.ts is None:
+        return _MISSING
+    return float(msg.ts)
+
+
+def _get_direction(msg):
+
+    if msg.t2h:
+        return 't2h'
+    return 'h2t'
+
+
+def _get_group(msg):
+
+    if msg.proto != 'wmi-ctrl':
+        return _MISSING
+    return WmiUnified.get_cmd_group(msg.msg_id)
+
+
+# Message (header) fields
+_HEADER_FIELDS = {'ts': _get_ts,
+                  'direction': _get_direction,
+                  't2h': lambda msg: int(msg.t2h),
+                  'eid': lambda msg: msg.eid,
+                  'flags': lambda msg: msg.flags,
+                  'length': lambda msg: msg.length,
+                  'ctrl0': lambda msg: msg.ctrl0,
+                  'ctrl1': lambda msg: msg.ctrl1,
+                  'data_len': lambda msg: msg.data_len,
+                  'proto': lambda msg: msg.proto,
+                  'msg_id': lambda msg: msg.msg_id,
+                  'id': lambda msg: msg.msg_id,
+                  'if_idx': lambda msg: msg.if_idx,
+                  'enum': lambda msg: msg.enum,
+                  'group': _get_group}
+
+
+def _get_tlv_field_names():
+
+    # Names of the fields of all decoded TLV structures (the namedtuples of
+    # wmi_tlv)
+    names = set()
+    for value in vars(wmi_tlv).values():
+        if isinstance(value, type) and issubclass(value, tuple) and \
+           hasattr(value, '_fields'):
+            names.update(value._fields)
+    return names
+
+
+_TLV_FIELDS = _get_tlv_field_names()
+
+
+def _get_enum_names(enums):
+
+    names = set()
+    for enum in enums:
+        names.update(name.upper() for name in enum.__members__)
+    return frozenset(names)
+
+
+# Names a symbol can stand for, by the field it is compared with
+_MSG_ENUM_NAMES = _get_enum_names([WmiUnifiedCmd, WmiUnifiedEvt,
+                                   HttH2tMsgType, HttT2hMsgType,
+                                   HtcCtrlMsgId])
+_TLV_ENUM_NAMES = _get_enum_names(
+    [value for value in vars(wmi_tlv).values()
+     if isinstance(value, type) and issubclass(value, Enum)])
+_SYMBOL_NAMES = {'enum': _MSG_ENUM_NAMES,
+                 'group': _get_enum_names([WmiUnifiedCmdGrpId]),
+                 'proto': frozenset(['WMI-CTRL', 'HTT', 'HTC-CTRL']),
+                 'direction': frozenset(['H2T', 'T2H'])}
+
+
+##
+# A name that is neither a header nor a TLV field, e.g. an enum name.
+# Symbols match enums by name (case insensitive). The name may be given
+# without the enum prefix: BEACON_INTERVAL matches
+# WMI_TLV_VDEV_PARAM_BEACON_INTERVAL. A name without prefix must match a
+# single enum name (see get_matches and resolve). Symbols are compared with
+# strings (case insensitive) as well, e.g. proto == htt.
+class _Symbol(object):
+
+    def __init__(self, name):
+
+        self.name = name.upper()
+
+    def get_matches(self, names):
+
+        # Returns the sorted list of names (upper case) the symbol matches:
+        # the symbol itself or, if it isn't one of names, all names ending
+        # with _<symbol>
+        if self.name in names:
+            return [self.name]
+        suffix = '_' + self.name
+        return sorted(name for name in names if name.endswith(suffix))
+
+    def resolve(self, name):
+
+        # Replaces the symbol with the full name it matches
+        self.name = name
+
+    def matches(self, value):
+
+        if isinstance(value, Enum):
+            return value.name.upper() == self.name
+        if isinstance(value, (type(''), type(u''))):
+            return value.upper() == self.name
+        return False
+
+
+##
+# Per message evaluation state. The TLV message is decoded the first time a
+# TLV field is read and only once per message. Messages already decoded
+# with TLV analysis (--tlv) are not decoded again.
+class _Record(object):
+
+    __slots__ = ('msg', 'tlv_tuples')
+
+    def __init__(self, msg):
+
+        self.msg = msg
+        self.tlv_tuples = None
+
+    def get_tlv_tuples(self):
+
+        if self.tlv_tuples is None:
+            msg = self.msg
+            tlv_msg = msg.tlv_msg
+            if tlv_msg is None and msg.proto == 'wmi-ctrl' and not msg.t2h:
+                tlv_msg = create_tlv_msg(msg.enum, msg.data[4:])
+            if tlv_msg is not None:
+                # TLVs too short to be decoded are left out
+                self.tlv_tuples = tlv_msg.get_tuples()
+            else:
+                self.tlv_tuples = []
+        return self.tlv_tuples
+
+
+def _compile_header_field(name):
+
+    get = _HEADER_FIELDS[name]
+
+    def get_field(rec):
+
+        value = get(rec.msg)
+        if value is None:
+            return _MISSING
+        return value
+
+    return get_field
+
+
+def _compile_tlv_field(path):
+
+    name = path[0]
+    sub_names = path[1:]
+
+    def get_field(rec):
+
+        for ntup in rec.get_tlv_tuples():
+            if name in ntup._fields:
+                value = getattr(ntup, name)
+                for sub_name in sub_names:
+                    if value is None:
+                        break
+                    value = getattr(value, sub_name, None)
+                if value is None:
+                    return _MISSING
+                return value
+        return _MISSING
+
+    return get_field
+
+
+def _compare(cmp, left, right):
+
+    if left is _MISSING or right is _MISSING:
+        return False
+    if isinstance(left, _Symbol):
+        (left, right) = (right, left)
+    if isinstance(right, _Symbol):
+        # Only == and != are allowed with symbols
+        if isinstance(left, _Symbol):
+            matched = left.name == right.name
+        else:
+            matched = right.matches(left)
+        if cmp is operator.eq:
+            return matched
+        return not matched
+    if isinstance(left, Enum):
+        left = left.value
+    if isinstance(right, Enum):
+        right = right.value
+    try:
+        return cmp(left, right)
+    except TypeError:
+        # E.g. a string compared with a number
+        return False
+
+
+##
+# Recursive descent parser of --where expressions. Each rule returns a
+# tuple with the compiled closure and its cost.
+class _Parser(object):
+
+    def __init__(self, expression):
+
+        self.expression = expression
+        self.tokens = self.__tokenize(expression)
+        self.pos = 0
+
+    def __tokenize(self, expression):
+
+        tokens = []
+        pos = 0
+        expression = expression.rstrip()
+        while pos < len(expression):
+            m = _TOKEN_RE.match(expression, pos)
+            if not m:
+                raise ValueError('Syntax error at: {}'.format(
+                    expression[pos:].strip()))
+            kind = m.lastgroup
+            value = m.group(kind)
+            if kind == 'name' and value.lower() in _KEYWORDS:
+                kind = value.lower()
+            tokens.append((kind, value))
+            pos = m.end()
+        return tokens
+
+    def __peek(self):
+
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def __next(self):
+
+        token = self.__peek()
+        self.pos += 1
+        return token
+
+    def __expect(self, value):
+
+        (_, token_value) = self.__next()
+        if token_value != value:
+            raise ValueError('Expected {} in: {}'.format(value,
+                                                         self.expression))
+
+    def parse(self):
+
+        if not self.tokens:
+            raise ValueError('Empty expression')
+        (pred, _) = self.__parse_or()
+        (kind, value) = self.__peek()
+        if kind is not None:
+            raise ValueError('Syntax error at: {}'.format(value))
+        return pred
+
+    def __parse_bool_op(self, keyword, parse_operand, combine):
+
+        operands = [parse_operand()]
+        while self.__peek()[0] == keyword:
+            self.__next()
+            operands.append(parse_operand())
+        if len(operands) == 1:
+            return operands[0]
+
+        # sorted is stable, so operands of equal cost keep their order
+        operands = sorted(operands, key=lambda operand: operand[1])
+        preds = [pred for (pred, _) in operands]
+        return (combine(preds), operands[-1][1])
+
+    def __parse_or(self):
+
+        def combine(preds):
+
+            def pred_or(rec):
+
+                for pred in preds:
+                    if pred(rec):
+                        return True
+                return False
+
+            return pred_or
+
+        return self.__parse_bool_op('or', self.__parse_and, combine)
+
+    def __parse_and(self):
+
+        def combine(preds):
+
+            def pred_and(rec):
+
+                for pred in preds:
+                    if not pred(rec):
+                        return False
+                return True
+
+            return pred_and
+
+        return self.__parse_bool_op('and', self.__parse_not, combine)
+
+    def __parse_not(self):
+
+        if self.__peek()[0] == 'not':
+            self.__next()
+            (pred, cost) = self.__parse_not()
+            return (lambda rec: not pred(rec), cost)
+        return self.__parse_comparison()
+
+    def __parse_comparison(self):
+
+        if self.__peek()[1] == '(':
+            self.__next()
+            result = self.__parse_or()
+            self.__expect(')')
+            return result
+
+        left = self.__parse_operand()
+        (kind, op) = self.__peek()
+        if kind != 'op' or op not in _OPERATORS:
+            return self.__compile_test(left)
+
+        self.__next()
+        right = self.__parse_operand()
+        return self.__compile_comparison(op, left, right)
+
+    def __parse_operand(self):
+
+        # Returns a tuple with the kind of the operand ('const', 'symbol'
+        # or 'field'), the constant, symbol or getter, the cost and the
+        # name (None for constants)
+        (kind, value) = self.__next()
+        if kind == 'num':
+            if value[:2] in ('0x', '0X'):
+                return ('const', int(value, 16), _COST_HEADER, None)
+            if '.' in value:
+                return ('const', float(value), _COST_HEADER, None)
+            return ('const', int(value), _COST_HEADER, None)
+        if kind == 'str':
+            return ('const', value[1:-1], _COST_HEADER, None)
+        if kind == 'name':
+            return self.__compile_name(value)
+        if kind is None:
+            raise ValueError('Unexpected end of expression: {}'.format(
+                self.expression))
+        raise ValueError('Syntax error at: {}'.format(value))
+
+    def __compile_name(self, name):
+
+        if name.startswith(_TLV_PREFIX):
+            path = name[len(_TLV_PREFIX):].split('.')
+            if path[0] not in _TLV_FIELDS:
+                raise ValueError('Unknown TLV field: {}'.format(name))
+            return ('field', _compile_tlv_field(path), _COST_TLV, name)
+
+        path = name.split('.')
+        if len(path) == 1 and name in _HEADER_FIELDS:
+            return ('field', _compile_header_field(name), _COST_HEADER,
+                    name)
+        if path[0] in _TLV_FIELDS:
+            return ('field', _compile_tlv_field(path), _COST_TLV, name)
+        if len(path) > 1:
+            raise ValueError('Unknown field: {}'.format(name))
+        # Symbols are validated once the field they are compared with is
+        # known
+        return ('symbol', _Symbol(name), _COST_HEADER, name)
+
+    def __check_symbol(self, operand, field_name):
+
+        # Resolves the symbol operand to one of the enum names (or string
+        # values) of field field_name (None if the symbol is not compared
+        # with a field). Raises ValueError if it matches none or more than
+        # one of them.
+        (_, symbol, _, name) = operand
+        if field_name in _SYMBOL_NAMES:
+            names = _SYMBOL_NAMES[field_name]
+        elif field_name is None or field_name in _HEADER_FIELDS:
+            names = None
+        else:
+            # TLV fields
+            names = _TLV_ENUM_NAMES
+        if names is None:
+            matches = []
+        else:
+            matches = symbol.get_matches(names)
+        if not matches:
+            raise ValueError('Unknown field or symbol: {}'.format(name))
+        if len(matches) > 1:
+            raise ValueError('Ambiguous symbol: {} (matches {})'.format(
+                name, ', '.join(matches)))
+        symbol.resolve(matches[0])
+
+    def __compile_test(self, operand):
+
+        # An operand used as a predicate. A symbol is a shorthand for
+        # enum == symbol (e.g. WMI_VDEV_SET_PARAM_CMDID or MGMT_TX_COMPL_IND).
+        (kind, value, cost, _) = operand
+        if kind == 'symbol':
+            symbol = value
+            self.__check_symbol(operand, 'enum')
+            return (lambda rec: symbol.matches(rec.msg.enum), cost)
+        if kind == 'const':
+            result = bool(value)
+            return (lambda rec: result, cost)
+
+        get = value
+
+        def test(rec):
+
+            field = get(rec)
+            return field is not _MISSING and bool(field)
+
+        return (test, cost)
+
+    def __compile_comparison(self, op, left, right):
+
+        (left_kind, left_value, left_cost, left_name) = left
+        (right_kind, right_value, right_cost, right_name) = right
+        if 'symbol' in (left_kind, right_kind) and op not in ('==', '!='):
+            raise ValueError('Only == and != can be used with names that '
+                             'are not fields: {}'.format(self.expression))
+        if left_kind == 'symbol':
+            field_name = None
+            if right_kind == 'field':
+                field_name = right_name
+            self.__check_symbol(left, field_name)
+        if right_kind == 'symbol':
+            field_name = None
+            if left_kind == 'field':
+                field_name = left_name
+            self.__check_symbol(right, field_name)
+
+        cmp = _OPERATORS[op]
+        cost = max(left_cost, right_cost)
+        if left_kind == 'field' and right_kind != 'field':
+            # The common case: field op constant
+            get = left_value
+
+            def compare_const(rec):
+
+                return _compare(cmp, get(rec), right_value)
+
+            return (compare_const, cost)
+
+        if left_kind == 'field':
+            get_left = left_value
+        else:
+            get_left = lambda rec: left_value
+        if right_kind == 'field':
+            get_right = right_value
+        else:
+            get_right = lambda rec: right_value
+
+        def compare(rec):
+
+            return _compare(cmp, get_left(rec), get_right(rec))
+
+        return (compare, cost)
+
+
+##
+# Compiles a filter expression into a predicate (a function taking a
+# Message and returning True if the message matches the expression).
+# The expression is parsed once. Grammar:
+#   expr       := and_expr ('or' and_expr)*
+#   and_expr   := not_expr ('and' not_expr)*
+#   not_expr   := 'not' not_expr | '(' expr ')' | operand [op operand]
+#   op         := '==' | '!=' | '<' | '<=' | '>' | '>='
+#   operand    := number | 'string' | name
+# A name is a message field (ts, direction, t2h, eid, flags, length, ctrl0,
+# ctrl1, data_len, proto, msg_id, id, if_idx, enum, group), a field of the
+# decoded WMI TLV message (e.g. vdev_id, param_id, wmi_chan.mhz or, to
+# override a message field with the same name, tlv.flags) or a symbol (e.g.
+# an enum name, see _Symbol). A symbol alone is a shorthand for
+# enum == symbol. Symbols must be names of the enum (or string) values of
+# the field they are compared with, so misspelled field names are errors.
+# Comparisons with fields that are not present in a message are false.
+# TLV messages are decoded lazily: and/or evaluate the message field
+# predicates first and only messages passing them are TLV decoded.
+# Raises ValueError if the expression is not valid.
+def compile_where(expression):
+
+    pred = _Parser(expression).parse()
+
+    def where(msg):
+
+        return pred(_Record(msg))
+
+    return where
+
+
+def where_spec(value):
+
+    # argparse type of the --where option. Returns the compiled expression.
+    try:
+        return compile_where(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError('{}'.format(err))
@@ -1,7 +1,14 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+import struct
 from abc import ABCMeta, abstractmethod
 from enum import Enum, unique
 
+try:
+    _INTEGER_TYPES = (int, long)
+except NameError:
+    # python 3 has no long
+    _INTEGER_TYPES = (int,)
+
 
 TlvHeader = namedtuple('TlvHeader',
                        ['length', 'tag'],
@@ -110,27 +117,30 @@ StaPowerSaveParamMsg = namedtuple('StaPowerSaveParamMsg',
 
 def _create_le32(data):
 
-    le32_val1 = int(data[0], 16)
-    le32_val2 = int(data[1], 16)
-    le32_val3 = int(data[2], 16)
-    le32_val4 = int(data[3], 16)
-    le32_val = ((le32_val4 << 24) & 0xFF000000) | \
-               ((le32_val3 << 16) & 0xFF0000) | \
-               ((le32_val2 << 8) & 0xFF00) | \
-               (le32_val1 & 0xFF)
-    return le32_val
+    return struct.unpack_from('<I', data)[0]
 
 
 def _create_le16(data):
 
-    le16_val1 = int(data[0], 16)
-    le16_val2 = int(data[1], 16)
-    le16_val = ((le16_val2 << 8) & 0xFF00) | (le16_val1 & 0xFF)
-    return le16_val
+    return struct.unpack_from('<H', data)[0]
+
+
+def _create_u8(data):
+
+    return struct.unpack_from('<B', data)[0]
+
+
+def _create_hex_list(data):
+
+    return ['{:02x}'.format(x) for x in bytearray(data)]
 
 
 def _create_tlv_hdr(data):
 
+    # Returns None if data is too short for a TLV header
+    if len(data) < 4:
+        return None
+
     tlv_len = _create_le16(data[0:2])
     tlv_tag = _create_le16(data[2:4])
     try:
@@ -154,19 +164,41 @@ def _isnamedtupleinstance(x):
     return all(type(n) == str for n in f)
 
 
+def _format_named_tuple(ntup, lines, pre_string=""):
+
+    lines.append("%s%s:\n" % (pre_string, type(ntup).__name__))
+    for name, value in zip(ntup._fields, ntup):
+        if _isnamedtupleinstance(value):
+            _format_named_tuple(value, lines, pre_string + "  ")
+        elif isinstance(value, Enum):
+            lines.append("%s  %s: 0x%x (%s)\n" %
+                         (pre_string, name, value.value, value.name))
+        elif isinstance(value, _INTEGER_TYPES):
+            lines.append("%s  %s: 0x%x\n" % (pre_string, name, value))
+        else:
+            lines.append("%s  %s: %s\n" % (pre_string, name, value))
+
+
 def _print_named_tuple(ntup, fp, pre_string=""):
 
-    fp.write("%s%s:\n" % (pre_string, type(ntup).__name__))
-    for name, value in ntup._asdict().iteritems():
+    # All fields are formatted first and written with a single write
+    lines = []
+    _format_named_tuple(ntup, lines, pre_string)
+    fp.write(''.join(lines))
+
+
+def _named_tuple_to_dict(ntup):
+
+    d = OrderedDict()
+    for name, value in zip(ntup._fields, ntup):
         if _isnamedtupleinstance(value):
-            _print_named_tuple(value, fp, pre_string + "  ")
+            d[name] = _named_tuple_to_dict(value)
         elif isinstance(value, Enum):
-            fp.write("%s  %s: 0x%x (%s)\n" %
-                     (pre_string, name, value.value, value.name))
-        elif isinstance(value, (int, long)):
-            fp.write("%s  %s: 0x%x\n" % (pre_string, name, value))
+            d[name] = OrderedDict([('value', value.value),
+                                   ('name', value.name)])
         else:
-            fp.write("%s  %s: %s\n" % (pre_string, name, value))
+            d[name] = value
+    return d
 
 
 class WmiTlvMsg:
@@ -176,13 +208,33 @@ class WmiTlvMsg:
 
         pass
 
+    def get_tuples(self):
+
+        # Returns the decoded TLVs (namedtuples). TLVs too short to be
+        # decoded are None and left out.
+        if self.tlv_msg is None:
+            return []
+        return [self.tlv_msg]
+
+    def get_dict(self):
+
+        # Returns the decoded TLVs as a dict (keyed by the name of the
+        # TLV type), suitable for JSON serialization.
+        d = OrderedDict()
+        for ntup in self.get_tuples():
+            d[type(ntup).__name__] = _named_tuple_to_dict(ntup)
+        return d
+
 
 class WmiTlvMsgInit(WmiTlvMsg):
 
     def __init__(self, data):
 
+        self.tlv_init = None
+        self.tlv_resource_cfg = None
+
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 12:
+        if tlv_hdr is None or tlv_hdr.length < 12 or len(data) < 32:
             return None
 
         abi_ver0 = _create_le32(data[4:8])
@@ -205,7 +257,7 @@ class WmiTlvMsgInit(WmiTlvMsg):
                                       num_host_mem_chunks=num_host_mem_chunks)
 
         tlv_hdr = _create_tlv_hdr(data[32:])
-        if tlv_hdr.length < 12:
+        if tlv_hdr is None or tlv_hdr.length < 12 or len(data) < 192:
             return None
 
         cfg_data = data[36:]
@@ -288,10 +340,15 @@ class WmiTlvMsgInit(WmiTlvMsg):
                                                      max_tdls_concurrent_sleep_sta=max_tdls_concurrent_sleep_sta,
                                                      max_tdls_concurrent_buffer_sta=max_tdls_concurrent_buffer_sta)
 
+    def get_tuples(self):
+
+        return [ntup for ntup in (self.tlv_init, self.tlv_resource_cfg)
+                if ntup is not None]
+
     def print_data(self, fp):
 
-        _print_named_tuple(self.tlv_init, fp)
-        _print_named_tuple(self.tlv_resource_cfg, fp)
+        for ntup in self.get_tuples():
+            _print_named_tuple(ntup, fp)
 
 
 class WmiTlvMsgPdevSetParam(WmiTlvMsg):
@@ -299,7 +356,8 @@ class WmiTlvMsgPdevSetParam(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 12:
+        if tlv_hdr is None or tlv_hdr.length < 12 or len(data) < 16:
+            self.tlv_msg = None
             return None
 
         param = _create_le32(data[8:12])
@@ -324,7 +382,8 @@ class WmiTlvMsgPdevSetRegDomain(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 24:
+        if tlv_hdr is None or tlv_hdr.length < 24 or len(data) < 28:
+            self.tlv_msg = None
             return None
 
         pdev_id = _create_le32(data[4:8])
@@ -352,13 +411,14 @@ class WmiTlvMsgVdevCreate(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 20:
+        if tlv_hdr is None or tlv_hdr.length < 20 or len(data) < 24:
+            self.tlv_msg = None
             return None
 
         vdev_id = _create_le32(data[4:8])
         vdev_type = _create_le32(data[8:12])
         vdev_subtype = _create_le32(data[12:16])
-        mac_addr = data[16:24]
+        mac_addr = _create_hex_list(data[16:24])
 
         self.tlv_msg = VdevCreateMsg(tlv_hdr=tlv_hdr,
                                      vdev_id=vdev_id,
@@ -376,7 +436,8 @@ class WmiTlvMsgVdevStartReq(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 72:
+        if tlv_hdr is None or tlv_hdr.length < 72 or len(data) < 76:
+            self.tlv_msg = None
             return None
 
         vdev_id = _create_le32(data[4:8])
@@ -385,7 +446,7 @@ class WmiTlvMsgVdevStartReq(WmiTlvMsg):
         dtim_period = _create_le32(data[16:20])
         flags = _create_le32(data[20:24])
         ssid_len = _create_le32(data[24:28])
-        ssid = data[28:60]
+        ssid = _create_hex_list(data[28:60])
         bcn_tx_rate = _create_le32(data[60:64])
         bcn_tx_power = _create_le32(data[64:68])
         num_noa_descr = _create_le32(data[68:72])
@@ -394,18 +455,20 @@ class WmiTlvMsgVdevStartReq(WmiTlvMsg):
         wmi_chan = None
         next_tlv_offset = tlv_hdr.length + 4
         tlv_hdr2 = _create_tlv_hdr(data[next_tlv_offset:])
-        if len(data) >= tlv_hdr.length + tlv_hdr2.length:
+        if tlv_hdr2 is not None and \
+           len(data) >= tlv_hdr.length + tlv_hdr2.length and \
+           len(data) >= next_tlv_offset + 26:
             ch_data = data[next_tlv_offset + 4:]
             mhz = _create_le32(ch_data[0:4])
             band_center_freq1 = _create_le32(ch_data[4:8])
             band_center_freq2 = _create_le32(ch_data[8:12])
-            mode = int(ch_data[12], 16)
-            min_power = int(ch_data[16], 16)
-            max_power = int(ch_data[17], 16)
-            reg_power = int(ch_data[18], 16)
-            reg_classid = int(ch_data[19], 16)
-            antenna_max = int(ch_data[20], 16)
-            max_tx_power = int(ch_data[21], 16)
+            mode = _create_u8(ch_data[12:])
+            min_power = _create_u8(ch_data[16:])
+            max_power = _create_u8(ch_data[17:])
+            reg_power = _create_u8(ch_data[18:])
+            reg_classid = _create_u8(ch_data[19:])
+            antenna_max = _create_u8(ch_data[20:])
+            max_tx_power = _create_u8(ch_data[21:])
 
             wmi_chan = WmiChannel(tlv_hdr=tlv_hdr2,
                                   mhz=mhz,
@@ -443,7 +506,8 @@ class WmiTlvMsgVdevSetParam(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 12:
+        if tlv_hdr is None or tlv_hdr.length < 12 or len(data) < 16:
+            self.tlv_msg = None
             return None
 
         vdev_id = _create_le32(data[4:8])
@@ -470,17 +534,18 @@ class WmiTlvMsgPeerCreate(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 16:
+        if tlv_hdr is None or tlv_hdr.length < 16 or len(data) < 20:
+            self.tlv_msg = None
             return None
 
         vdev_id = _create_le32(data[4:])
-        peer_addr = data[8:16]
+        peer_addr = _create_hex_list(data[8:16])
         peer_type = _create_le32(data[16:])
 
         try:
             peer_type_enum = WmiTlvPeerType(peer_type)
         except ValueError:
-            peer_type_enum = WmiTlvPeerType.WMI_PEER_TYPE_UNKNOWN
+            peer_type_enum = WmiTlvPeerType.WMI_TLV_PEER_TYPE_UNKNOWN
 
         self.tlv_msg = PeerCreateMsg(tlv_hdr=tlv_hdr,
                                      vdev_id=vdev_id,
@@ -497,11 +562,12 @@ class WmiTlvMsgPeerSetParam(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 20:
+        if tlv_hdr is None or tlv_hdr.length < 20 or len(data) < 24:
+            self.tlv_msg = None
             return None
 
         vdev_id = _create_le32(data[4:])
-        peer_macaddr = data[8:16]
+        peer_macaddr = _create_hex_list(data[8:16])
         param_id = _create_le32(data[16:])
         param_value = _create_le32(data[20:])
 
@@ -526,7 +592,8 @@ class WmiTlvStaPowerSaveParam(WmiTlvMsg):
     def __init__(self, data):
 
         tlv_hdr = _create_tlv_hdr(data)
-        if tlv_hdr.length < 12:
+        if tlv_hdr is None or tlv_hdr.length < 12 or len(data) < 16:
+            self.tlv_msg = None
             return None
 
         vdev_id = _create_le32(data[4:])
@@ -1064,6 +1131,7 @@ class WmiTlvPeerType(Enum):
     WMI_TLV_PEER_TYPE_TDLS = 2
     WMI_TLV_PEER_TYPE_HOST_MAX = 127
     WMI_TLV_PEER_TYPE_ROAMOFFLOAD_TMP = 128
+    WMI_TLV_PEER_TYPE_UNKNOWN = 0xFFFF
 
 
 @unique
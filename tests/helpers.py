@@ -0,0 +1,129 @@
+import os
+import struct
+import subprocess
+import sys
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+DATA_DIR = os.path.join(TESTS_DIR, 'data')
+
+# Synthetic ath10k log (written with hexdump_lines) with host to target
+# ('htc tx') and target to host ('htc rx') hexdumps of WMI (eid 2), HTT
+# (eid 1) and HTC control (eid 0) messages, single and multi line frames
+# and a few lines without hexdumps.
+SAMPLE_LOG = os.path.join(DATA_DIR, 'sample.log')
+
+WMI_EID = 2
+HTT_EID = 1
+HTC_CTRL_EID = 0
+
+_PREFIX = 'ath10k_pci 0000:01:00.0'
+
+
+def htc_frame(eid, payload, trailer=b'', flags=0, short_htc_hdr=False):
+
+    # Returns the HTC frame (HTC header, payload and trailer) as bytes.
+    # ctrl0 is the trailer length.
+    length = len(payload) + len(trailer)
+    if short_htc_hdr:
+        hdr = struct.pack('<BBHBB', eid, flags, length, len(trailer), 0)
+    else:
+        hdr = struct.pack('<BBHBB2x', eid, flags, length, len(trailer), 0)
+    return hdr + payload + trailer
+
+
+def wmi_payload(msg_id, data=b'', if_idx=0):
+
+    # WMI unified header (24 bit id, 8 bit interface index) and data
+    return struct.pack('<I', (if_idx << 24) | msg_id) + data
+
+
+def tlv(tag, data):
+
+    return struct.pack('<HH', len(data), tag) + data
+
+
+def hexdump_lines(buf, desc='htc tx', ts=None, prefix=_PREFIX):
+
+    # Returns the log lines (print_hex_dump with DUMP_PREFIX_OFFSET and the
+    # ASCII column) of buf. ts is the timestamp of the first line, each
+    # following line is 1 us later.
+    buf = bytearray(buf)
+    lines = []
+    for i in range(0, len(buf), 16):
+        data = buf[i:i + 16]
+        hex_str = ' '.join('{:02x}'.format(x) for x in data)
+        ascii_str = ''.join(chr(x) if 32 <= x < 127 else '.' for x in data)
+        line = '{}: {}: {:08x}: {:<47}  {}\n'.format(prefix, desc, i,
+                                                     hex_str, ascii_str)
+        if ts is not None:
+            line = '[{:12.6f}] {}'.format(ts + i // 16 * 0.000001, line)
+        lines.append(line)
+    return lines
+
+
+def hexdata_lines(buf, addr=0):
+
+    # Returns the hexdump lines of buf as passed on to the analyzers by the
+    # hexfilter (address and hex values only)
+    buf = bytearray(buf)
+    return ['{:08x}: {}'.format(addr + i,
+                                ' '.join('{:02x}'.format(x)
+                                         for x in buf[i:i + 16]))
+            for i in range(0, len(buf), 16)]
+
+
+def write_log(path, lines):
+
+    with open(path, 'w') as fp:
+        fp.writelines(lines)
+
+
+def read_lines(path):
+
+    with open(path) as fp:
+        return fp.readlines()
+
+
+class ToolError(Exception):
+
+    pass
+
+
+def run_tool_stderr(*args):
+
+    # Runs the qca_hex_analyzer command and returns a tuple with its
+    # output (stdout) and its error output (stderr). stdin is closed, so an
+    # unexpected exception never waits in pdb.
+    with open(os.devnull) as null:
+        proc = subprocess.Popen([sys.executable, '-m', 'qca_hex_analyzer'] +
+                                list(args),
+                                cwd=ROOT_DIR, stdin=null,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        (out, err) = proc.communicate()
+    return (out, err)
+
+
+def run_tool(*args):
+
+    # Runs the qca_hex_analyzer command and returns its output. Errors
+    # reported by the tool are raised as ToolError.
+    (out, err) = run_tool_stderr(*args)
+    if err:
+        raise ToolError(err.strip())
+    return out
+
+
+def split_messages(output):
+
+    # Splits the text output of the tool into one string per message
+    messages = []
+    for line in output.splitlines(True):
+        if ' msg id: ' in line or not messages:
+            messages.append(line)
+        else:
+            messages[-1] += line
+    return messages
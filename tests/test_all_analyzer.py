@@ -0,0 +1,82 @@
+import struct
+import unittest
+
+from qca_hex_analyzer import create_analyzer
+
+from tests.helpers import WMI_EID, HTT_EID, htc_frame, wmi_payload, \
+                          hexdata_lines
+
+
+def _parse_lines(analyzer, lines):
+
+    messages = []
+    for line in lines:
+        if analyzer.parse_hexdata(line):
+            messages.append(analyzer.get_message())
+    return messages
+
+
+class TestInterleavedFrames(unittest.TestCase):
+
+    def test_frames_of_different_endpoints(self):
+
+        wmi = htc_frame(WMI_EID, wmi_payload(0x7006, b'\xaa' * 40))
+        htt = htc_frame(HTT_EID, struct.pack('<BB', 3, 0) + b'\xbb' * 30)
+        wmi_lines = hexdata_lines(wmi)
+        htt_lines = hexdata_lines(htt)
+        self.assertEqual((len(wmi_lines), len(htt_lines)), (4, 3))
+
+        # The HTT frame begins after the second WMI line, so the lines of
+        # the two frames never have the same address
+        lines = wmi_lines[0:2]
+        for i in range(len(htt_lines)):
+            lines.append(htt_lines[i])
+            if i + 2 < len(wmi_lines):
+                lines.append(wmi_lines[i + 2])
+
+        analyzer = create_analyzer('all')
+        messages = _parse_lines(analyzer, lines)
+        self.assertEqual([bytes(msg.buf) for msg in messages], [wmi, htt])
+        self.assertEqual([msg.proto for msg in messages], ['wmi-ctrl', 'htt'])
+
+    def test_most_recent_frame_wins(self):
+
+        # Both frames expect their second line at address 0x10. The first
+        # one goes to the HTT frame, which began last.
+        wmi = htc_frame(WMI_EID, wmi_payload(0x1d001, b'\xaa' * 20))
+        htt = htc_frame(HTT_EID, struct.pack('<BB', 3, 0) + b'\xbb' * 20)
+        wmi_lines = hexdata_lines(wmi)
+        htt_lines = hexdata_lines(htt)
+
+        analyzer = create_analyzer('all')
+        messages = _parse_lines(analyzer, [wmi_lines[0], htt_lines[0],
+                                           htt_lines[1], wmi_lines[1]])
+        self.assertEqual([bytes(msg.buf) for msg in messages], [htt, wmi])
+
+
+class TestStaleFrames(unittest.TestCase):
+
+    def test_stale_frame_is_expired(self):
+
+        wmi = htc_frame(WMI_EID, wmi_payload(0x7006, b'\xaa' * 40))
+        htt = htc_frame(HTT_EID, struct.pack('<BB', 3, 0) + b'\xbb' * 4)
+        wmi_lines = hexdata_lines(wmi)
+        lines = wmi_lines[0:2] + hexdata_lines(htt) * 3 + wmi_lines[2:]
+
+        # The rest of the WMI frame comes after three lines of other frames.
+        # A frame is given up if none of the last max_stale_lines lines
+        # belonged to it.
+        analyzer = create_analyzer('all', max_stale_lines=4)
+        messages = _parse_lines(analyzer, lines)
+        self.assertEqual([bytes(msg.buf) for msg in messages],
+                         [htt] * 3 + [wmi])
+
+        analyzer = create_analyzer('all', max_stale_lines=3)
+        messages = _parse_lines(analyzer, lines)
+        self.assertEqual([bytes(msg.buf) for msg in messages], [htt] * 3)
+        stats = analyzer.get_stats()
+        self.assertEqual(stats.truncated_frames, 1)
+        self.assertEqual(stats.dropped_lines, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import struct
+import unittest
+
+from qca_hex_analyzer import HexLine, WmiCtrlAnalyzer, AllAnalyzer
+from qca_hex_analyzer.analyzer import STATE_DUMP
+
+from tests.helpers import WMI_EID, HTT_EID, htc_frame, wmi_payload, tlv, \
+                          hexdata_lines
+
+
+def _parse_frame(analyzer, buf):
+
+    # Feeds the hexdump lines of buf to analyzer. Returns the data of the
+    # completed messages.
+    messages = []
+    for line in hexdata_lines(buf):
+        if analyzer.parse_hexdata(line):
+            messages.append(bytes(analyzer.get_data()))
+    return messages
+
+
+class TestByteBuffers(unittest.TestCase):
+
+    def test_message_data_spans_lines(self):
+
+        payload = wmi_payload(0x5008, tlv(95, struct.pack('<III', 1, 3, 100)))
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        self.assertEqual(_parse_frame(analyzer, htc_frame(WMI_EID, payload)),
+                         [payload])
+
+    def test_padding_after_message_is_dropped(self):
+
+        payload = wmi_payload(0x1d001, b'\x01\x02\x03\x04')
+        frame = htc_frame(WMI_EID, payload)
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        self.assertEqual(_parse_frame(analyzer, frame + b'\x00' * 20),
+                         [payload])
+
+    def test_trailer_is_split_from_data(self):
+
+        # The trailer ends on the same line as the data
+        payload = wmi_payload(0x2, b'\x05' * 8)
+        trailer = b'\x02\x02\x01\x00'
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID, t2h=True)
+        self.assertEqual(_parse_frame(analyzer,
+                                      htc_frame(WMI_EID, payload, trailer)),
+                         [payload])
+        self.assertEqual(bytes(analyzer.get_message().trailer), trailer)
+
+
+class TestResync(unittest.TestCase):
+
+    def test_lost_line_truncates_frame(self):
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        frame = htc_frame(WMI_EID, wmi_payload(0x7006, b'\xaa' * 60))
+        lines = hexdata_lines(frame)
+        del lines[2]
+        for line in lines:
+            self.assertFalse(analyzer.parse_hexdata(line))
+        stats = analyzer.get_stats()
+        self.assertEqual(stats.dropped_lines, 2)
+        self.assertEqual(stats.truncated_frames, 1)
+
+        # The analyzer resynchronizes on the next frame
+        payload = wmi_payload(0x1d001, b'\x01' * 4)
+        self.assertEqual(_parse_frame(analyzer, htc_frame(WMI_EID, payload)),
+                         [payload])
+        self.assertEqual((stats.lines, stats.messages), (5, 1))
+
+    def test_new_frame_truncates_frame(self):
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        frame = htc_frame(WMI_EID, wmi_payload(0x7006, b'\xaa' * 60))
+        payload = wmi_payload(0x1d001, b'\x01' * 4)
+        self.assertFalse(analyzer.parse_hexdata(hexdata_lines(frame)[0]))
+        self.assertEqual(_parse_frame(analyzer, htc_frame(WMI_EID, payload)),
+                         [payload])
+        self.assertEqual(analyzer.get_stats().truncated_frames, 1)
+
+    def test_bad_header_is_counted(self):
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        self.assertFalse(analyzer.parse_hexdata('00000000: 02 00 00 00'))
+        self.assertEqual(analyzer.get_stats().bad_headers, 1)
+
+
+class TestStaleFrames(unittest.TestCase):
+
+    def __parse_lines(self, analyzer, lines):
+
+        return [bytes(analyzer.get_data()) for line in lines
+                if analyzer.parse_hexdata(line)]
+
+    def test_interleaved_frames_are_skipped(self):
+
+        # The rest of the WMI frame comes after three frames from another
+        # endpoint. A frame is given up if none of the last max_stale_lines
+        # lines belonged to it.
+        payload = wmi_payload(0x7006, b'\xaa' * 40)
+        wmi_lines = hexdata_lines(htc_frame(WMI_EID, payload))
+        htt_lines = hexdata_lines(htc_frame(HTT_EID, b'\x03\x00' * 3))
+        lines = wmi_lines[0:2] + htt_lines * 3 + wmi_lines[2:]
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID, max_stale_lines=4)
+        self.assertEqual(self.__parse_lines(analyzer, lines), [payload])
+        stats = analyzer.get_stats()
+        self.assertEqual((stats.truncated_frames, stats.dropped_lines), (0, 0))
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID, max_stale_lines=3)
+        self.assertEqual(self.__parse_lines(analyzer, lines), [])
+        stats = analyzer.get_stats()
+        self.assertEqual((stats.truncated_frames, stats.dropped_lines), (1, 2))
+
+
+class TestStructHeaders(unittest.TestCase):
+
+    def test_short_htc_header(self):
+
+        payload = wmi_payload(0x5001, b'\x00' * 8, if_idx=3)
+        frame = htc_frame(WMI_EID, payload, short_htc_hdr=True)
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID, short_htc_hdr=True)
+        self.assertEqual(_parse_frame(analyzer, frame), [payload])
+        msg = analyzer.get_message()
+        self.assertEqual(msg.htc_hdr, (WMI_EID, 0, len(payload), 0, 0))
+        self.assertEqual(bytes(msg.htc_hdr_data), frame[0:6])
+        self.assertEqual((msg.msg_id, msg.if_idx), (0x5001, 3))
+
+    def test_old_wmi_header(self):
+
+        # 6 byte header: 16 bit id and the interface index in byte 3
+        payload = struct.pack('<HBBH', 0x9002, 0, 1, 0) + b'\x00' * 8
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID, wmi_unified=False)
+        self.assertEqual(_parse_frame(analyzer, htc_frame(WMI_EID, payload)),
+                         [payload])
+        msg = analyzer.get_message()
+        self.assertEqual((msg.msg_id, msg.if_idx), (0x9002, 1))
+
+    def test_other_endpoints_are_not_bad_headers(self):
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        frame = htc_frame(WMI_EID + 1, wmi_payload(0x1d001, b'\x01' * 4))
+        self.assertEqual(_parse_frame(analyzer, frame), [])
+        self.assertEqual(analyzer.get_stats().bad_headers, 0)
+
+
+class TestDecodeHexdata(unittest.TestCase):
+
+    def test_whole_line_is_decoded(self):
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        hexline = analyzer.decode_hexdata('00000010: 02 00 ff 7f')
+        self.assertEqual(hexline, HexLine(ts=None, addr=0x10,
+                                          data=bytearray(b'\x02\x00\xff\x7f')))
+
+    def test_timestamp_is_split_from_hexdata(self):
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID, timestamps=True)
+        hexline = analyzer.decode_hexdata('[  100.000001] 00000000: 02 00')
+        self.assertEqual(float(hexline.ts), 100.000001)
+        self.assertEqual(hexline.addr, 0)
+        self.assertEqual(hexline.data, bytearray(b'\x02\x00'))
+
+    def test_line_is_shared_with_sub_analyzer(self):
+
+        frame = htc_frame(WMI_EID, wmi_payload(0x1d001, b'\x01' * 20))
+        analyzer = AllAnalyzer(wmi_ctrl_eid=WMI_EID, htt_eid=HTT_EID)
+        self.assertEqual([analyzer.parse_hexdata(line)
+                          for line in hexdata_lines(frame)], [False, True])
+        self.assertEqual(analyzer.get_id_str(),
+                         'WMI msg id:  1d001,  WMI_ECHO_CMDID\n')
+
+
+class TestFilterPushdown(unittest.TestCase):
+
+    def test_rejected_frame_is_not_reassembled(self):
+
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID, msg_id_exclude_filter=[0x7006])
+        frame = htc_frame(WMI_EID, wmi_payload(0x7006, b'\xaa' * 60))
+        lines = hexdata_lines(frame)
+        self.assertFalse(analyzer.parse_hexdata(lines[0]))
+        self.assertEqual(analyzer.state, STATE_DUMP)
+        for line in lines[1:]:
+            self.assertFalse(analyzer.parse_hexdata(line))
+
+        payload = wmi_payload(0x1d001, b'\x01' * 4)
+        self.assertEqual(_parse_frame(analyzer, htc_frame(WMI_EID, payload)),
+                         [payload])
+        self.assertEqual(analyzer.get_stats().dropped_lines, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
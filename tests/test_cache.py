@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests.helpers import SAMPLE_LOG, run_tool
+
+
+class TestDecodeCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hit_equals_miss(self):
+
+        for args in [['all', '-p', '-t'],
+                     ['wmi-ctrl', '-p', '--tlv', '-d', 'htc tx'],
+                     ['htt', '-d', 'htc rx', '-a', 't2h', '-p']]:
+            args = args + ['-i', SAMPLE_LOG]
+            expected = run_tool(*args)
+            miss = run_tool(*(args + ['--cache', self.tmp_dir]))
+            entries = sorted(os.listdir(self.tmp_dir))
+            self.assertTrue(entries)
+            hit = run_tool(*(args + ['--cache', self.tmp_dir]))
+            self.assertEqual(sorted(os.listdir(self.tmp_dir)), entries)
+            self.assertEqual(miss, expected)
+            self.assertEqual(hit, expected)
+
+    def test_scanners_have_separate_entries(self):
+
+        args = ['all', '-p', '--cache', self.tmp_dir, '-i', SAMPLE_LOG]
+        expected = run_tool(*args)
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 1)
+        self.assertEqual(run_tool(*(args + ['--native-scanner'])), expected)
+        self.assertEqual(len(os.listdir(self.tmp_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
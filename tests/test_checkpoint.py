@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests.helpers import SAMPLE_LOG, run_tool_stderr
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_resume_equals_full_run(self):
+
+        with open(SAMPLE_LOG, 'rb') as fp:
+            log = fp.read()
+        path = os.path.join(self.tmp_dir, 'growing.log')
+        checkpoint = os.path.join(self.tmp_dir, 'growing.ckpt')
+
+        for args in [['all', '-p', '-t', '--stats'],
+                     ['wmi-ctrl', '-p', '-d', 'htc tx', '--stats']]:
+            (expected, expected_stats) = run_tool_stderr(
+                *(args + ['-i', SAMPLE_LOG]))
+            self.assertTrue(expected_stats)
+
+            # The log grows in steps ending in the middle of lines and
+            # frames
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+            open(path, 'wb').close()
+            out = ''
+            for end in [1, len(log) // 7, len(log) // 7 + 3, len(log) // 3,
+                        len(log) // 2 + 11, len(log)]:
+                with open(path, 'ab') as fp:
+                    fp.write(log[os.path.getsize(path):end])
+                (run_out, stats) = run_tool_stderr(
+                    *(args + ['-i', path, '--checkpoint', checkpoint]))
+                out += run_out
+            self.assertEqual(out, expected)
+            self.assertEqual(stats, expected_stats)
+
+            # Nothing new
+            self.assertEqual(run_tool_stderr(
+                *(args + ['-i', path, '--checkpoint', checkpoint])),
+                ('', expected_stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
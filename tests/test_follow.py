@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from qca_hex_analyzer import LogFollower
+
+from tests.helpers import ROOT_DIR, SAMPLE_LOG, run_tool
+
+
+class TestLogFollower(unittest.TestCase):
+
+    def test_incomplete_line_is_kept_until_complete(self):
+
+        (read_fd, write_fd) = os.pipe()
+        chunks = []
+        # The rest of the log is written each time the follower waits for
+        # more data. The last write closes the pipe.
+        writes = [b'c\nd', b'\n', None]
+
+        def on_idle():
+
+            data = writes.pop(0)
+            if data is None:
+                os.close(write_fd)
+            else:
+                os.write(write_fd, data)
+
+        os.write(write_fd, b'a\nb')
+        try:
+            follower = LogFollower(fd=read_fd, on_idle=on_idle)
+            for chunk in follower.iter_chunks():
+                chunks.append(chunk)
+                if len(chunks) > 3:
+                    break
+        finally:
+            os.close(read_fd)
+        self.assertEqual(chunks, [b'a\n', b'bc\n', b'd\n'])
+
+    def test_follow_mode_output_equals_file_output(self):
+
+        expected = run_tool('all', '-p', '-t', '-i', SAMPLE_LOG)
+        with open(SAMPLE_LOG, 'rb') as fp:
+            log = fp.read()
+
+        # The log is written to stdin in pieces that split lines, the
+        # output is complete once stdin is closed
+        out = tempfile.TemporaryFile()
+        err = tempfile.TemporaryFile()
+        try:
+            proc = subprocess.Popen([sys.executable, '-m', 'qca_hex_analyzer',
+                                     'all', '-p', '-t', '-f'],
+                                    cwd=ROOT_DIR, stdin=subprocess.PIPE,
+                                    stdout=out, stderr=err)
+            for i in range(0, len(log), 1000):
+                proc.stdin.write(log[i:i + 1000])
+                proc.stdin.flush()
+            proc.stdin.close()
+            proc.wait()
+            out.seek(0)
+            err.seek(0)
+            self.assertEqual(err.read(), b'')
+            self.assertEqual(out.read().decode('utf-8'), expected)
+        finally:
+            out.close()
+            err.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
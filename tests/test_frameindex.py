@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from qca_hex_analyzer import open_frame_index
+
+from tests.helpers import SAMPLE_LOG, WMI_EID, run_tool, split_messages, \
+                          htc_frame, wmi_payload, hexdump_lines, write_log
+
+
+class TestFrameIndex(unittest.TestCase):
+
+    def setUp(self):
+
+        # The frame index is written next to the input file
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp_dir, 'sample.log')
+        shutil.copy(SAMPLE_LOG, self.log)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_frame_equals_nth_message(self):
+
+        for args in [['all', '-p', '-t'],
+                     ['wmi-ctrl', '-p', '-t', '-d', 'htc tx'],
+                     ['wmi-ctrl', '-t', '-v', 'htc rx', '--id', '0x5008'],
+                     ['htt', '-p', '-t', '-d', 'htc rx', '-a', 't2h']]:
+            args = args + ['-i', self.log]
+            messages = split_messages(run_tool(*args))
+            self.assertTrue(messages)
+            for n in [0, 1, len(messages) // 2, len(messages) - 1]:
+                self.assertEqual(run_tool(*(args + ['--frame', str(n),
+                                                    '--max-messages', '1'])),
+                                 messages[n])
+            self.assertTrue(os.path.exists(self.log + '.frames'))
+            self.assertEqual(run_tool(*(args + ['--frame', '2'])),
+                             ''.join(messages[2:]))
+
+    def test_truncated_frames_are_indexed(self):
+
+        # The second frame loses a line, so frame 2 is the frame of
+        # message 1
+        lines = []
+        for (i, msg_id) in enumerate([0x5008, 0x7006, 0x1d001]):
+            frame = htc_frame(WMI_EID, wmi_payload(msg_id, b'\xaa' * 40))
+            lines += hexdump_lines(frame, ts=100 + i)
+        del lines[5]
+        write_log(self.log, lines)
+
+        args = ['wmi-ctrl', '-t', '-d', 'htc tx', '-i', self.log]
+        messages = split_messages(run_tool(*args))
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(run_tool(*(args + ['--frame', '1'])), messages[1])
+        self.assertEqual(run_tool(*(args + ['--frame', '2'])), messages[1])
+        index = open_frame_index(self.log, mode='wmi-ctrl',
+                                 analyzer_options={'wmi_ctrl_eid': WMI_EID},
+                                 scanner_options={'desc_str': ['htc tx']})
+        try:
+            self.assertEqual([index.get_entry(n).msg_id for n in range(3)],
+                             [0x5008, 0x7006, 0x1d001])
+            self.assertEqual(index.get_entry(1).ts, 101.0)
+        finally:
+            index.close()
+
+    def test_index_depends_on_scanner(self):
+
+        entries = []
+        for native_scanner in [False, True]:
+            index = open_frame_index(self.log, native_scanner=native_scanner)
+            try:
+                self.assertTrue(index.is_valid(self.log,
+                                               native_scanner=native_scanner))
+                self.assertFalse(index.is_valid(
+                    self.log, native_scanner=(not native_scanner)))
+                entries.append([index.get_entry(n)
+                                for n in range(len(index))])
+            finally:
+                index.close()
+        self.assertTrue(entries[0])
+        self.assertEqual(entries[0], entries[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from qca_hex_analyzer import WmiCtrlAnalyzer, hexdump_lines
+
+from tests.helpers import WMI_EID, htc_frame, wmi_payload, hexdata_lines
+
+
+class TestHexdumpLines(unittest.TestCase):
+
+    def test_format(self):
+
+        data = bytearray(range(20))
+        self.assertEqual(list(hexdump_lines(data)),
+                         ['00000000:  00 01 02 03 04 05 06 07 08 09 0a 0b '
+                          '0c 0d 0e 0f \n',
+                          '00000010:  10 11 12 13 \n'])
+
+    def test_address_and_empty_data(self):
+
+        self.assertEqual(list(hexdump_lines(b'\xff', addr=0x20)),
+                         ['00000020:  ff \n'])
+        self.assertEqual(list(hexdump_lines(b'')), [])
+
+    def test_print_data(self):
+
+        frame = htc_frame(WMI_EID, wmi_payload(0x1d001, bytearray(range(16))))
+        analyzer = WmiCtrlAnalyzer(eid=WMI_EID)
+        for line in hexdata_lines(frame):
+            analyzer.parse_hexdata(line)
+        fp = StringIO()
+        analyzer.print_data(fp)
+        self.assertEqual(fp.getvalue(),
+                         'HTC header:\n'
+                         '00000000:  02 00 14 00 00 00 00 00 \n'
+                         'msg data:\n'
+                         '00000000:  01 d0 01 00 00 01 02 03 04 05 06 07 '
+                         '08 09 0a 0b \n'
+                         '00000010:  0c 0d 0e 0f \n'
+                         '\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
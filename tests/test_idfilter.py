@@ -0,0 +1,110 @@
+import argparse
+import unittest
+
+from qca_hex_analyzer import MsgIdFilter, compile_msg_id_filter, \
+                             msg_id_spec, compile_wmi_group_filter, \
+                             wmi_group_spec
+
+from tests.helpers import SAMPLE_LOG, run_tool, run_tool_stderr, \
+                          split_messages
+
+
+class TestMsgIdFilter(unittest.TestCase):
+
+    def test_ids_ranges_and_names(self):
+
+        f = compile_msg_id_filter(['0x5001-0x5003', 'wmi_init_cmdid',
+                                   '0x7006', 0x9002], 'wmi-ctrl', False)
+        for msg_id in [0x1, 0x5001, 0x5002, 0x5003, 0x7006, 0x9002]:
+            self.assertIn(msg_id, f)
+        for msg_id in [0x0, 0x2, 0x5000, 0x5004, 0x7005, 0x9003]:
+            self.assertNotIn(msg_id, f)
+        self.assertIsNotNone(f.ids)
+
+    def test_large_ranges_are_searched(self):
+
+        f = MsgIdFilter([(0x10, 0x20), (0x1000, 0x200000), (0x15, 0x30)])
+        self.assertIsNone(f.ids)
+        self.assertEqual(f.ranges, [(0x10, 0x30), (0x1000, 0x200000)])
+        for (msg_id, expected) in [(0xf, False), (0x10, True), (0x30, True),
+                                   (0x31, False), (0xfff, False),
+                                   (0x1000, True), (0x200000, True),
+                                   (0x200001, False)]:
+            self.assertEqual(msg_id in f, expected)
+
+    def test_names_depend_on_direction(self):
+
+        # 0x5001 is WMI_VDEV_CREATE_CMDID and WMI_VDEV_START_RESP_EVENTID
+        f = compile_msg_id_filter(['WMI_VDEV_START_RESP_EVENTID'],
+                                  'wmi-ctrl', True)
+        self.assertIn(0x5001, f)
+        self.assertRaises(ValueError, compile_msg_id_filter,
+                          ['WMI_VDEV_START_RESP_EVENTID'], 'wmi-ctrl', False)
+        self.assertRaises(ValueError, compile_msg_id_filter,
+                          ['HTT_H2T_MSG_TYPE_STATS_REQ'], 'wmi-ctrl', False)
+
+    def test_invalid_specs(self):
+
+        for spec in ['WMI_FOO_CMDID', '0x5008-0x5000', '1-', 'foo-0x10']:
+            self.assertRaises(argparse.ArgumentTypeError, msg_id_spec, spec)
+        self.assertEqual(msg_id_spec('0x5000-0x5fff'), '0x5000-0x5fff')
+
+    def test_cli_range_equals_ids(self):
+
+        args = ['wmi-ctrl', '-t', '-d', 'htc tx', '-i', SAMPLE_LOG]
+        by_range = run_tool(*(args + ['--id', '0x5000-0x5fff']))
+        by_ids = run_tool(*(args + ['--id', '0x5001',
+                                    'WMI_VDEV_SET_PARAM_CMDID']))
+        self.assertEqual(len(split_messages(by_range)), 12)
+        self.assertEqual(by_range, by_ids)
+
+        (out, err) = run_tool_stderr(*(args + ['--id', 'WMI_FOO_CMDID']))
+        self.assertEqual(out, '')
+        self.assertIn('Unknown message id: WMI_FOO_CMDID', err)
+
+
+class TestWmiGroupFilter(unittest.TestCase):
+
+    def test_group_names(self):
+
+        self.assertEqual(wmi_group_spec('VDEV,peer, wmi_grp_sta_ps'),
+                         ['WMI_GRP_VDEV', 'WMI_GRP_PEER', 'WMI_GRP_STA_PS'])
+        self.assertRaises(argparse.ArgumentTypeError, wmi_group_spec,
+                          'VDEV,FOO')
+
+    def test_group_table(self):
+
+        self.assertIsNone(compile_wmi_group_filter())
+        table = compile_wmi_group_filter(groups=['VDEV', 'PEER'])
+        self.assertEqual(len(table), 4096)
+        self.assertEqual([i for i in range(len(table)) if table[i]],
+                         [0x5, 0x6])
+        table = compile_wmi_group_filter(exclude_groups=['VDEV'])
+        self.assertFalse(table[0x5])
+        self.assertTrue(table[0x6])
+
+    def test_cli_group_equals_id_range(self):
+
+        expected = run_tool('wmi-ctrl', '-t', '-d', 'htc tx', '-i', SAMPLE_LOG,
+                            '--id', '0x5000-0x6fff')
+        self.assertTrue(expected)
+        for mode in ['wmi-ctrl', 'all']:
+            args = [mode, '-t', '-d', 'htc tx', '-i', SAMPLE_LOG]
+            # The group filters only apply to WMI messages
+            out = run_tool(*(args + ['--group', 'VDEV,PEER']))
+            by_group = [line for line in out.splitlines(True)
+                        if ' WMI msg id: ' in line]
+            self.assertEqual(''.join(by_group), expected)
+            self.assertNotIn('VDEV', run_tool(*(args + ['--skip-group',
+                                                        'VDEV'])))
+
+    def test_cli_group_requires_wmi_unified(self):
+
+        (out, err) = run_tool_stderr('wmi-ctrl', '--wmi-old', '--group',
+                                     'VDEV', '-i', SAMPLE_LOG)
+        self.assertEqual(out, '')
+        self.assertIn('WMI group filters require WMI unified', err)
+
+
+if __name__ == '__main__':
+    unittest.main()
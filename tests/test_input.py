@@ -0,0 +1,95 @@
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from tests.helpers import SAMPLE_LOG, read_lines, write_log, run_tool, \
+                          run_tool_stderr
+
+
+class TestNativeScanner(unittest.TestCase):
+
+    def test_output_equals_hexfilter(self):
+
+        for args in [['all', '-p', '-t', '--stats'],
+                     ['wmi-ctrl', '-p', '-d', 'htc tx'],
+                     ['htt', '-n', '-d', 'htc rx', '-a', 't2h'],
+                     ['htc-ctrl', '-p', '-v', 'htc tx']]:
+            args = args + ['-i', SAMPLE_LOG]
+            expected = run_tool_stderr(*args)
+            self.assertTrue(expected[0])
+            self.assertEqual(run_tool_stderr(*(args + ['--native-scanner'])),
+                             expected)
+
+
+class TestCompressedInput(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def __compress(self, open_func, ext):
+
+        path = os.path.join(self.tmp_dir, 'sample.log' + ext)
+        with open(SAMPLE_LOG, 'rb') as src:
+            fp = open_func(path, 'wb')
+            try:
+                fp.write(src.read())
+            finally:
+                fp.close()
+        return path
+
+    def test_output_equals_uncompressed(self):
+
+        paths = [self.__compress(gzip.open, '.gz'),
+                 self.__compress(bz2.BZ2File, '.bz2')]
+        if lzma is not None:
+            paths.append(self.__compress(lzma.open, '.xz'))
+
+        expected = run_tool('all', '-p', '-t', '-i', SAMPLE_LOG)
+        for path in paths:
+            self.assertEqual(run_tool('all', '-p', '-t', '-i', path),
+                             expected)
+            self.assertEqual(run_tool('all', '-p', '-t', '--native-scanner',
+                                      '-i', path),
+                             expected)
+
+
+class TestMergeInputs(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_merged_output_equals_single_log(self):
+
+        # The host to target and target to host dumps are split into two
+        # logs. The messages of both logs are merged by timestamp.
+        lines = read_lines(SAMPLE_LOG)
+        tx_path = os.path.join(self.tmp_dir, 'tx.log')
+        rx_path = os.path.join(self.tmp_dir, 'rx.log')
+        write_log(tx_path, [line for line in lines if 'htc rx' not in line])
+        write_log(rx_path, [line for line in lines if 'htc rx' in line])
+
+        expected = run_tool('all', '-p', '-t', '-i', SAMPLE_LOG)
+        self.assertEqual(run_tool('all', '-p', '-t', '-i', rx_path, tx_path),
+                         expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import struct
+import unittest
+
+from qca_hex_analyzer import HtcHeader, Message, iter_messages
+
+from tests.helpers import WMI_EID, htc_frame, wmi_payload, tlv, hexdump_lines
+
+
+def _get_message(frame, **options):
+
+    return next(iter_messages(hexdump_lines(frame, ts=1.0), **options))
+
+
+class TestMessage(unittest.TestCase):
+
+    def test_message_has_slots_only(self):
+
+        msg = _get_message(htc_frame(WMI_EID, wmi_payload(0x9002, b'\0' * 16)))
+        self.assertIsInstance(msg, Message)
+        self.assertFalse(hasattr(msg, '__dict__'))
+        self.assertRaises(AttributeError, setattr, msg, 'foo', 1)
+
+    def test_message_is_frozen(self):
+
+        msg = _get_message(htc_frame(WMI_EID, wmi_payload(0x9002, b'\0' * 16)))
+        self.assertIsInstance(msg.buf, bytes)
+        for name in ['buf', 'eid', 'length', 'msg_id', 'enum', 'tlv_msg']:
+            self.assertRaises(AttributeError, setattr, msg, name, None)
+        self.assertEqual(msg.msg_id, 0x9002)
+
+    def test_fields_are_read_from_buffer(self):
+
+        payload = wmi_payload(0x5001, b'\x00' * 8, if_idx=3)
+        trailer = b'\x02\x02\x01\x00'
+        frame = htc_frame(WMI_EID, payload, trailer, flags=0x2)
+        msg = _get_message(frame, mode='wmi-ctrl', t2h=True)
+        self.assertEqual(msg.htc_hdr,
+                         HtcHeader(eid=WMI_EID, flags=0x2,
+                                   length=len(payload) + len(trailer),
+                                   ctrl0=len(trailer), ctrl1=0))
+        self.assertEqual((msg.proto, msg.msg_id, msg.if_idx, msg.enum.name),
+                         ('wmi-ctrl', 0x5001, 3, 'WMI_VDEV_START_RESP_EVENTID'))
+        self.assertEqual(bytes(msg.htc_hdr_data), frame[0:8])
+        self.assertEqual(bytes(msg.data), payload)
+        self.assertEqual(bytes(msg.trailer), trailer)
+
+    def test_id_str(self):
+
+        frame = htc_frame(WMI_EID, wmi_payload(0x1d001, b'\0' * 4))
+        msg = _get_message(frame, timestamps=True)
+        id_str = 'WMI msg id:  1d001,  WMI_ECHO_CMDID\n'
+        self.assertEqual(msg.get_id_str(), id_str)
+        self.assertEqual(msg.get_id_str(timestamps=True),
+                         '[{}]'.format(msg.ts).ljust(16) + id_str)
+
+
+class TestTlvDict(unittest.TestCase):
+
+    def test_short_tlv_message_has_no_tlv_dict(self):
+
+        frame = htc_frame(WMI_EID, wmi_payload(0x5008, tlv(95, b'\x01')))
+        msg = _get_message(frame, mode='wmi-ctrl', tlv_analysis=True)
+        self.assertIsNone(msg.tlv_msg.tlv_msg)
+        self.assertNotIn('tlv', msg.get_dict())
+
+    def test_tlv_dict(self):
+
+        data = tlv(95, struct.pack('<III', 1, 3, 100))
+        frame = htc_frame(WMI_EID, wmi_payload(0x5008, data))
+        msg = _get_message(frame, mode='wmi-ctrl', tlv_analysis=True)
+        tlv_dict = msg.get_dict()['tlv']['VdevSetParamMsg']
+        self.assertEqual(tlv_dict['vdev_id'], 1)
+        self.assertEqual(tlv_dict['param_id']['name'],
+                         'WMI_TLV_VDEV_PARAM_BEACON_INTERVAL')
+        self.assertEqual(tlv_dict['param_value'], 100)
+
+    def test_tlv_message_is_decoded_when_read(self):
+
+        data = tlv(95, struct.pack('<III', 1, 3, 100))
+        frame = htc_frame(WMI_EID, wmi_payload(0x5008, data))
+        msg = _get_message(frame, mode='wmi-ctrl', tlv_analysis=True)
+        self.assertIsNotNone(msg.tlv_decoder)
+        self.assertIsNone(msg._tlv_msg)
+        tlv_msg = msg.tlv_msg
+        self.assertEqual(tlv_msg.tlv_msg.vdev_id, 1)
+        self.assertIsNone(msg.tlv_decoder)
+        self.assertIs(msg.tlv_msg, tlv_msg)
+        self.assertRaises(AttributeError, setattr, msg, 'tlv_msg', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
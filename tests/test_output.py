@@ -0,0 +1,149 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from qca_hex_analyzer import OutputSink, load_columns
+
+from tests.helpers import SAMPLE_LOG, run_tool, split_messages
+
+
+class _CountingFile(io.StringIO):
+
+    def __init__(self):
+
+        io.StringIO.__init__(self)
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, s):
+
+        self.writes += 1
+        return io.StringIO.write(self, s)
+
+    def flush(self):
+
+        self.flushes += 1
+
+
+class TestOutputSink(unittest.TestCase):
+
+    def test_writes_are_buffered(self):
+
+        fp = _CountingFile()
+        sink = OutputSink(fp, buffer_size=10)
+        for s in [u'abc', u'def', u'ghij', u'k']:
+            sink.write(s)
+            sink.message_done()
+        self.assertEqual((fp.getvalue(), fp.writes), (u'abcdefghij', 1))
+        sink.idle()
+        self.assertEqual(fp.writes, 1)
+        sink.flush()
+        self.assertEqual((fp.getvalue(), fp.writes, fp.flushes),
+                         (u'abcdefghijk', 2, 1))
+
+    def test_batches_are_flushed(self):
+
+        fp = _CountingFile()
+        sink = OutputSink(fp, batch_size=2)
+        sink.write(u'a')
+        sink.message_done()
+        self.assertEqual(fp.getvalue(), u'')
+        sink.write(u'b')
+        sink.message_done()
+        self.assertEqual((fp.getvalue(), fp.flushes), (u'ab', 1))
+        sink.write(u'c')
+        sink.message_done()
+        sink.idle()
+        self.assertEqual((fp.getvalue(), fp.flushes), (u'abc', 2))
+
+
+class TestJsonLines(unittest.TestCase):
+
+    def test_one_object_per_message(self):
+
+        text = run_tool('wmi-ctrl', '-d', 'htc tx', '-i', SAMPLE_LOG)
+        out = run_tool('wmi-ctrl', '-d', 'htc tx', '--format', 'jsonl',
+                       '--tlv', '-i', SAMPLE_LOG)
+        objs = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual(len(objs), len(split_messages(text)))
+        self.assertEqual(objs[0]['enum'], 'WMI_INIT_CMDID')
+        self.assertEqual(objs[0]['direction'], 'h2t')
+        self.assertIsNone(objs[0]['ts'])
+
+        # The WMI_INIT command of the log is too short to be decoded
+        self.assertNotIn('tlv', objs[0])
+        self.assertEqual(objs[1]['tlv']['PdevSetParamMsg']['value'], 3)
+
+    def test_payload_encoding(self):
+
+        hex_out = run_tool('htt', '-t', '--format', 'jsonl', '-i', SAMPLE_LOG)
+        b64_out = run_tool('htt', '-t', '--format', 'jsonl',
+                           '--payload-encoding', 'base64', '-i', SAMPLE_LOG)
+        obj = json.loads(hex_out.splitlines()[0])
+        self.assertEqual(obj['ts'], 100.008)
+        self.assertEqual(obj['payload'], '00000000')
+        self.assertEqual(json.loads(b64_out.splitlines()[0])['payload'],
+                         'AAAAAA==')
+
+
+class TestExportColumns(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_columns_equal_jsonl(self):
+
+        path = os.path.join(self.tmp_dir, 'columns')
+        # Timestamps are exported without -t
+        self.assertEqual(run_tool('all', '--export-columns', path,
+                                  '-i', SAMPLE_LOG),
+                         '')
+        out = run_tool('all', '-t', '--format', 'jsonl', '-i', SAMPLE_LOG)
+        objs = [json.loads(line) for line in out.splitlines()]
+
+        (schema, columns, payload) = load_columns(path)
+        self.assertEqual(schema['count'], len(objs))
+        self.assertEqual(list(columns['ts']), [obj['ts'] for obj in objs])
+        self.assertEqual(list(columns['msg_id']),
+                         [obj['msg_id'] for obj in objs])
+        self.assertEqual(list(columns['eid']), [obj['eid'] for obj in objs])
+
+    @unittest.skipUnless(numpy, 'requires numpy')
+    def test_npz_equals_columns(self):
+
+        path = os.path.join(self.tmp_dir, 'columns')
+        npz_path = os.path.join(self.tmp_dir, 'columns.npz')
+        for export_path in [path, npz_path]:
+            self.assertEqual(run_tool('all', '--export-columns', export_path,
+                                      '-i', SAMPLE_LOG),
+                             '')
+
+        (schema, columns, payload) = load_columns(path)
+        with numpy.load(npz_path) as npz:
+            for column in schema['columns']:
+                name = column['name']
+                self.assertEqual(npz[name].dtype, numpy.dtype(column['dtype']))
+                # NaN timestamps (messages without timestamps) compare equal
+                self.assertTrue(numpy.array_equal(
+                    numpy.nan_to_num(npz[name]),
+                    numpy.nan_to_num(columns[name])), name)
+            self.assertEqual(npz['payload'].tobytes(), payload)
+            self.assertEqual(list(npz['protos']), schema['protos'])
+            self.assertEqual(list(npz['enums']), schema['enums'])
+
+
+if __name__ == '__main__':
+    unittest.main()
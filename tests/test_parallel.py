@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests.helpers import SAMPLE_LOG, run_tool_stderr, read_lines, write_log
+
+
+class TestParallelAnalysis(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_output_equals_single_process(self):
+
+        for args in [['all', '-p', '-t', '--stats'],
+                     ['wmi-ctrl', '-p', '-d', 'htc tx', '--stats'],
+                     ['htt', '-p', '-d', 'htc rx', '-a', 't2h'],
+                     ['all', '--format', 'jsonl']]:
+            args = args + ['-i', SAMPLE_LOG]
+            expected = run_tool_stderr(*args)
+            self.assertTrue(expected[0])
+            for jobs in ['2', '3', '7']:
+                self.assertEqual(run_tool_stderr(*(args + ['-j', jobs])),
+                                 expected)
+            self.assertEqual(run_tool_stderr(*(args + ['-j', '3',
+                                                       '--native-scanner'])),
+                             expected)
+
+    def test_stats_of_lossy_log_equal_single_process(self):
+
+        # Lines are lost and frames are interleaved all over the log, so
+        # most chunks begin with a message in flight
+        lines = read_lines(SAMPLE_LOG) * 10
+        for i in range(len(lines) - 1, 0, -1):
+            if i % 11 == 0:
+                del lines[i]
+            elif i % 7 == 0:
+                (lines[i - 1], lines[i]) = (lines[i], lines[i - 1])
+        path = os.path.join(self.tmp_dir, 'lossy.log')
+        write_log(path, lines)
+
+        for args in [['all', '--stats'],
+                     ['wmi-ctrl', '-d', 'htc tx', '--stats'],
+                     ['htt', '-d', 'htc rx', '-a', 't2h', '--stats']]:
+            args = args + ['-i', path]
+            expected = run_tool_stderr(*args)
+            self.assertNotIn('dropped lines: 0\n', expected[1])
+            for jobs in ['3', '13']:
+                self.assertEqual(run_tool_stderr(*(args + ['-j', jobs])),
+                                 expected)
+
+    def test_ignored_jobs_are_reported(self):
+
+        args = ['all', '-i', SAMPLE_LOG]
+        (out, err) = run_tool_stderr(*(args + ['-j', '2', '--where',
+                                               'eid == 1']))
+        self.assertEqual(err,
+                         'Ignoring --jobs: not supported with --where\n')
+        self.assertEqual(out, run_tool_stderr(*(args + ['--where',
+                                                        'eid == 1']))[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
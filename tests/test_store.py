@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests.helpers import SAMPLE_LOG, run_tool
+
+
+class TestMessageStore(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp_dir, 'sample.db')
+        self.assertEqual(run_tool('index', '--db', self.db,
+                                  '-i', SAMPLE_LOG),
+                         '')
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_query_equals_analysis(self):
+
+        for (query_args, args) in [
+                (['--proto', 'wmi-ctrl', '-p'], ['wmi-ctrl', '-p']),
+                (['--proto', 'htt', '--id', '0x3'], ['htt', '--id', '0x3']),
+                (['--proto', 'htc-ctrl'], ['htc-ctrl']),
+                ([], ['all'])]:
+            expected = run_tool(*(args + ['-t', '-i', SAMPLE_LOG]))
+            self.assertTrue(expected)
+            self.assertEqual(run_tool('query', '--db', self.db, '-t',
+                                      *query_args),
+                             expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from qca_hex_analyzer import iter_messages
+
+from tests.helpers import SAMPLE_LOG, WMI_EID, htc_frame, wmi_payload, \
+                          hexdump_lines
+
+
+class TestIterMessages(unittest.TestCase):
+
+    def test_messages_of_log(self):
+
+        with open(SAMPLE_LOG) as fp:
+            messages = list(iter_messages(fp, mode='wmi-ctrl',
+                                          desc_str=['htc tx'],
+                                          timestamps=True))
+        self.assertEqual(len(messages), 25)
+        msg = messages[1]
+        self.assertEqual((msg.proto, msg.msg_id, msg.enum.name, msg.eid,
+                          msg.t2h, float(msg.ts)),
+                         ('wmi-ctrl', 0x4003, 'WMI_PDEV_SET_PARAM_CMDID',
+                          WMI_EID, False, 100.007))
+        self.assertEqual(messages[-1].msg_id, 0x1d001)
+        for msg in messages:
+            self.assertIsInstance(msg.buf, bytes)
+            self.assertTrue(msg.data.readonly)
+
+    def test_data_stays_valid(self):
+
+        payloads = [wmi_payload(0x1d001, bytearray([i]) * 20)
+                    for i in range(3)]
+        lines = []
+        for payload in payloads:
+            lines.extend(hexdump_lines(htc_frame(WMI_EID, payload), ts=1.0))
+        messages = list(iter_messages(lines, mode='all'))
+        self.assertEqual([bytes(msg.data) for msg in messages], payloads)
+
+    def test_lines_are_consumed_lazily(self):
+
+        # Two lines per message
+        frame = htc_frame(WMI_EID, wmi_payload(0x1d001, b'\x01' * 20))
+        lines = hexdump_lines(frame, ts=1.0) * 3
+        consumed = []
+
+        def gen():
+
+            for line in lines:
+                consumed.append(line)
+                yield line
+
+        messages = iter_messages(gen(), mode='wmi-ctrl')
+        next(messages)
+        self.assertEqual(len(consumed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from tests.helpers import SAMPLE_LOG, run_tool, split_messages
+
+
+def _get_ts(message):
+
+    return float(message[1:message.index(']')])
+
+
+class TestTimeRange(unittest.TestCase):
+
+    def test_boundaries_are_inclusive(self):
+
+        args = ['all', '-p', '-t', '-i', SAMPLE_LOG]
+        messages = split_messages(run_tool(*args))
+        ts = [_get_ts(message) for message in messages]
+        since = ts[5]
+        until = ts[-5]
+
+        for (range_args, lo, hi) in [
+                (['--since', str(since)], since, None),
+                (['--until', str(until)], None, until),
+                (['--since', str(since), '--until', str(until)], since, until),
+                # Between the timestamps of the first and the second line of
+                # a message
+                (['--since', str(since + 0.0000005)], since + 0.0000005,
+                 None),
+                (['--since', str(since), '--until', str(since)], since,
+                 since)]:
+            expected = ''.join(
+                message for (message, t) in zip(messages, ts)
+                if (lo is None or t >= lo) and (hi is None or t <= hi))
+            self.assertTrue(expected)
+            self.assertEqual(run_tool(*(args + range_args)), expected)
+            self.assertEqual(run_tool(*(args + range_args +
+                                        ['--native-scanner'])),
+                             expected)
+
+    def test_empty_range(self):
+
+        self.assertEqual(run_tool('all', '-t', '--since', '200',
+                                  '-i', SAMPLE_LOG),
+                         '')
+        self.assertEqual(run_tool('all', '-t', '--until', '99',
+                                  '-i', SAMPLE_LOG),
+                         '')
+
+
+if __name__ == '__main__':
+    unittest.main()
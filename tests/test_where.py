@@ -0,0 +1,107 @@
+import unittest
+
+from qca_hex_analyzer import compile_where, iter_messages
+
+from tests.helpers import SAMPLE_LOG, run_tool, run_tool_stderr
+
+
+def _load_messages():
+
+    with open(SAMPLE_LOG) as fp:
+        return list(iter_messages(fp, mode='wmi-ctrl', desc_str=['htc tx'],
+                                  timestamps=True))
+
+
+class TestWhere(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.messages = _load_messages()
+
+    def __select(self, expression):
+
+        where = compile_where(expression)
+        return [i for (i, msg) in enumerate(self.messages) if where(msg)]
+
+    def __select_ids(self, test):
+
+        return [i for (i, msg) in enumerate(self.messages) if test(msg)]
+
+    def test_and_binds_tighter_than_or(self):
+
+        self.assertEqual(
+            self.__select('msg_id == 0x1 or if_idx == 2 and '
+                          'msg_id == 0x5008'),
+            self.__select_ids(lambda msg: msg.msg_id == 0x1 or
+                              (msg.if_idx == 2 and msg.msg_id == 0x5008)))
+        self.assertEqual(
+            self.__select('(msg_id == 0x1 or if_idx == 2) and '
+                          'msg_id == 0x5008'),
+            self.__select_ids(lambda msg: msg.if_idx == 2 and
+                              msg.msg_id == 0x5008))
+
+    def test_not_binds_tighter_than_and(self):
+
+        self.assertEqual(
+            self.__select('not if_idx == 0 and msg_id != 0x5008'),
+            self.__select_ids(lambda msg: msg.if_idx != 0 and
+                              msg.msg_id != 0x5008))
+        self.assertEqual(
+            self.__select('not (if_idx == 0 and msg_id != 0x5008)'),
+            self.__select_ids(lambda msg: msg.if_idx != 0 or
+                              msg.msg_id == 0x5008))
+
+    def test_symbols_and_tlv_fields(self):
+
+        expected = self.__select_ids(
+            lambda msg: msg.msg_id == 0x5008 and msg.if_idx == 1 and
+            msg.data[12:16].tobytes() == b'\x03\x00\x00\x00')
+        self.assertEqual(len(expected), 4)
+        self.assertEqual(self.__select('WMI_VDEV_SET_PARAM_CMDID and '
+                                       'vdev_id == 1 and '
+                                       'param_id == BEACON_INTERVAL'),
+                         expected)
+        self.assertEqual(self.__select('group == vdev and proto == '
+                                       '\'wmi-ctrl\' and vdev_id == 1 and '
+                                       'param_id == 3'),
+                         expected)
+
+    def test_invalid_expressions(self):
+
+        for (expression, error) in [
+                ('msgid == 0x5008', 'Unknown field or symbol: msgid'),
+                ('vdevid == 1', 'Unknown field or symbol: vdevid'),
+                ('enum == WMI_FOO_BAR',
+                 'Unknown field or symbol: WMI_FOO_BAR'),
+                ('param_id == FOO', 'Unknown field or symbol: FOO'),
+                ('TX_COMPL_IND',
+                 'Ambiguous symbol: TX_COMPL_IND (matches '
+                 'HTT_T2H_MSG_TYPE_MGMT_TX_COMPL_IND, '
+                 'HTT_T2H_MSG_TYPE_TX_COMPL_IND)'),
+                ('msg_id ==', None),
+                ('(msg_id == 1', None),
+                ('msg_id == 1 and', None),
+                ('msg_id = 1', None)]:
+            with self.assertRaises(ValueError) as cm:
+                compile_where(expression)
+            if error is not None:
+                self.assertEqual(str(cm.exception), error)
+
+    def test_cli(self):
+
+        args = ['wmi-ctrl', '-t', '-d', 'htc tx', '-i', SAMPLE_LOG]
+        self.assertEqual(run_tool(*(args + ['--where',
+                                            'group == VDEV and if_idx == 2'])),
+                         ''.join(self.messages[i].get_id_str(True)
+                                 for i in self.__select_ids(
+                                     lambda msg: msg.msg_id >> 12 == 5 and
+                                     msg.if_idx == 2)))
+
+        (out, err) = run_tool_stderr(*(args + ['--where', 'msgid == 1']))
+        self.assertEqual(out, '')
+        self.assertIn('Unknown field or symbol: msgid', err)
+
+
+if __name__ == '__main__':
+    unittest.main()